@@ -0,0 +1,71 @@
+"""
+Compare load time and file size of the mesh h5 cache formats
+(gzip, raw, blosc and draco) on a synthetic or user supplied mesh.
+
+    python benchmarks/mesh_cache_formats.py [--mesh path.h5] [--subdivisions 7]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import trimesh
+
+from meshparty import trimesh_io
+
+FORMATS = {
+    "gzip": dict(version=trimesh_io.MESH_H5_GZIP_VERSION, draco=False),
+    "raw": dict(version=trimesh_io.MESH_H5_RAW_VERSION, draco=False),
+    "raw_mmap": dict(version=trimesh_io.MESH_H5_RAW_VERSION, draco=False),
+    "blosc": dict(version=trimesh_io.MESH_H5_BLOSC_VERSION, draco=False),
+    "draco": dict(version=trimesh_io.MESH_H5_GZIP_VERSION, draco=True),
+}
+
+
+def _load_mesh(args):
+    if args.mesh is not None:
+        vertices, faces = trimesh_io.read_mesh(args.mesh)[:2]
+    else:
+        sphere = trimesh.creation.icosphere(subdivisions=args.subdivisions,
+                                            radius=10000)
+        vertices, faces = sphere.vertices, sphere.faces
+    return np.asarray(vertices, dtype=np.float32), np.asarray(faces, dtype=np.uint32)
+
+
+def _time_load(filename, repeats, mmap):
+    times = []
+    for _ in range(repeats):
+        t0 = time.time()
+        vertices, faces = trimesh_io.read_mesh_h5(filename, mmap=mmap)[:2]
+        # touch the data so memory-mapped reads are paid for
+        float(vertices[:, 0].sum()), int(faces[:, 0].sum())
+        times.append(time.time() - t0)
+    return np.min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mesh", default=None,
+                        help="mesh file to benchmark (default synthetic icosphere)")
+    parser.add_argument("--subdivisions", type=int, default=7)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    vertices, faces = _load_mesh(args)
+    print(f"{len(vertices)} vertices, {len(faces)} faces")
+    print(f"{'format':<10}{'size (MB)':>12}{'load (s)':>12}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, kwargs in FORMATS.items():
+            filename = os.path.join(tmpdir, f"{name}.h5")
+            trimesh_io.write_mesh_h5(filename, vertices, faces, overwrite=True,
+                                     **kwargs)
+            size = os.path.getsize(filename) / 1e6
+            load_time = _time_load(filename, args.repeats,
+                                   mmap=name == "raw_mmap")
+            print(f"{name:<10}{size:>12.2f}{load_time:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
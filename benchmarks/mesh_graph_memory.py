@@ -0,0 +1,70 @@
+"""
+Compare memory use and build time of the mesh csgraph built from all
+(directed, duplicated) face edges against the one built from the unique
+undirected edges, as Mesh.csgraph does now.
+
+    python benchmarks/mesh_graph_memory.py [--mesh path.h5] [--subdivisions 8]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import trimesh
+
+from meshparty import trimesh_io, utils
+
+
+def _load_mesh(args):
+    if args.mesh is not None:
+        vertices, faces = trimesh_io.read_mesh(args.mesh)[:2]
+    else:
+        sphere = trimesh.creation.icosphere(subdivisions=args.subdivisions,
+                                            radius=10000)
+        vertices, faces = sphere.vertices, sphere.faces
+    return trimesh_io.Mesh(vertices, faces, process=False)
+
+
+def _csgraph_bytes(csgraph):
+    return csgraph.data.nbytes + csgraph.indices.nbytes + \
+        csgraph.indptr.nbytes
+
+
+def _measure(build):
+    tracemalloc.start()
+    t0 = time.time()
+    csgraph = build()
+    elapsed = time.time() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return csgraph, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mesh", default=None,
+                        help="mesh file to benchmark (default synthetic icosphere)")
+    parser.add_argument("--subdivisions", type=int, default=8)
+    args = parser.parse_args()
+
+    mesh = _load_mesh(args)
+    # edge lists are cached on the mesh and not part of the measurement
+    mesh.graph_edges, mesh.unique_graph_edges
+    print(f"{mesh.n_vertices} vertices, {len(mesh.graph_edges)} directed edges, "
+          f"{len(mesh.unique_graph_edges)} unique edges")
+
+    builds = {
+        "directed": lambda: utils.create_csgraph(
+            mesh.vertices, mesh.graph_edges, directed=True),
+        "unique": lambda: utils.create_csgraph(
+            mesh.vertices, mesh.unique_graph_edges, directed=False),
+    }
+    print(f"{'graph':<10}{'nnz':>12}{'csr (MB)':>12}{'peak (MB)':>12}{'time (s)':>10}")
+    for name, build in builds.items():
+        csgraph, elapsed, peak = _measure(build)
+        print(f"{name:<10}{csgraph.nnz:>12}{_csgraph_bytes(csgraph) / 1e6:>12.1f}"
+              f"{peak / 1e6:>12.1f}{elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
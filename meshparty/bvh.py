@@ -0,0 +1,213 @@
+__doc__ = """
+Bounding volume hierarchy ray casting, used where pyembree is not available
+"""
+
+import numpy as np
+import numba
+
+# traversal stack depth, median splits keep the tree depth near log2(n_faces)
+_STACK_SIZE = 64
+
+
+@numba.njit(cache=True)
+def _build_bvh(tri_min, tri_max, centers, leaf_size):
+    n_faces = len(centers)
+    n_max_nodes = max(2 * n_faces, 1)
+    node_min = np.zeros((n_max_nodes, 3))
+    node_max = np.zeros((n_max_nodes, 3))
+    node_left = np.full(n_max_nodes, -1, dtype=np.int64)
+    node_start = np.zeros(n_max_nodes, dtype=np.int64)
+    node_stop = np.zeros(n_max_nodes, dtype=np.int64)
+    face_order = np.arange(n_faces)
+
+    stack = np.zeros((n_max_nodes, 3), dtype=np.int64)
+    stack[0, 0], stack[0, 1], stack[0, 2] = 0, 0, n_faces
+    n_stack = 1
+    n_nodes = 1
+    while n_stack > 0:
+        n_stack -= 1
+        node, start, stop = stack[n_stack, 0], stack[n_stack, 1], stack[n_stack, 2]
+        node_start[node], node_stop[node] = start, stop
+
+        faces = face_order[start:stop]
+        for kk in range(3):
+            node_min[node, kk] = np.min(tri_min[faces, kk])
+            node_max[node, kk] = np.max(tri_max[faces, kk])
+        if stop - start <= leaf_size:
+            continue
+
+        # split at the median center along the widest axis of the centers
+        axis = 0
+        widest = -1.
+        for kk in range(3):
+            extent = np.max(centers[faces, kk]) - np.min(centers[faces, kk])
+            if extent > widest:
+                axis, widest = kk, extent
+        if widest <= 0:
+            continue
+        face_order[start:stop] = faces[np.argsort(centers[faces, axis])]
+
+        mid = (start + stop) // 2
+        node_left[node] = n_nodes
+        stack[n_stack, 0], stack[n_stack, 1], stack[n_stack, 2] = n_nodes, start, mid
+        stack[n_stack + 1, 0], stack[n_stack + 1, 1], stack[n_stack + 1, 2] = n_nodes + 1, mid, stop
+        n_stack += 2
+        n_nodes += 2
+
+    return (node_min[:n_nodes], node_max[:n_nodes], node_left[:n_nodes],
+            node_start[:n_nodes], node_stop[:n_nodes], face_order)
+
+
+@numba.njit(parallel=True, cache=True)
+def _first_hits(origins, directions, triangles, node_min, node_max, node_left,
+                node_start, node_stop, face_order):
+    n_rays = len(origins)
+    hit_faces = np.full(n_rays, -1, dtype=np.int64)
+    hit_ts = np.full(n_rays, np.inf)
+    for ii in numba.prange(n_rays):
+        o = origins[ii]
+        d = directions[ii]
+        inv_d = np.empty(3)
+        for kk in range(3):
+            # avoids nan slabs for rays parallel to an axis
+            inv_d[kk] = 1. / d[kk] if d[kk] != 0 else 1e300
+
+        stack = np.empty(_STACK_SIZE, dtype=np.int64)
+        stack[0] = 0
+        n_stack = 1
+        t_best = np.inf
+        face_best = -1
+        while n_stack > 0:
+            n_stack -= 1
+            node = stack[n_stack]
+
+            t_near, t_far = 0., t_best
+            for kk in range(3):
+                t0 = (node_min[node, kk] - o[kk]) * inv_d[kk]
+                t1 = (node_max[node, kk] - o[kk]) * inv_d[kk]
+                if t0 > t1:
+                    t0, t1 = t1, t0
+                t_near = max(t_near, t0)
+                t_far = min(t_far, t1)
+            if t_near > t_far:
+                continue
+
+            if node_left[node] >= 0:
+                if n_stack + 2 <= _STACK_SIZE:
+                    stack[n_stack] = node_left[node]
+                    stack[n_stack + 1] = node_left[node] + 1
+                    n_stack += 2
+                continue
+
+            # Moller-Trumbore intersection with the faces of the leaf
+            for jj in range(node_start[node], node_stop[node]):
+                face = face_order[jj]
+                v0 = triangles[face, 0]
+                e1 = triangles[face, 1] - v0
+                e2 = triangles[face, 2] - v0
+                h = np.cross(d, e2)
+                a = np.dot(e1, h)
+                if a == 0:
+                    continue
+                f = 1. / a
+                s = o - v0
+                u = f * np.dot(s, h)
+                if u < 0 or u > 1:
+                    continue
+                q = np.cross(s, e1)
+                v = f * np.dot(d, q)
+                if v < 0 or u + v > 1:
+                    continue
+                t = f * np.dot(e2, q)
+                if t > 0 and t < t_best:
+                    t_best = t
+                    face_best = face
+        hit_faces[ii] = face_best
+        hit_ts[ii] = t_best
+    return hit_faces, hit_ts
+
+
+class BVHRayMeshIntersector(object):
+    """ Ray intersector over a bounding volume hierarchy of the mesh faces
+
+    A drop in replacement for the first hit queries of
+    trimesh.ray.ray_pyembree.RayMeshIntersector. The hierarchy is built
+    once and rays are traversed in parallel by compiled code.
+
+    Parameters
+    ----------
+    mesh: trimesh.Trimesh
+        the mesh to cast rays against
+    leaf_size: int
+        maximum number of faces per leaf of the hierarchy (default 4)
+    """
+
+    def __init__(self, mesh, leaf_size=4):
+        self.mesh = mesh
+        self._triangles = np.ascontiguousarray(mesh.triangles, dtype=np.float64)
+        self._nodes = None
+        if len(self._triangles) > 0:
+            self._nodes = _build_bvh(self._triangles.min(axis=1),
+                                     self._triangles.max(axis=1),
+                                     self._triangles.mean(axis=1), leaf_size)
+
+    def intersects_first(self, ray_origins, ray_directions):
+        """ The first face every ray hits
+
+        Parameters
+        ----------
+        ray_origins: np.array
+            a Nx3 array of ray origins
+        ray_directions: np.array
+            a Nx3 array of ray directions
+
+        Returns
+        -------
+        np.array
+            a N array of face indices, -1 for rays that hit nothing
+        """
+        return self._first_hits(ray_origins, ray_directions)[0]
+
+    def intersects_location(self, ray_origins, ray_directions, multiple_hits=False):
+        """ Locations of the first hit of every ray
+
+        Parameters
+        ----------
+        ray_origins: np.array
+            a Nx3 array of ray origins
+        ray_directions: np.array
+            a Nx3 array of ray directions
+        multiple_hits: bool
+            only False, the first hit, is supported
+
+        Returns
+        -------
+        np.array
+            a Hx3 array of hit locations
+        np.array
+            a H array of the indices of the rays that hit
+        np.array
+            a H array of the indices of the faces that were hit
+        """
+        if multiple_hits:
+            raise NotImplementedError(
+                "BVHRayMeshIntersector only finds the first hit of every ray")
+        ray_origins, ray_directions = self._as_rays(ray_origins, ray_directions)
+        hit_faces, hit_ts = self._first_hits(ray_origins, ray_directions)
+        index_ray = np.flatnonzero(hit_faces >= 0)
+        locations = ray_origins[index_ray] + \
+            hit_ts[index_ray, np.newaxis] * ray_directions[index_ray]
+        return locations, index_ray, hit_faces[index_ray]
+
+    def _as_rays(self, ray_origins, ray_directions):
+        ray_origins = np.ascontiguousarray(ray_origins, dtype=np.float64).reshape(-1, 3)
+        ray_directions = np.ascontiguousarray(ray_directions, dtype=np.float64).reshape(-1, 3)
+        return ray_origins, ray_directions
+
+    def _first_hits(self, ray_origins, ray_directions):
+        ray_origins, ray_directions = self._as_rays(ray_origins, ray_directions)
+        if self._nodes is None:
+            return np.full(len(ray_origins), -1, dtype=np.int64), \
+                np.full(len(ray_origins), np.inf)
+        return _first_hits(ray_origins, ray_directions, self._triangles,
+                           *self._nodes)
@@ -2,95 +2,224 @@ __doc__ = """
 Mesh Iterator Classes
 """
 
-import random
+import logging
+import queue
+import threading
 import time
 import numpy as np
 
 
 ORDERS = ["random", "sequential"]
 
+_STOP = object()
+
 
 class LocalViewIterator(object):
     """
     Iterator class which samples local views that cover an entire mesh.
     Each mesh vertex is counted as "covered" if it's included in at
     least one local view across the iterator.
+
+    Coverage is tracked with a boolean bitmap and the not yet covered
+    vertices are kept in a compact pool from which covered vertices are
+    swap-removed, so every batch costs time proportional to its size,
+    not to the size of the mesh.
+
+    Parameters
+    ----------
+    mesh: :obj:`meshparty.trimesh_io.Mesh`
+        the mesh to sample views from
+    n_points: int
+        number of points per view
+    batch_size: int
+        number of views per batch (default 1)
+    order: str
+        'random' picks uncovered centers at random, 'sequential' picks
+        the uncovered centers with the lowest indices (default 'random')
+    pc_align: bool
+        passed to :func:`meshparty.trimesh_io.Mesh.get_local_views` (default False)
+    pc_norm: bool
+        passed to :func:`meshparty.trimesh_io.Mesh.get_local_views` (default False)
+    adaptnorm: bool
+        passed as adapt_unit_sphere_norm to
+        :func:`meshparty.trimesh_io.Mesh.get_local_views` (default False)
+    fisheye: bool
+        passed to :func:`meshparty.trimesh_io.Mesh.get_local_views` (default False)
+    sample_n_points: int
+        passed to :func:`meshparty.trimesh_io.Mesh.get_local_views` (default None)
+    verbose: bool
+        whether to log the time every batch took (default False)
+    seed: int or None
+        seed of the random generator used for centers and point sampling,
+        None gives non-deterministic batches (default None)
+    prefetch: int
+        number of batches a background thread computes ahead of the
+        consumer, 0 computes batches on demand (default 0)
     """
 
     def __init__(self, mesh, n_points, batch_size=1, order="random",
                  pc_align=False, pc_norm=False, adaptnorm=False,
-                 fisheye=False, sample_n_points=None, verbose=False):
+                 fisheye=False, sample_n_points=None, verbose=False,
+                 seed=None, prefetch=0):
 
         assert order in ORDERS, f"invalid order {order} not in {ORDERS}"
 
-        self._active_inds = list(range(mesh.vertices.shape[0]))
+        n_vertices = mesh.vertices.shape[0]
+        self._covered = np.zeros(n_vertices, dtype=bool)
+        self._active_inds = np.arange(n_vertices)
+        self._active_pos = np.arange(n_vertices)
+        self._n_active = n_vertices
+        self._cursor = 0
+
         self._order = order
         self._mesh = mesh
         self._batch_size = batch_size
+        self._verbose = verbose
+        self._rng = np.random.default_rng(seed)
 
         # arguments for local view method calls
         self._kwargs = dict(n_points=n_points, pc_align=pc_align,
                             fisheye=fisheye,
-                            verbose=verbose, sample_n_points=sample_n_points,
+                            sample_n_points=sample_n_points,
                             return_node_ids=True, pc_norm=pc_norm)
 
         self._deact_kwargs = dict(n_points=n_points, pc_align=pc_align,
                                   adapt_unit_sphere_norm=adaptnorm,
-                                  verbose=verbose, sample_n_points=None,
+                                  sample_n_points=None,
                                   return_node_ids=True, pc_norm=pc_norm)
 
+        self._prefetch = prefetch
+        self._queue = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        if prefetch > 0:
+            self._queue = queue.Queue(maxsize=prefetch)
+            self._thread = threading.Thread(target=self._prefetch_batches,
+                                            daemon=True)
+            self._thread.start()
+
+    @property
+    def n_active(self):
+        """int : number of vertices not covered by any view yet"""
+        return self._n_active
+
+    @property
+    def coverage(self):
+        """float : fraction of the mesh vertices covered by views so far"""
+        if len(self._covered) == 0:
+            return 1.
+        return 1 - self._n_active / len(self._covered)
+
     def __iter__(self):
         return self
 
     def __next__(self):
+        if self._queue is None:
+            return self._next_batch()
+
+        batch = self._queue.get()
+        if batch is _STOP:
+            # leave the sentinel for any further calls
+            self._queue.put(_STOP)
+            raise StopIteration
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def close(self):
+        """ Stops the prefetching thread """
+        self._stop_event.set()
+        if self._thread is not None:
+            # unblock the producer if the queue is full
+            while self._thread.is_alive():
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self._thread.join(timeout=0.01)
+
+    def _prefetch_batches(self):
+        """ Computes batches into the prefetch queue until exhausted """
+        while not self._stop_event.is_set():
+            try:
+                batch = self._next_batch()
+            except StopIteration:
+                batch = _STOP
+            except Exception as e:
+                batch = e
+            self._queue.put(batch)
+            if batch is _STOP or isinstance(batch, Exception):
+                return
+
+    def _next_batch(self):
         time_start = time.time()
         # stopping condition: no more indices to sample
-        if len(self._active_inds) == 0:
+        if self._n_active == 0:
             raise StopIteration
 
-        n_samples = min(self._batch_size, len(self._active_inds))
+        n_samples = min(self._batch_size, self._n_active)
 
         if self._order == "random":
-            random.seed(time.time())
-            centers = np.random.choice(self._active_inds, n_samples,
-                                       replace=False)
-            views, _, node_ids = self._mesh.get_local_views(
-                center_node_ids=centers,  **self._kwargs)
-
-            if self._kwargs["sample_n_points"] is not None:
-                _, _, node_ids = self._mesh.get_local_views(
-                    center_node_ids=centers, **self._deact_kwargs)
-
-            self._deactivate_nodes(node_ids.flatten())
+            pos = self._rng.choice(self._n_active, n_samples, replace=False)
+            centers = self._active_inds[pos]
         elif self._order == "sequential":
-            centers = []
-            views = []
-            while len(self._active_inds) > 0:
-                centers.append(self._active_inds[0])
-                view, _, node_ids = self._mesh.get_local_views(
-                    center_node_ids=[centers[-1]], **self._kwargs)
-                views.extend(view)
-
-                if self._kwargs["sample_n_points"] is not None:
-                    _, _, node_ids = self._mesh.get_local_views(
-                        center_node_ids=centers, **self._deact_kwargs)
-
-                self._deactivate_nodes(node_ids)
+            centers = self._next_sequential_centers(n_samples)
         else:
             raise Exception()
 
-        print("Views took %.3fs" % (time.time() - time_start))
+        views, _, node_ids = self._mesh.get_local_views(
+            center_node_ids=centers, random_state=self._rng, **self._kwargs)
+
+        if self._kwargs["sample_n_points"] is not None:
+            _, _, node_ids = self._mesh.get_local_views(
+                center_node_ids=centers, random_state=self._rng,
+                **self._deact_kwargs)
+
+        # centers count as covered even if a duplicate vertex took their place
+        self._deactivate_nodes(np.concatenate(
+            [centers] + [np.ravel(ns) for ns in node_ids]))
+
+        if self._verbose:
+            logging.info("Views took %.3fs" % (time.time() - time_start))
         return np.array(views, dtype=np.float32), \
-               np.array(centers, dtype=np.uint32)
+            np.array(centers, dtype=np.uint32)
+
+    def _next_sequential_centers(self, n_samples):
+        """ The n_samples uncovered vertices with the lowest indices """
+        centers = []
+        n_found = 0
+        chunk_size = max(n_samples, 1024)
+        while n_found < n_samples:
+            chunk = self._covered[self._cursor:self._cursor + chunk_size]
+            uncovered = np.flatnonzero(~chunk)[:n_samples - n_found]
+            centers.append(uncovered + self._cursor)
+            n_found += len(uncovered)
+            if n_found < n_samples:
+                self._cursor += len(chunk)
+        centers = np.concatenate(centers)
+        self._cursor = centers[-1]
+        return centers
 
     def _deactivate_nodes(self, node_ids):
         """
         Removes nodes from consideration which have been sampled
         in the last patch
         """
-        if isinstance(node_ids, np.ndarray):
-            node_ids = node_ids.tolist()
-
-        to_deactivate = set(node_ids)
-        self._active_inds = list(filter(lambda x: x not in to_deactivate,
-                                        self._active_inds))
+        node_ids = np.unique(np.asarray(node_ids, dtype=int))
+        node_ids = node_ids[(node_ids >= 0) & (node_ids < len(self._covered))]
+        node_ids = node_ids[~self._covered[node_ids]]
+        if len(node_ids) == 0:
+            return
+        self._covered[node_ids] = True
+
+        # swap-remove: the uncovered tail of the pool fills the holes
+        # the removed nodes leave in front of the new pool end
+        n_active = self._n_active - len(node_ids)
+        tail = self._active_inds[n_active:self._n_active]
+        tail = tail[~self._covered[tail]]
+        holes = self._active_pos[node_ids]
+        holes = holes[holes < n_active]
+
+        self._active_inds[holes] = tail
+        self._active_pos[tail] = holes
+        self._n_active = n_active
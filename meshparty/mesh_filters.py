@@ -71,7 +71,7 @@ def filter_components_by_size(mesh, min_size=0, max_size=np.inf, map_to_unmasked
         N-length boolean array
 
     """
-    cc, labels = sparse.csgraph.connected_components(mesh.csgraph, directed=False)
+    labels = mesh.component_labels
     uids, counts = np.unique(labels, return_counts=True)
     good_labels = uids[(counts > min_size) & (counts <= max_size)]
     is_good = np.in1d(labels, good_labels)
@@ -94,7 +94,7 @@ def filter_largest_component(mesh, map_to_unmasked=True):
         N-length boolean array
 
     """
-    cc, labels = sparse.csgraph.connected_components(mesh.csgraph)
+    labels = mesh.component_labels
     uids, counts = np.unique(labels, return_counts=True)
     max_label = np.argmax(counts)
     in_largest = labels == max_label
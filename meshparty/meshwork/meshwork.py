@@ -10,7 +10,7 @@ from ..trimesh_io import Mesh
 from ..skeleton import Skeleton, resample
 
 import contextlib
-import io
+import copy
 import pandas as pd
 import numpy as np
 from scipy import sparse
@@ -18,8 +18,11 @@ from functools import wraps
 from .utils import (
     DEFAULT_VOXEL_RESOLUTION,
     MeshworkIndexFactory,
-    in1d_items,
-    in1d_first_item,
+    inverse_map_csr,
+    csr_rows,
+    aggregate_csr_rows,
+    TreeDistanceIndex,
+    chunked_dijkstra,
     unique_column_name,
     compress_mesh_data,
     decompress_mesh_data,
@@ -204,6 +207,16 @@ class AnchoredAnnotationManager(object):
         for tn in self.table_names:
             self._data_tables[tn]._reset_filter()
 
+    def _shallow_copy(self):
+        "Copy of the manager with copies of its tables"
+        new_manager = copy.copy(self)
+        new_manager._data_tables = dict()
+        for name, table in self._data_tables.items():
+            new_manager._data_tables[name] = table._shallow_copy()
+            if self.__dict__.get(name) is table:
+                new_manager.__dict__[name] = new_manager._data_tables[name]
+        return new_manager
+
     def _register_MeshIndex(self, NewMeshIndex):
         self._MeshIndex = NewMeshIndex
         for tn in self.table_names:
@@ -358,6 +371,12 @@ class AnchoredAnnotation(object):
         else:
             return self.voxels * self.voxel_resolution
 
+    def _shallow_copy(self):
+        "Copy of the annotation with its own copy of the dataframe"
+        new_anno = copy.copy(self)
+        new_anno._data = self._data.copy(deep=True)
+        return new_anno
+
     def _register_MeshIndex(self, NewClass):
         self._MeshIndex = NewClass
 
@@ -535,9 +554,14 @@ class Meshwork(object):
         if skeleton is not None:
             self._skeleton.voxel_scaling = voxel_scaling
 
+        self._original_mesh = None
         self._original_mesh_data = None
         self._MeshIndex = None
         self._SkeletonIndex = None
+        self._mesh_to_skel_masked = None
+        self._skel_to_mesh_csr = None
+        self._skel_to_mesh_csr_base = None
+        self._skel_tree_index = None
         self._recompute_indices()
 
     @property
@@ -551,19 +575,38 @@ class Meshwork(object):
 
     @voxel_scaling.setter
     def voxel_scaling(self, new_scaling):
+        self._voxel_scaling = new_scaling
+        self._skel_tree_index = None
         self._mesh.voxel_scaling = new_scaling
+        if self._original_mesh is not None:
+            self._original_mesh.voxel_scaling = new_scaling
+        elif self._original_mesh_data is not None:
+            self._original_mesh_data = self._original_mesh_data[:-1] + (new_scaling,)
         if self.skeleton is not None:
             self._skeleton.voxel_scaling = new_scaling
         self._recompute_indices()
 
     def __copy__(self):
-        with io.BytesIO() as bio:
-            self.save_meshwork(bio)
-            bio.seek(0)
-            nrn_copy = load_meshwork(bio)
+        nrn_copy = self.__class__.__new__(self.__class__)
+        nrn_copy.__dict__.update(self.__dict__)
+        nrn_copy._mesh = self._mesh.shallow_copy()
+        if self._original_mesh is not None:
+            nrn_copy._original_mesh = self._original_mesh.shallow_copy()
+        if self._skeleton is not None:
+            nrn_copy._skeleton = self._skeleton.copy()
+        nrn_copy._anno = self._anno._shallow_copy()
+        nrn_copy._recompute_indices()
         return nrn_copy
 
     def copy(self):
+        """Copy of the meshwork with its own mesh arrays, skeleton and annotation tables,
+        so changes to either meshwork do not reach the other. Cached mesh properties
+        carry over to the copy, so kdtrees and graphs are not rebuilt.
+
+        Returns
+        -------
+        Meshwork
+        """
         return self.__copy__()
 
     ##################
@@ -613,6 +656,9 @@ class Meshwork(object):
     def _reset_indices(self):
         self._MeshIndex = None
         self._SkeletonIndex = None
+        self._mesh_to_skel_masked = None
+        self._skel_to_mesh_csr = None
+        self._skel_tree_index = None
         if self.skeleton is not None:
             self.skeleton._register_skeleton_index(self.SkeletonIndex)
         self.anno._register_MeshIndex(self.MeshIndex)
@@ -639,7 +685,22 @@ class Meshwork(object):
     def faces(self):
         return self.mesh.faces
 
-    def apply_mask(self, mask):
+    @property
+    def _is_masked(self):
+        return self._original_mesh is not None or self._original_mesh_data is not None
+
+    @property
+    def _unmasked_mesh(self):
+        """The mesh as used to initialize the object, without any mask"""
+        if self._original_mesh is not None:
+            return self._original_mesh
+        elif self._original_mesh_data is not None:
+            vs, fs, es, nm, vxsc = decompress_mesh_data(*self._original_mesh_data)
+            return Mesh(vs, fs, link_edges=es, node_mask=nm, voxel_scaling=vxsc)
+        else:
+            return self.mesh
+
+    def apply_mask(self, mask, compress=False):
         """Apply a mesh mask to the meshwork object
 
         Parameters
@@ -647,15 +708,25 @@ class Meshwork(object):
         mask : array of booleans
             Array with the same number of elements as mesh vertices. True elements are kept,
             False elements are masked out.
+        compress : bool, optional
+            If True, the unmasked mesh is kept blosc-compressed while the mask is applied instead
+            of in memory. This saves memory, but resetting the mask has to decompress and rebuild
+            the mesh and its cached properties. Default is False.
         """
-        if self._original_mesh_data is None:
-            self._original_mesh_data = compress_mesh_data(self.mesh)
+        self._set_masked_mesh(self.mesh.apply_mask(mask), compress=compress)
+
+    def _set_masked_mesh(self, masked_mesh, compress=False):
+        if not self._is_masked:
+            self._original_mesh = self.mesh
+        if compress and self._original_mesh is not None:
+            self._original_mesh_data = compress_mesh_data(self._original_mesh)
+            self._original_mesh = None
 
         if self.skeleton is not None:
-            sk_mask = self._mesh_mask_to_skel_mask(mask)
+            sk_mask = self._mesh_mask_to_skel_mask(masked_mesh.node_mask)
             self.skeleton.apply_mask(sk_mask, in_place=True)
 
-        self._mesh = self.mesh.apply_mask(mask)
+        self._mesh = masked_mesh
         self._anno.filter_annotations(self.mesh)
         self._reset_indices()
 
@@ -667,19 +738,18 @@ class Meshwork(object):
         to : array, optional
             Mask array of booleans to apply after resetting the mask. Equivalent to reset_mask followed by apply_mask.
         """
-        if self._original_mesh_data is not None:
+        if self._is_masked:
             self._anno.remove_filter()
 
-            vs, fs, es, nm, vxsc = decompress_mesh_data(*self._original_mesh_data)
-            self._mesh = Mesh(vs, fs, link_edges=es, node_mask=nm, voxel_scaling=vxsc)
-
+            self._mesh = self._unmasked_mesh
+            self._original_mesh = None
             self._original_mesh_data = None
             if self.skeleton is not None:
                 self._skeleton.reset_mask(in_place=True)
             self._reset_indices()
 
-            if to is not None:
-                self.apply_mask(to)
+        if to is not None:
+            self.apply_mask(to)
 
     @contextlib.contextmanager
     def mask_context(self, mask):
@@ -690,7 +760,9 @@ class Meshwork(object):
         mask : array or None,
             A boolean array with the same number of elements as mesh vertices. True elements are kept, False are masked out. If None, resets the mask entirely.
         """
-        current_mask = self.mesh_mask
+        current_mesh = self.mesh
+        was_masked = self._is_masked
+        was_compressed = self._original_mesh_data is not None
         try:
             if mask is None:
                 self.reset_mask()
@@ -698,7 +770,10 @@ class Meshwork(object):
                 self.apply_mask(mask)
             yield self
         finally:
-            self.reset_mask(to=current_mask)
+            self.reset_mask()
+            if was_masked:
+                # the masked mesh is restored as is, keeping its cached properties
+                self._set_masked_mesh(current_mesh, compress=was_compressed)
 
     ##################
     # Anno functions #
@@ -831,11 +906,7 @@ class Meshwork(object):
         """
         from meshparty.skeletonize import skeletonize_mesh
 
-        if self._original_mesh_data is not None:
-            vs, fs, es, nm, vxsc = decompress_mesh_data(*self._original_mesh_data)
-            mesh_to_sk = Mesh(vs, fs, link_edges=es, node_mask=nm, voxel_scaling=vxsc)
-        else:
-            mesh_to_sk = self.mesh
+        mesh_to_sk = self._unmasked_mesh
 
         if self._skeleton is None or overwrite is True:
             self._skeleton = skeletonize_mesh(
@@ -851,16 +922,47 @@ class Meshwork(object):
                 collapse_params=collapse_params,
                 meta={"root_id": self.seg_id},
             )
+            self._skel_to_mesh_csr_base = None
             self._reset_indices()
         else:
             print("Skeleton already exists")
         pass
 
     # all functions of this group take filtered indices and return filtered indices.
+    @property
+    def _mesh_to_skel_map_masked(self):
+        """Skeleton index of every mesh vertex in the masked index spaces, rebuilt on mask change"""
+        if self._mesh_to_skel_masked is None:
+            self._mesh_to_skel_masked = self.skeleton.mesh_to_skel_map[
+                self.mesh.node_mask
+            ]
+        return self._mesh_to_skel_masked
+
+    @property
+    def _skel_to_mesh_map(self):
+        """CSR arrays of the sorted mesh vertices of every skeleton vertex in the masked
+        index spaces, rebuilt on mask change"""
+        if self._skel_to_mesh_csr is None:
+            self._skel_to_mesh_csr = inverse_map_csr(
+                self._mesh_to_skel_map_masked, self.skeleton.n_vertices
+            )
+        return self._skel_to_mesh_csr
+
+    @property
+    def _skel_to_mesh_map_base(self):
+        """CSR arrays of the sorted mesh vertices of every skeleton vertex in the unmasked
+        index spaces, rebuilt with the skeleton"""
+        if self._skel_to_mesh_csr_base is None:
+            self._skel_to_mesh_csr_base = inverse_map_csr(
+                self.skeleton.mesh_to_skel_map_base, self.skeleton.unmasked_size
+            )
+        return self._skel_to_mesh_csr_base
+
     def _mind_to_skind_padded(self, minds):
-        minds_b = self.mesh.map_indices_to_unmasked(minds)
-        skinds = self.skeleton.mesh_to_skel_map[minds_b]
-        return skinds
+        minds = np.asarray(minds, dtype=int)
+        return np.where(
+            minds >= 0, self._mesh_to_skel_map_masked[np.where(minds >= 0, minds, 0)], -1
+        )
 
     def _mind_to_skind(self, minds):
         mind_padded = self._mind_to_skind_padded(minds)
@@ -874,19 +976,23 @@ class Meshwork(object):
         return skel_mask
 
     def _skind_to_mind_mask_base(self, skinds):
-        skinds_b = self.skeleton.map_indices_to_unmasked(skinds)
-        minds_b_assoc = np.isin(self.skeleton.mesh_to_skel_map_base, skinds_b)
+        skinds_b = self.skeleton.map_indices_to_unmasked(np.asarray(skinds, dtype=int))
+        minds_b = csr_rows(*self._skel_to_mesh_map_base, skinds_b)[0]
+        minds_b_assoc = np.full(len(self.skeleton.mesh_to_skel_map_base), False)
+        minds_b_assoc[minds_b] = True
         return minds_b_assoc
 
     def _skind_to_mind_mask(self, skinds):
-        return self.mesh.filter_unmasked_boolean(self._skind_to_mind_mask_base(skinds))
+        mask = np.full(self.mesh.n_vertices, False)
+        mask[csr_rows(*self._skel_to_mesh_map, skinds)[0]] = True
+        return mask
 
     def _skind_to_mind_index(self, skinds):
-        return np.flatnonzero(self._skind_to_mind_mask(skinds))
+        return np.unique(csr_rows(*self._skel_to_mesh_map, skinds)[0])
 
     def _skind_regions(self, skinds):
-        out = in1d_items(self.skeleton.mesh_to_skel_map[self.mesh.node_mask], skinds)
-        return out
+        minds, lengths = csr_rows(*self._skel_to_mesh_map, skinds)
+        return np.split(minds, np.cumsum(lengths)[:-1])
 
     def _skind_region_first(self, skinds):
         if isinstance(skinds, int):
@@ -894,9 +1000,13 @@ class Meshwork(object):
         if issubclass(type(skinds), np.ndarray):
             if len(skinds.shape) == 0:
                 skinds = skinds.reshape(1)
-        return in1d_first_item(
-            self.skeleton.mesh_to_skel_map[self.mesh.node_mask], skinds
-        )
+        skinds = np.asarray(skinds, dtype=int)
+        indptr, indices = self._skel_to_mesh_map
+        has_region = np.full(len(skinds), False)
+        has_region[skinds >= 0] = np.diff(indptr)[skinds[skinds >= 0]] > 0
+        out = np.full(len(skinds), -1)
+        out[has_region] = indices[indptr[skinds[has_region]]]
+        return out
 
     @OnlyIfSkeleton.exists
     def skeleton_property_to_mesh(
@@ -924,34 +1034,26 @@ class Meshwork(object):
         Parameters
         ----------
         mesh_property : array
-            N-element array with same length as mesh vertices
+            N-element array with same length as mesh vertices, or an NxK array to map K properties at once.
         aggfunc : str or function, optional
-            Either a pre-defined aggregation function or one of "mean", "median", "max, or "min". By default 'mean'.
+            Either a function applied to the values of each skeleton vertex or one of "mean", "sum", "median",
+            "max", "min" or "count". By default 'mean'.
 
         Returns
         -------
         np.ndarray
-            Array of aggregated values
+            Array of aggregated values for each skeleton vertex (with K columns for NxK properties), nan for
+            skeleton vertices without mesh vertices, except for "sum" where they are 0.
+            "count" returns the number of mesh vertices of each skeleton vertex.
         """
-        if aggfunc == "mean":
-            aggfunc = np.mean
-        elif aggfunc == "median":
-            aggfunc = np.median
-        elif aggfunc == "max":
-            aggfunc = np.max
-        elif aggfunc == "min":
-            aggfunc = np.min
-        elif isinstance(aggfunc, str):
-            raise ValueError(
-                "Only string values allowed are 'mean', 'median', 'max', and 'min'."
-            )
+        mesh_property = np.asarray(mesh_property)
+        if len(mesh_property) != self.mesh.n_vertices:
+            if len(mesh_property) != self.mesh.unmasked_size:
+                raise ValueError("Mesh property must have one value per mesh vertex")
+            mesh_property = mesh_property[self.mesh.node_mask]
 
-        arr = np.vstack((self.skeleton.mesh_to_skel_map, mesh_property)).T
-        arr = arr[np.argsort(arr[:, 0])]
-        arr_grouped = np.split(
-            arr[:, 1], np.unique(arr[:, 0], return_index=True)[1][1:]
-        )
-        return np.array([aggfunc(x) for x in arr_grouped])
+        indptr, minds = self._skel_to_mesh_map
+        return aggregate_csr_rows(indptr, mesh_property[minds], aggfunc=aggfunc)
 
     @property
     @OnlyIfSkeleton.exists
@@ -1278,15 +1380,30 @@ class Meshwork(object):
             source_ind.to_mesh_region_point[0], return_as_skel=return_as_skel
         )
 
-    def _distance_between(self, inds_source, inds_target, graph, squeeze):
-        ds = sparse.csgraph.dijkstra(graph, directed=False, indices=inds_source)
+    @property
+    def _skel_tree_distances(self):
+        """Lowest common ancestor index of the masked skeleton, rebuilt on mask change"""
+        if self._skel_tree_index is None:
+            self._skel_tree_index = TreeDistanceIndex.from_skeleton(self.skeleton)
+        return self._skel_tree_index
+
+    def _distance_between(self, inds_source, inds_target, graph, squeeze, max_distance=np.inf):
+        inds_source = np.asarray(inds_source, dtype=int).ravel()
+        inds_target = np.asarray(inds_target, dtype=int).ravel()
+        sources, source_slots = np.unique(inds_source, return_inverse=True)
+        ds = np.empty((len(sources), len(inds_target)))
+        for start, ds_chunk in chunked_dijkstra(graph, sources, limit=max_distance):
+            ds[start : start + len(ds_chunk)] = ds_chunk[:, inds_target]
+        ds = ds[source_slots]
         if squeeze:
-            return ds[:, inds_target].squeeze()
+            return ds.squeeze()
         else:
-            return ds[:, inds_target]
+            return ds
 
     @OnlyIfSkeleton.exists
-    def distance_between(self, inds_source, inds_target, along_path=True, squeeze=True):
+    def distance_between(
+        self, inds_source, inds_target, along_path=True, squeeze=True, max_distance=np.inf
+    ):
         """Get distance matrix between source and target mesh indices along the object
 
         Parameters
@@ -1296,27 +1413,36 @@ class Meshwork(object):
         inds_target : int or array
             mesh indices for the other side of the paths
         along_path : bool, optional
-            If True (default), use the skeleton
+            If True (default), use the skeleton. Distances are computed from the lowest common ancestor
+            of each pair of skeleton vertices. If False, use the mesh graph.
         squeeze : bool, optional
-            If True (default), squeezes singlet dimensions of the distance matrix.
+            If True (default), squeezes singlet dimensions of the distance matrix. Only applies to mesh distances.
+        max_distance : numeric, optional
+            Distances beyond this are returned as inf, which bounds the graph search for mesh distances.
+            By default, np.inf.
         Returns
         -------
         array
             Array of distances with shape (len(inds_source), len(inds_target)) before optional squeezing.
+            Distances along the skeleton are NaN for mesh indices without a skeleton index.
         """
         inds_source = self._convert_to_meshindex(inds_source)
         inds_target = self._convert_to_meshindex(inds_target)
 
         if along_path:
-            return self._distance_between(
+            ds = self._skel_tree_distances.distances(
                 inds_source.to_skel_index_padded,
                 inds_target.to_skel_index_padded,
-                self.skeleton.csgraph,
-                squeeze=False,
             )
+            ds[ds > max_distance] = np.inf
+            return ds
         else:
             return self._distance_between(
-                inds_source, inds_target, self.mesh.csgraph, squeeze=squeeze
+                inds_source,
+                inds_target,
+                self.mesh.csgraph,
+                squeeze=squeeze,
+                max_distance=max_distance,
             )
 
     @OnlyIfSkeleton.exists
@@ -1349,8 +1475,18 @@ class Meshwork(object):
         return skpath.to_mesh_index
 
     def _within_distance(self, inds, graph, max_distance):
-        ds = sparse.csgraph.dijkstra(graph, indices=inds, directed=False)
-        return ds < max_distance
+        """Sparse boolean matrix that is True for every vertex closer than max_distance to each source"""
+        rows, cols = [], []
+        for start, ds in chunked_dijkstra(graph, inds, limit=max_distance):
+            chunk_rows, chunk_cols = np.nonzero(ds < max_distance)
+            rows.append(chunk_rows + start)
+            cols.append(chunk_cols)
+        rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=int)
+        cols = np.concatenate(cols) if len(cols) > 0 else np.zeros(0, dtype=int)
+        return sparse.csr_matrix(
+            (np.full(len(rows), True), (rows, cols)),
+            shape=(len(np.atleast_1d(inds)), graph.shape[0]),
+        )
 
     @OnlyIfSkeleton.exists
     def within_distance(
@@ -1372,8 +1508,8 @@ class Meshwork(object):
         Returns
         -------
         array or list of arrays
-            Mask (if return_as_skel is False) or skeleton index array.
-            If collapse is True, a single array that is True if True for any source.
+            Mesh index (if return_as_skel is False) or skeleton index array.
+            If collapse is True, a single array of the indices close to any source.
             If collapse is False, a list of arrays for each source.
         """
         if np.isscalar(source_inds) or collapse:
@@ -1386,23 +1522,22 @@ class Meshwork(object):
         dmask = self._within_distance(
             source_inds.to_skel_index, self.skeleton.csgraph, distance
         )
-        if collapse:
-            if (dmask.shape) == 1:
-                dmask = dmask.reshape(1, -1)
-            dmask = np.any(dmask, axis=0).reshape(1, -1)
-            return_scalar = True
+        if return_scalar:
+            skinds = [np.unique(dmask.indices)]
+        else:
+            skinds = np.split(dmask.indices, dmask.indptr[1:-1])
+
         if return_as_skel:
-            if return_scalar:
-                dmask = self.SkeletonIndex(np.flatnonzero(dmask))
-            else:
-                dmask = [self.SkeletonIndex(np.flatnonzero(m)) for m in dmask]
+            out = [self.SkeletonIndex(np.sort(x)) for x in skinds]
         else:
-            dmask = dmask[:, self.skeleton.mesh_to_skel_map]
-            if return_scalar:
-                dmask = self.MeshIndex(np.flatnonzero(dmask))
-            else:
-                dmask = [self.MeshIndex(np.flatnonzero(m)) for m in dmask]
-        return dmask
+            out = [
+                self.MeshIndex(np.sort(csr_rows(*self._skel_to_mesh_map, x)[0]))
+                for x in skinds
+            ]
+        if return_scalar:
+            return out[0]
+        else:
+            return out
 
     @OnlyIfSkeleton.exists
     def path_length(self, inds=None):
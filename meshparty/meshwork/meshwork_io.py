@@ -1,4 +1,3 @@
-from .utils import decompress_mesh_data
 from ..skeleton import Skeleton
 from ..trimesh_io import Mesh
 import h5py
@@ -34,11 +33,7 @@ def load_meshwork_metadata(filename):
 
 def save_meshwork_mesh(filename, mw, version=LATEST_VERSION):
     node_mask = mw.mesh_mask
-    if mw._original_mesh_data is not None:
-        vs, fs, es, nm, vxsc = decompress_mesh_data(*mw._original_mesh_data)
-        mesh = Mesh(vs, fs, link_edges=es, node_mask=nm, voxel_scaling=vxsc)
-    else:
-        mesh = mw.mesh
+    mesh = mw._unmasked_mesh
 
     with h5py.File(filename, "a") as f:
         f.create_group("mesh")
@@ -52,6 +47,10 @@ def save_meshwork_mesh(filename, mw, version=LATEST_VERSION):
                 "mesh/link_edges", data=mesh.link_edges, compression="gzip"
             )
         f.create_dataset("mesh/mesh_mask", data=node_mask, compression="gzip")
+        for shape_function, radii in mesh.vertex_radii.items():
+            f.create_dataset(
+                f"mesh/vertex_radii/{shape_function}", data=radii, compression="gzip"
+            )
 
 
 def load_meshwork_mesh(filename, version=NULL_VERSION):
@@ -69,16 +68,21 @@ def load_meshwork_mesh(filename, version=NULL_VERSION):
         node_mask = f["mesh/node_mask"][()]
         voxel_scaling = f["mesh"].attrs.get("voxel_scaling", None)
         mesh_mask = f["mesh/mesh_mask"][()]
-    return (
-        Mesh(
-            vertices=verts,
-            faces=faces,
-            link_edges=link_edges,
-            node_mask=node_mask,
-            voxel_scaling=voxel_scaling,
-        ),
-        mesh_mask,
+
+        vertex_radii = {}
+        if "vertex_radii" in f["mesh"].keys():
+            for shape_function in f["mesh/vertex_radii"].keys():
+                vertex_radii[shape_function] = f[f"mesh/vertex_radii/{shape_function}"][()]
+
+    mesh = Mesh(
+        vertices=verts,
+        faces=faces,
+        link_edges=link_edges,
+        node_mask=node_mask,
+        voxel_scaling=voxel_scaling,
     )
+    mesh.vertex_radii.update(vertex_radii)
+    return mesh, mesh_mask
 
 
 def save_meshwork_skeleton(filename, mw, version=LATEST_VERSION):
@@ -3,203 +3,260 @@ import numpy as np
 import numba
 from scipy import sparse
 from ..trimesh_io import Mesh
+from ..utils import map_indices_to_unmasked
 from ..skeleton import Skeleton
 
 DEFAULT_VOXEL_RESOLUTION = [4, 4, 40]
 
 
+class MeshworkIndexContext(object):
+    """Index mappings for one mask state of a meshwork, shared by all of the
+    mesh and skeleton indices made in that state
+
+    Parameters
+    ----------
+    mw : Meshwork
+        Meshwork whose current masks the indices refer to
+    """
+
+    def __init__(self, mw):
+        self.mw = mw
+        self.mesh = mw.mesh
+        self._mesh_indices_unmasked = None
+        self._skel_indices_unmasked = None
+
+        self.MeshIndex = MeshworkIndexType(JointMeshIndex, self)
+        if mw.skeleton is not None:
+            self.skel_node_mask = mw.skeleton.node_mask
+            self.SkeletonIndex = MeshworkIndexType(JointSkeletonIndex, self)
+        else:
+            self.skel_node_mask = None
+            self.SkeletonIndex = np.array
+
+    @property
+    def mesh_indices_unmasked(self):
+        """Unmasked index of every mesh vertex in the mask, computed once per mask"""
+        if self._mesh_indices_unmasked is None:
+            self._mesh_indices_unmasked = self.mesh.indices_unmasked
+        return self._mesh_indices_unmasked
+
+    @property
+    def skel_indices_unmasked(self):
+        """Unmasked index of every skeleton vertex in the mask, computed once per mask"""
+        if self._skel_indices_unmasked is None:
+            self._skel_indices_unmasked = np.flatnonzero(self.skel_node_mask)
+        return self._skel_indices_unmasked
+
+
+class MeshworkIndexType(object):
+    """Makes the mesh or skeleton indices of an index context. Also acts as their type,
+    so that isinstance only matches indices made within the same context."""
+
+    def __init__(self, index_class, context):
+        self._index_class = index_class
+        self._context = context
+
+    def __call__(self, indices):
+        return self._index_class(indices, self._context)
+
+    def __instancecheck__(self, obj):
+        return isinstance(obj, self._index_class) and obj._context is self._context
+
+
 def MeshworkIndexFactory(mw):
-    class JointMeshIndex(np.ndarray):
-        def __new__(cls, mesh_indices):
-            if (
-                np.array(mesh_indices).dtype is np.dtype("bool")
-                and len(mesh_indices) == mw.mesh.n_vertices
-            ):
-                mesh_indices = np.flatnonzero(mesh_indices)
-
-            mesh_inds = np.asarray(mesh_indices, dtype=int)
-            obj = mesh_inds.view(cls)
-            obj._mesh_indices_base = mw.mesh.map_indices_to_unmasked(mesh_inds)
-            return obj
-
-        def __array_finalize__(self, obj):
-            if obj is None:
-                return
-            self._mesh_indices_base = getattr(obj, "_mesh_indices_base", np.array([]))
-
-        def __getitem__(self, k):
-            ret = super(JointMeshIndex, self).__getitem__(k)
-            if not isinstance(ret, np.integer):
-                ret._mesh_indices_base = self._mesh_indices_base[k]
-            return ret
-
-        def __eq__(self, other):
-            return np.array(self) == other
-
-        def __lt__(self, other):
-            return np.array(self) < other
-
-        def __le__(self, other):
-            return np.array(self) <= other
-
-        def __gt__(self, other):
-            return np.array(self) > other
-
-        def __ge__(self, other):
-            return np.array(self) >= other
-
-        @property
-        def to_array(self):
-            return np.array(self)
-
-        @property
-        def to_mesh_index(self):
-            return self
-
-        @property
-        def to_mesh_index_base(self):
-            return self._mesh_indices_base
-
-        @property
-        def to_mesh_index_point(self):
-            return self.to_skel_index.to_mesh_region_point
-
-        @property
-        def to_mesh_mask_base(self):
-            mask = np.full(len(mw.mesh.node_mask), False)
-            mask[self.to_mesh_index_base] = True
-            return mask
-
-        @property
-        def to_mesh_mask(self):
-            return mw.mesh.filter_unmasked_boolean(self.to_mesh_mask_base)
-
-        @property
-        def to_all_equivalent_mesh(self):
-            return self.to_skel_index.to_mesh_index
-
-        @property
-        def to_all_equivalent_mask(self):
-            return self.to_skel_index.to_mesh_mask
-
-        @property
-        def to_skel_index(self):
-            if mw.skeleton is None:
-                return None
-            return JointSkeletonIndex(np.unique(mw._mind_to_skind(self)))
-
-        @property
-        def to_skel_index_padded(self):
-            if mw.skeleton is None:
-                return None
-            return mw._mind_to_skind_padded(self)
-
-        @property
-        def to_skel_mask(self):
-            if mw.skeleton is None:
-                return None
-            return JointSkeletonIndex(np.unique(mw._mind_to_skind(self))).to_skel_mask
-
-    if mw.skeleton is None:
-        return JointMeshIndex, np.array
-
-    class JointSkeletonIndex(np.ndarray):
-        def __new__(cls, skel_indices):
-            if (
-                np.array(skel_indices).dtype is np.dtype("bool")
-                and len(skel_indices) == mw.skeleton.n_vertices
-            ):
-                skel_indices = np.flatnonzero(skel_indices)
-
-            skel_inds = np.asarray(skel_indices, dtype=int)
-            obj = skel_inds.view(cls)
-            obj._skel_indices_base = mw.skeleton.map_indices_to_unmasked(
-                skel_inds[skel_inds >= 0]
+    context = MeshworkIndexContext(mw)
+    return context.MeshIndex, context.SkeletonIndex
+
+
+class JointMeshIndex(np.ndarray):
+    def __new__(cls, mesh_indices, context):
+        mesh_indices = np.asarray(mesh_indices)
+        if mesh_indices.dtype == bool and len(mesh_indices) == context.mesh.n_vertices:
+            mesh_indices = np.flatnonzero(mesh_indices)
+
+        obj = np.asarray(mesh_indices, dtype=int).view(cls)
+        obj._context = context
+        return obj
+
+    def __array_finalize__(self, obj):
+        # base indices are recomputed lazily rather than carried through every slice
+        self._context = getattr(obj, "_context", None)
+        self._mesh_indices_base = None
+
+    def __eq__(self, other):
+        return self.view(np.ndarray) == other
+
+    def __lt__(self, other):
+        return self.view(np.ndarray) < other
+
+    def __le__(self, other):
+        return self.view(np.ndarray) <= other
+
+    def __gt__(self, other):
+        return self.view(np.ndarray) > other
+
+    def __ge__(self, other):
+        return self.view(np.ndarray) >= other
+
+    @property
+    def _mw(self):
+        return self._context.mw
+
+    @property
+    def to_array(self):
+        return np.array(self)
+
+    @property
+    def to_mesh_index(self):
+        return self
+
+    @property
+    def to_mesh_index_base(self):
+        if self._mesh_indices_base is None:
+            self._mesh_indices_base = map_indices_to_unmasked(
+                self._context.mesh_indices_unmasked, self.view(np.ndarray)
             )
-            return obj
+        return self._mesh_indices_base
 
-        def __array_finalize__(self, obj):
-            if obj is None:
-                return
-            self._skel_indices_base = getattr(obj, "_skel_indices_base", np.array([]))
+    @property
+    def to_mesh_index_point(self):
+        return self.to_skel_index.to_mesh_region_point
 
-        def __getitem__(self, k):
-            ret = super(JointSkeletonIndex, self).__getitem__(k)
-            if not isinstance(ret, np.integer):
-                ret._skel_indices_base = self._skel_indices_base[k]
-            return ret
+    @property
+    def to_mesh_mask_base(self):
+        mask = np.full(len(self._context.mesh.node_mask), False)
+        mask[self.to_mesh_index_base] = True
+        return mask
 
-        def __eq__(self, other):
-            return np.array(self) == other
+    @property
+    def to_mesh_mask(self):
+        return self._context.mesh.filter_unmasked_boolean(self.to_mesh_mask_base)
 
-        def __lt__(self, other):
-            return np.array(self) < other
+    @property
+    def to_all_equivalent_mesh(self):
+        return self.to_skel_index.to_mesh_index
 
-        def __le__(self, other):
-            return np.array(self) <= other
+    @property
+    def to_all_equivalent_mask(self):
+        return self.to_skel_index.to_mesh_mask
 
-        def __gt__(self, other):
-            return np.array(self) > other
+    @property
+    def to_skel_index(self):
+        if self._mw.skeleton is None:
+            return None
+        return self._context.SkeletonIndex(np.unique(self._mw._mind_to_skind(self)))
 
-        def __ge__(self, other):
-            return np.array(self) >= other
+    @property
+    def to_skel_index_padded(self):
+        if self._mw.skeleton is None:
+            return None
+        return self._mw._mind_to_skind_padded(self)
 
-        @property
-        def to_mesh_index(self):
-            return JointMeshIndex(mw._skind_to_mind_index(self[self >= 0]))
+    @property
+    def to_skel_mask(self):
+        if self._mw.skeleton is None:
+            return None
+        return self.to_skel_index.to_skel_mask
 
-        @property
-        def to_array(self):
-            return np.array(self)
 
-        @property
-        def to_mesh_index_base(self):
-            return mw.mesh.map_indices_to_unmasked(self.to_mesh_index)
+class JointSkeletonIndex(np.ndarray):
+    def __new__(cls, skel_indices, context):
+        skel_indices = np.asarray(skel_indices)
+        if skel_indices.dtype == bool and len(skel_indices) == len(
+            context.skel_indices_unmasked
+        ):
+            skel_indices = np.flatnonzero(skel_indices)
 
-        @property
-        def to_mesh_mask_base(self):
-            return mw._skind_to_mind_mask_base(self[self >= 0])
+        obj = np.asarray(skel_indices, dtype=int).view(cls)
+        obj._context = context
+        return obj
 
-        @property
-        def to_mesh_mask(self):
-            return mw._skind_to_mind_mask(self[self >= 0])
+    def __array_finalize__(self, obj):
+        # base indices are recomputed lazily rather than carried through every slice
+        self._context = getattr(obj, "_context", None)
+        self._skel_indices_base = None
 
-        @property
-        def to_mesh_region(self):
-            return [
-                JointMeshIndex(x) if self[ii] >= 0 else JointMeshIndex([])
-                for ii, x in enumerate(mw._skind_regions(self))
-            ]
+    def __eq__(self, other):
+        return self.view(np.ndarray) == other
 
-        @property
-        def to_mesh_region_point(self):
-            out = mw._skind_region_first(self)
-            out[self < 0] = -1
-            return JointMeshIndex(out)
+    def __lt__(self, other):
+        return self.view(np.ndarray) < other
 
-        @property
-        def to_skel_index(self):
-            return self[self >= 0]
+    def __le__(self, other):
+        return self.view(np.ndarray) <= other
 
-        @property
-        def to_skel_index_padded(self):
-            return self
+    def __gt__(self, other):
+        return self.view(np.ndarray) > other
 
-        @property
-        def to_skel_index_base(self):
-            return self._skel_indices_base
+    def __ge__(self, other):
+        return self.view(np.ndarray) >= other
 
-        @property
-        def to_skel_mask_base(self):
-            mask = np.full(len(mw.skeleton.node_mask), False)
-            mask[self._skel_indices_base] = True
-            return mask
+    @property
+    def _mw(self):
+        return self._context.mw
 
-        @property
-        def to_skel_mask(self):
-            return mw.skeleton.filter_unmasked_boolean(self.to_skel_mask_base)
+    @property
+    def _valid(self):
+        return self[self >= 0]
 
-    return JointMeshIndex, JointSkeletonIndex
+    @property
+    def to_mesh_index(self):
+        return self._context.MeshIndex(self._mw._skind_to_mind_index(self._valid))
+
+    @property
+    def to_array(self):
+        return np.array(self)
+
+    @property
+    def to_mesh_index_base(self):
+        return self.to_mesh_index.to_mesh_index_base
+
+    @property
+    def to_mesh_mask_base(self):
+        return self._mw._skind_to_mind_mask_base(self._valid)
+
+    @property
+    def to_mesh_mask(self):
+        return self._mw._skind_to_mind_mask(self._valid)
+
+    @property
+    def to_mesh_region(self):
+        MeshIndex = self._context.MeshIndex
+        return [
+            MeshIndex(x) if skind >= 0 else MeshIndex([])
+            for skind, x in zip(self.view(np.ndarray), self._mw._skind_regions(self))
+        ]
+
+    @property
+    def to_mesh_region_point(self):
+        out = self._mw._skind_region_first(self)
+        out[self < 0] = -1
+        return self._context.MeshIndex(out)
+
+    @property
+    def to_skel_index(self):
+        return self._valid
+
+    @property
+    def to_skel_index_padded(self):
+        return self
+
+    @property
+    def to_skel_index_base(self):
+        if self._skel_indices_base is None:
+            valid = self.view(np.ndarray)
+            self._skel_indices_base = self._context.skel_indices_unmasked[valid[valid >= 0]]
+        return self._skel_indices_base
+
+    @property
+    def to_skel_mask_base(self):
+        mask = np.full(len(self._context.skel_node_mask), False)
+        mask[self.to_skel_index_base] = True
+        return mask
+
+    @property
+    def to_skel_mask(self):
+        return self.to_skel_mask_base[self._context.skel_node_mask]
 
 
 @numba.njit(parallel=True)
@@ -213,6 +270,281 @@ def _in1d_items(elements, mask, test_vals):
     return out
 
 
+def inverse_map_csr(elements, n_values):
+    """For a map from each element to a value in range(n_values) (or -1 for none),
+    CSR arrays (indptr, indices) listing the elements of every value in ascending order"""
+    elements = np.asarray(elements, dtype=np.int64)
+    valid = np.flatnonzero(elements >= 0)
+    order = np.argsort(elements[valid], kind="stable")
+    indptr = np.zeros(n_values + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(elements[valid], minlength=n_values))
+    return indptr, valid[order]
+
+
+def csr_rows(indptr, indices, rows):
+    """Concatenated entries of rows of CSR arrays and the number of entries per row,
+    negative rows are empty"""
+    rows = np.asarray(rows, dtype=np.int64).ravel()
+    is_row = rows >= 0
+    starts = np.where(is_row, indptr[np.where(is_row, rows, 0)], 0)
+    lengths = np.where(is_row, indptr[np.where(is_row, rows, 0) + 1] - starts, 0)
+    offsets = np.cumsum(lengths) - lengths
+    entry_inds = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+    return indices[entry_inds], lengths
+
+
+AGGREGATIONS = ["mean", "sum", "max", "min", "count", "median"]
+
+
+def aggregate_csr_rows(indptr, values, aggfunc="mean"):
+    """Aggregates the values of every row of CSR arrays
+
+    Parameters
+    ----------
+    indptr : np.array
+        M+1 element array of row offsets into values
+    values : np.array
+        N or NxK array of values sorted by row
+    aggfunc : str or function, optional
+        One of "mean", "sum", "max", "min", "count" or "median", or a function
+        applied to the values of each row. By default "mean".
+
+    Returns
+    -------
+    np.array
+        M or MxK array of aggregated values (M for "count"). Empty rows are nan,
+        except for "sum" and "count", where they are 0 as for np.sum of an empty array.
+    """
+    values = np.asarray(values)
+    counts = np.diff(indptr)
+    if aggfunc == "count":
+        return counts
+    has_values = counts > 0
+    out = np.full((len(counts),) + values.shape[1:], np.nan)
+
+    if not isinstance(aggfunc, str):
+        for row, row_values in enumerate(np.split(values, indptr[1:-1])):
+            if len(row_values) > 0:
+                out[row] = aggfunc(row_values)
+        return out
+    elif aggfunc not in AGGREGATIONS:
+        raise ValueError(f"Only string values allowed are {AGGREGATIONS}.")
+
+    if not np.any(has_values):
+        return np.zeros_like(out) if aggfunc == "sum" else out
+    starts = indptr[:-1][has_values]
+    if aggfunc in ["mean", "sum"]:
+        sums = np.add.reduceat(values, starts, axis=0)
+        if aggfunc == "sum":
+            out = np.zeros((len(counts),) + sums.shape[1:], dtype=sums.dtype)
+            out[has_values] = sums
+        else:
+            counts_shape = (-1,) + (1,) * (values.ndim - 1)
+            out[has_values] = sums / counts[has_values].reshape(counts_shape)
+    elif aggfunc == "max":
+        out[has_values] = np.maximum.reduceat(values, starts, axis=0)
+    elif aggfunc == "min":
+        out[has_values] = np.minimum.reduceat(values, starts, axis=0)
+    elif aggfunc == "median":
+        rows = np.repeat(np.arange(len(counts)), counts)
+        lower = starts + (counts[has_values] - 1) // 2
+        upper = starts + counts[has_values] // 2
+        columns = values.reshape(len(values), -1)
+        medians = np.empty((len(starts), columns.shape[1]))
+        for kk, column in enumerate(columns.T):
+            column = column[np.lexsort((column, rows))]
+            medians[:, kk] = (column[lower] + column[upper]) / 2
+            # as np.median, rows with nan values have a nan median
+            has_nan = np.add.reduceat(np.isnan(column.astype(float)), starts) > 0
+            medians[has_nan, kk] = np.nan
+        out[has_values] = medians.reshape((len(starts),) + values.shape[1:])
+    return out
+
+
+@numba.njit(cache=True)
+def _euler_tour(parents, edge_lengths):
+    n = len(parents)
+    child_ptr = np.zeros(n + 1, dtype=np.int64)
+    for v in range(n):
+        if parents[v] >= 0:
+            child_ptr[parents[v] + 1] += 1
+    child_ptr = np.cumsum(child_ptr)
+    children = np.empty(child_ptr[n], dtype=np.int64)
+    next_child = child_ptr[:-1].copy()
+    for v in range(n):
+        if parents[v] >= 0:
+            children[next_child[parents[v]]] = v
+            next_child[parents[v]] += 1
+    next_child = child_ptr[:-1].copy()
+
+    euler = np.empty(2 * n, dtype=np.int64)
+    first = np.full(n, -1, dtype=np.int64)
+    depth = np.zeros(n, dtype=np.int64)
+    dist = np.zeros(n)
+    tree = np.full(n, -1, dtype=np.int64)
+    stack = np.empty(n, dtype=np.int64)
+    m = 0
+    for root in range(n):
+        if parents[root] >= 0:
+            continue
+        tree[root] = root
+        first[root] = m
+        euler[m] = root
+        m += 1
+        stack[0] = root
+        n_stack = 1
+        while n_stack > 0:
+            v = stack[n_stack - 1]
+            if next_child[v] < child_ptr[v + 1]:
+                c = children[next_child[v]]
+                next_child[v] += 1
+                depth[c] = depth[v] + 1
+                dist[c] = dist[v] + edge_lengths[c]
+                tree[c] = root
+                first[c] = m
+                euler[m] = c
+                m += 1
+                stack[n_stack] = c
+                n_stack += 1
+            else:
+                n_stack -= 1
+                if n_stack > 0:
+                    euler[m] = stack[n_stack - 1]
+                    m += 1
+    return euler[:m], first, depth, dist, tree
+
+
+@numba.njit(cache=True)
+def _min_depth_table(euler, depth):
+    m = len(euler)
+    n_levels = 1
+    while (1 << n_levels) <= m:
+        n_levels += 1
+    table = np.empty((n_levels, m), dtype=np.int64)
+    table[0] = euler
+    for k in range(1, n_levels):
+        half = 1 << (k - 1)
+        for ii in range(m - (1 << k) + 1):
+            a = table[k - 1, ii]
+            b = table[k - 1, ii + half]
+            table[k, ii] = a if depth[a] <= depth[b] else b
+    return table
+
+
+@numba.njit(parallel=True, cache=True)
+def _lca_distances(sources, targets, first, table, depth, dist, tree):
+    out = np.empty((len(sources), len(targets)))
+    for ii in numba.prange(len(sources)):
+        u = sources[ii]
+        for jj in range(len(targets)):
+            v = targets[jj]
+            if u < 0 or v < 0:
+                out[ii, jj] = np.nan
+                continue
+            if tree[u] < 0 or tree[u] != tree[v]:
+                out[ii, jj] = np.inf
+                continue
+            lo, hi = first[u], first[v]
+            if lo > hi:
+                lo, hi = hi, lo
+            k = 0
+            while (2 << k) <= hi - lo + 1:
+                k += 1
+            a = table[k, lo]
+            b = table[k, hi - (1 << k) + 1]
+            lca = a if depth[a] <= depth[b] else b
+            out[ii, jj] = dist[u] + dist[v] - 2 * dist[lca]
+    return out
+
+
+class TreeDistanceIndex(object):
+    """Distances between vertices of a forest through their lowest common ancestors,
+    in constant time per pair after a linear time setup
+
+    Parameters
+    ----------
+    parents : np.array
+        N-element array of the parent of each vertex, -1 for roots
+    edge_lengths : np.array
+        N-element array of the length of the edge from each vertex to its parent
+    """
+
+    def __init__(self, parents, edge_lengths):
+        euler, self._first, self._depth, self._dist, self._tree = _euler_tour(
+            np.asarray(parents, dtype=np.int64), np.asarray(edge_lengths, dtype=np.float64)
+        )
+        self._table = _min_depth_table(euler, self._depth)
+
+    @classmethod
+    def from_skeleton(cls, sk):
+        """Index of a skeleton, whose edges are oriented from child to parent"""
+        parents = np.full(sk.n_vertices, -1)
+        parents[sk.edges[:, 0]] = sk.edges[:, 1]
+        edge_lengths = np.zeros(sk.n_vertices)
+        edge_lengths[sk.edges[:, 0]] = np.linalg.norm(
+            sk.vertices[sk.edges[:, 0]] - sk.vertices[sk.edges[:, 1]], axis=1
+        )
+        return cls(parents, edge_lengths)
+
+    def distances(self, sources, targets):
+        """Matrix of distances between source and target vertices along the forest
+
+        Parameters
+        ----------
+        sources : array
+            S-element array of vertex indices
+        targets : array
+            T-element array of vertex indices
+
+        Returns
+        -------
+        np.array
+            SxT array of distances, inf between different trees and nan for negative indices
+        """
+        return _lca_distances(
+            np.asarray(sources, dtype=np.int64).ravel(),
+            np.asarray(targets, dtype=np.int64).ravel(),
+            self._first,
+            self._table,
+            self._depth,
+            self._dist,
+            self._tree,
+        )
+
+
+def chunked_dijkstra(graph, sources, limit=np.inf, max_elements=10**7):
+    """Undirected dijkstra distances from sources in chunks of rows, so that no more than
+    max_elements distances are held at once
+
+    Parameters
+    ----------
+    graph : scipy.sparse matrix
+        NxN graph
+    sources : array
+        Indices of the source vertices
+    limit : float, optional
+        Distance beyond which vertices are not explored and left at inf. By default np.inf.
+    max_elements : int, optional
+        Maximum size of a chunk of distances. By default 10**7.
+
+    Yields
+    ------
+    int
+        Position of the first source of the chunk in sources
+    np.array
+        Distances from the sources of the chunk to all vertices
+    """
+    sources = np.asarray(sources, dtype=np.int64).ravel()
+    chunk_size = max(1, int(max_elements // max(graph.shape[0], 1)))
+    for start in range(0, len(sources), chunk_size):
+        yield start, sparse.csgraph.dijkstra(
+            graph,
+            directed=False,
+            indices=sources[start : start + chunk_size],
+            limit=limit,
+        )
+
+
 def in1d_items(elements, test_vals):
     """For each item in test_vals, finds all indices in elements that match it"""
     out = _in1d_items(elements, np.isin(elements, test_vals), test_vals)
@@ -318,24 +650,23 @@ def unique_column_name(base_name, suffix, df):
 
 
 def compress_mesh_data(mesh, cname="lz4"):
-    if mesh.voxel_scaling is not None:
-        vxsc = mesh.voxel_scaling
+    vxsc = mesh.voxel_scaling
+    if vxsc is not None:
+        vs = mesh.vertices * mesh.inverse_voxel_scaling
     else:
-        vxsc = None
-    mesh.voxel_scaling = None
-    zvs = blosc.compress(mesh.vertices.tobytes(), typesize=8, cname=cname)
-    zfs = blosc.compress(mesh.faces.tobytes(), typesize=8, cname=cname)
-    zes = blosc.compress(mesh.link_edges.tobytes(), typesize=8, cname=cname)
+        vs = mesh.vertices
+    zvs = blosc.compress(np.asarray(vs, dtype=np.float64).tobytes(), typesize=8, cname=cname)
+    zfs = blosc.compress(np.asarray(mesh.faces, dtype=np.int64).tobytes(), typesize=8, cname=cname)
+    zes = blosc.compress(np.asarray(mesh.link_edges, dtype=np.int64).tobytes(), typesize=8, cname=cname)
     znm = blosc.compress(mesh.node_mask.tobytes(), typesize=1, cname=cname)
-    mesh.voxel_scaling = vxsc
     return zvs, zfs, zes, znm, vxsc
 
 
 def decompress_mesh_data(zvs, zfs, zes, znm, vxsc):
-    vs = np.frombuffer(blosc.decompress(zvs), dtype=np.float).reshape(-1, 3)
-    fs = np.frombuffer(blosc.decompress(zfs), dtype=np.int).reshape(-1, 3)
-    es = np.frombuffer(blosc.decompress(zes), dtype=np.int).reshape(-1, 2)
-    nm = np.frombuffer(blosc.decompress(znm), dtype=np.bool)
+    vs = np.frombuffer(blosc.decompress(zvs), dtype=np.float64).reshape(-1, 3)
+    fs = np.frombuffer(blosc.decompress(zfs), dtype=np.int64).reshape(-1, 3)
+    es = np.frombuffer(blosc.decompress(zes), dtype=np.int64).reshape(-1, 2)
+    nm = np.frombuffer(blosc.decompress(znm), dtype=bool)
     return vs, fs, es, nm, vxsc
 
 
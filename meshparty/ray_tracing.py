@@ -1,17 +1,68 @@
 import trimesh.ray
-from trimesh.ray import ray_pyembree
-from trimesh.ray import ray_pyembree
-from scipy.linalg import block_diag
+from trimesh.ray import ray_pyembree, ray_triangle
 import numpy as np
+import numba
 import multiwrapper.multiprocessing_utils as mu
-from meshparty import trimesh_io
+from meshparty import trimesh_io, bvh
 import logging
 
+RAY_ENGINES = ["auto", "embree", "bvh", "triangle"]
 
-def ray_trace_distance(vertex_inds, mesh, max_iter=10, rand_jitter=0.001, verbose=False, ray_inter=None):
+
+def get_ray_intersector(mesh, engine="auto"):
+    '''
+    Ray intersector for a mesh, all engines share the intersects_location interface.
+
+    Parameters
+    ----------
+    mesh : :obj:`meshparty.trimesh_io.Mesh` or trimesh.Trimesh
+        mesh to perform ray tracing on
+    engine : str
+        'embree' uses pyembree, 'bvh' the compiled bounding volume hierarchy of
+        :class:`meshparty.bvh.BVHRayMeshIntersector`, cached on meshparty meshes,
+        'triangle' trimesh's pure python intersector and 'auto' picks embree if it is
+        installed and bvh otherwise (default 'auto')
+
+    Returns
+    -------
+    ray intersector
+        object with an intersects_location(ray_origins, ray_directions, multiple_hits) method
+    '''
+    assert engine in RAY_ENGINES, f"invalid engine {engine} not in {RAY_ENGINES}"
+    if engine == "auto":
+        engine = "embree" if trimesh.ray.has_embree else "bvh"
+
+    if engine == "embree":
+        return ray_pyembree.RayMeshIntersector(mesh)
+    elif engine == "bvh":
+        if isinstance(mesh, trimesh_io.Mesh):
+            return mesh.ray_bvh
+        return bvh.BVHRayMeshIntersector(mesh)
+    else:
+        return ray_triangle.RayMeshIntersector(mesh)
+
+
+def _first_hit_distances(ray_inter, starts, vs, origins, ray_vertices):
+    """ Vertices any ray hit from, and the distance from their origin to the hit
+    of their lowest indexed ray that hit
+    """
+    locs, hit_rows = ray_inter.intersects_location(starts, vs, multiple_hits=False)[:2]
+    hit_vertices = ray_vertices[hit_rows]
+    order = np.lexsort((hit_rows, hit_vertices))
+    hit_vertices, first = np.unique(hit_vertices[order], return_index=True)
+    first = order[first]
+    ds = np.linalg.norm(origins[hit_vertices] - locs[first], axis=1)
+    return hit_vertices, ds
+
+
+def ray_trace_distance(vertex_inds, mesh, max_iter=10, rand_jitter=0.001, verbose=False, ray_inter=None,
+                       n_cone_rays=0, cone_angle=np.pi/16, random_state=None, return_stats=False):
     '''
     Compute distance to opposite side of the mesh for specified vertex indices on the mesh.
 
+    Ray starts and directions are gathered once, and every retry only re-casts the rays
+    that have not hit yet, with jitter amplitudes growing by a factor 1.2 per retry.
+
     Parameters
     ----------
     vertex_inds : np.array
@@ -23,49 +74,78 @@ def ray_trace_distance(vertex_inds, mesh, max_iter=10, rand_jitter=0.001, verbos
     rand_jitter : float
         the amplitude of gaussian jitter on the vertex normal to add on each iteration (default .001)
     verbose : bool
-        whether to print debug statements (default False)
+        whether to log the hit rate of every iteration (default False)
     ray_inter: ray_pyembree.RayMeshIntersector
         a ray intercept object pre-initialized with a mesh, in case y ou are doing this many times
         and want to avoid paying initialization costs. (default None) will initialize it for you
+        with :func:`get_ray_intersector`
+    n_cone_rays : int
+        if larger than 0, a first pass casts a cone of this many rays around the inverted
+        normal of every vertex, and the hit of the most central ray is used, which leaves
+        fewer vertices to retry (default 0)
+    cone_angle : float
+        angular width of the first pass cone (default pi/16)
+    random_state : int, np.random.Generator or None
+        seed or generator for the jitter, None uses the global numpy random state (default None)
+    return_stats : bool
+        whether to also return per iteration statistics (default False)
 
     Returns
     -------
     np.array
         rs, a K long array of sdf values. rays with no result after max_iters will contain zeros.
+    list
+        stats, only if return_stats, a dict per iteration with the iteration (-1 for the cone pass),
+        the number of rays cast and of vertices hit, the hit rate and the jitter amplitude
 
     '''
-    if not trimesh.ray.has_embree:
-        logging.warning(
-            "calculating rays without pyembree, conda install pyembree for large speedup")
-
     if ray_inter is None:
-        ray_inter = ray_pyembree.RayMeshIntersector(mesh)
+        ray_inter = get_ray_intersector(mesh)
+
+    if random_state is None:
+        rng = np.random
+    else:
+        rng = np.random.default_rng(random_state)
+
+    vertex_inds = np.asarray(vertex_inds, dtype=int)
+    origins = mesh.vertices[vertex_inds]
+    normals = mesh.vertex_normals[vertex_inds]
+    starts = origins - normals
+    jitters = rand_jitter * 1.2 ** np.arange(max_iter + 1)
 
     rs = np.zeros(len(vertex_inds))
-    good_rs = np.full(len(rs), False)
+    todo = np.arange(len(vertex_inds))
+    stats = []
 
-    it = 0
-    while not np.all(good_rs):
+    def record(iteration, n_rays, n_vertices, n_hits, jitter):
+        hit_rate = n_hits / n_vertices if n_vertices > 0 else 1.
+        stats.append(dict(iteration=iteration, n_rays=n_rays, n_vertices=n_vertices,
+                          n_hits=n_hits, hit_rate=hit_rate, jitter=jitter))
         if verbose:
-            print(np.sum(~good_rs))
-        blank_inds = np.where(~good_rs)[0]
-        starts = (mesh.vertices -
-                  mesh.vertex_normals)[vertex_inds, :][~good_rs, :]
-        vs = -mesh.vertex_normals[vertex_inds, :] \
-            + (1.2**it)*rand_jitter*np.random.rand(*
-                                                   mesh.vertex_normals[vertex_inds, :].shape)
-        vs = vs[~good_rs, :]
-
-        rtrace = ray_inter.intersects_location(starts, vs, multiple_hits=False)
-
-        if len(rtrace[0] > 0):
-            # radius values
-            rs[blank_inds[rtrace[1]]] = np.linalg.norm(
-                mesh.vertices[vertex_inds, :][rtrace[1]]-rtrace[0], axis=1)
-            good_rs[blank_inds[rtrace[1]]] = True
-        it += 1
-        if it > max_iter:
+            logging.info("ray iteration %d: %d of %d vertices hit (%.3f)" %
+                         (iteration, n_hits, n_vertices, hit_rate))
+
+    if n_cone_rays > 0 and len(todo) > 0:
+        vs = np.vstack(oriented_vector_cones(-normals, n_cone_rays, cone_angle))
+        ray_vertices = np.repeat(todo, n_cone_rays)
+        hit_vertices, ds = _first_hit_distances(
+            ray_inter, starts[ray_vertices], vs, origins, ray_vertices)
+        rs[hit_vertices] = ds
+        record(-1, len(vs), len(todo), len(hit_vertices), 0.)
+        todo = np.setdiff1d(todo, hit_vertices, assume_unique=True)
+
+    for it, jitter in enumerate(jitters):
+        if len(todo) == 0:
             break
+        vs = -normals[todo] + jitter * rng.random((len(todo), 3))
+        hit_vertices, ds = _first_hit_distances(
+            ray_inter, starts[todo], vs, origins, todo)
+        rs[hit_vertices] = ds
+        record(it, len(todo), len(todo), len(hit_vertices), jitter)
+        todo = np.setdiff1d(todo, hit_vertices, assume_unique=True)
+
+    if return_stats:
+        return rs, stats
     return rs
 
 
@@ -110,10 +190,15 @@ def Rz(ang):
                      [0,  0, 1]])
 
 
-def _rotated_cone(data):
-    phi, theta, vs_raw = data
-    Rtrans = np.dot(Rz(phi), Ry(theta))
-    return np.dot(Rtrans, vs_raw.T).T
+def _rotation_matrices(phis, thetas):
+    """ Stack of the rotations Rz(phi) Ry(theta) as a Nx3x3 array """
+    cp, sp = np.cos(phis), np.sin(phis)
+    ct, st = np.cos(thetas), np.sin(thetas)
+    Rs = np.empty((len(phis), 3, 3))
+    Rs[:, 0] = np.stack([cp * ct, -sp, cp * st], axis=1)
+    Rs[:, 1] = np.stack([sp * ct, cp, sp * st], axis=1)
+    Rs[:, 2] = np.stack([-st, np.zeros_like(st), ct], axis=1)
+    return Rs
 
 
 def oriented_vector_cones(center_vectors, num_points, widest_angle=np.pi/3, normalize=False):
@@ -121,7 +206,7 @@ def oriented_vector_cones(center_vectors, num_points, widest_angle=np.pi/3, norm
     """
     if normalize:
         cv_norm = center_vectors / \
-            np.linalg.norm(center_vector, axis=1)[:, np.newaxis]
+            np.linalg.norm(center_vectors, axis=1)[:, np.newaxis]
     else:
         cv_norm = center_vectors
 
@@ -130,17 +215,10 @@ def oriented_vector_cones(center_vectors, num_points, widest_angle=np.pi/3, norm
 
     vs_raw = unit_vector_sampler(num_points, widest_angle=widest_angle)
 
-    Rtranses = []
-    data = []
-    for phi, theta in zip(phis, thetas):
-        data.append((phi, theta, vs_raw))
-    vector_cones = mu.multiprocess_func(_rotated_cone, data)
-    return vector_cones
-
-
-def _multi_angle_weighted_distance(data):
-    ds, angles, weights = data
-    return angle_weighted_distance(ds, angles, weights)
+    # all cones rotated at once, N x num_points x 3
+    vector_cones = np.einsum('nij,kj->nki',
+                             _rotation_matrices(phis, thetas), vs_raw)
+    return list(vector_cones)
 
 
 def angle_weighted_distance(ds, angles, weights):
@@ -160,36 +238,136 @@ def angle_weighted_distance(ds, angles, weights):
     return nanaverage
 
 
-def all_angle_weighted_distances(ds, angles, weights, rep_inds, inds):
+@numba.njit
+def _angle_weighted_distance_segments(ds, angles, weights, offsets):
+    """ :func:`angle_weighted_distance` of every segment of rays between offsets """
+    rs = np.full(len(offsets) - 1, np.nan)
+    for ii in range(len(offsets) - 1):
+        seg = slice(offsets[ii], offsets[ii + 1])
+        seg_ds, seg_angles, seg_weights = ds[seg], angles[seg], weights[seg]
+        if len(seg_ds) == 0 or np.nansum(seg_weights) == 0:
+            continue
+
+        med_angle = np.median(seg_angles)
+        std_angle = np.std(seg_angles)
+        min_angle = med_angle - std_angle
+        max_angle = max(med_angle + std_angle, np.pi / 2)
+
+        weighted_sum = 0.
+        weight_sum = 0.
+        for jj in range(len(seg_ds)):
+            if seg_angles[jj] >= min_angle and seg_angles[jj] <= max_angle:
+                weighted_d = seg_ds[jj] * seg_weights[jj]
+                if not np.isnan(weighted_d):
+                    weighted_sum += weighted_d
+                if not np.isnan(seg_weights[jj]):
+                    weight_sum += seg_weights[jj]
+        if weight_sum != 0:
+            rs[ii] = weighted_sum / weight_sum
+    return rs
+
+
+def _segment_angle_weighted_distances(ds, angles, weights, groups, n_groups):
+    """ :func:`angle_weighted_distance` of every group of rays in one pass
+
+    Rays are sorted into contiguous segments per group and reduced by a
+    compiled kernel, so no per group python or process pool overhead is paid.
+
+    Parameters
+    ----------
+    ds : np.array
+        a M long array of ray hit distances
+    angles : np.array
+        a M long array of angles between the rays and the hit faces
+    weights : np.array
+        a M long array of ray weights
+    groups : np.array
+        a M long array of the group (between 0 and n_groups) of every ray
+    n_groups : int
+        number of groups
+
+    Returns
+    -------
+    np.array
+        a n_groups long array of angle weighted distances, nan for groups
+        without rays or weights
+    """
+    # rays usually arrive sorted by group, which the stable sort exploits
+    order = np.argsort(groups, kind='stable')
+    offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(groups, minlength=n_groups))
+    return _angle_weighted_distance_segments(
+        ds[order], angles[order], weights[order], offsets)
 
-    data = []
-    real_inds, slice_bnds = np.unique(rep_inds, return_index=True)
 
-    ind_map = []
-    for ii in range(len(real_inds)-1):
-        row = slice(slice_bnds[ii], slice_bnds[ii+1])
-        data.append((ds[row], angles[row], weights[row]))
-        ind_map.append(real_inds[ii])
-    row = slice(slice_bnds[-1], len(ds))
-    data.append((ds[row], angles[row], weights[row]))
-    ind_map.append(real_inds[-1])
+def all_angle_weighted_distances(ds, angles, weights, rep_inds, inds):
+    """ :func:`angle_weighted_distance` of the rays of every vertex
 
-    rs = mu.multiprocess_func(_multi_angle_weighted_distance, data)
+    Computed in one vectorized pass over all rays rather than per vertex.
 
-    rs_out = np.nan * np.zeros(len(inds))
-    rs_out[np.array(ind_map)] = rs
+    Parameters
+    ----------
+    ds : np.array
+        a M long array of ray hit distances
+    angles : np.array
+        a M long array of angles between the rays and the hit faces
+    weights : np.array
+        a M long array of ray weights
+    rep_inds : np.array
+        a M long array of the position in inds of the vertex every ray was cast from
+    inds : np.array
+        a K long array of vertex indices
 
-    return rs_out
+    Returns
+    -------
+    np.array
+        a K long array of angle weighted distances, nan for vertices without rays
+    """
+    return _segment_angle_weighted_distances(
+        np.asarray(ds, dtype=float), np.asarray(angles, dtype=float),
+        np.asarray(weights, dtype=float), np.asarray(rep_inds, dtype=int),
+        len(inds))
 
 
 def _compute_ray_vectors(mesh, mesh_inds, num_points, cone_angle):
     return np.vstack(oriented_vector_cones(-mesh.vertex_normals[mesh_inds], num_points, cone_angle))
 
 
-def shape_diameter_function(mesh_inds, mesh, num_points=30, cone_angle=np.pi/3):
+def _shape_diameter_chunk(mesh, ray_inter, mesh_inds, num_points, cone_angle):
+    """ Shape diameter function of one chunk of vertices """
+    start = (mesh.vertices-mesh.vertex_normals)[mesh_inds, :]
+    rep_inds = np.repeat(np.arange(len(mesh_inds)), num_points)
+    starts = start[rep_inds]
+
+    vs = _compute_ray_vectors(mesh, mesh_inds, num_points, cone_angle)
+
+    rtrace = ray_inter.intersects_location(starts, vs, multiple_hits=False)
+
+    hit_rows = rtrace[1]
+    ds = np.linalg.norm(rtrace[0] - starts[hit_rows], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angles = np.arccos(
+            np.sum(mesh.face_normals[rtrace[2]] * vs[hit_rows], axis=1))
+        weights = 1/angles
+    good_rows = np.isfinite(weights)
+
+    return all_angle_weighted_distances(
+        ds[good_rows], angles[good_rows], weights[good_rows],
+        rep_inds[hit_rows[good_rows]], mesh_inds)
+
+
+def _shape_diameter_chunk_thread(args):
+    return _shape_diameter_chunk(*args)
+
+
+def shape_diameter_function(mesh_inds, mesh, num_points=30, cone_angle=np.pi/3,
+                            chunk_size=10000, n_threads=1, ray_inter=None):
     """Computes shape diameter function by sending a cone of rays from each specified vertex point
     and doing a weighted average of where they hit the opposite side of the mesh.
 
+    Rays are traced in chunks of vertices, so memory stays bounded by chunk_size * num_points
+    rays irrespective of the number of vertices.
+
     Parameters
     ----------
     mesh : trimesh.Mesh
@@ -200,30 +378,77 @@ def shape_diameter_function(mesh_inds, mesh, num_points=30, cone_angle=np.pi/3):
         Number of points per cones (default is 30)
     cone_angle : float, optional
         Angular width of the cone
+    chunk_size : int, optional
+        Number of vertices whose rays are traced at once (default is 10000)
+    n_threads : int, optional
+        Number of threads tracing chunks in parallel, requires a thread safe ray_inter
+        such as the pyembree or bvh one (default is 1)
+    ray_inter : ray_pyembree.RayMeshIntersector, optional
+        a ray intercept object pre-initialized with the mesh (default None will initialize it for you
+        with :func:`get_ray_intersector`)
 
     Returns
     -------
-
-        Description
+    np.array
+        a len(mesh_inds) long array of sdf values, nan where no ray hit the mesh
     """
-    start = (mesh.vertices-mesh.vertex_normals)[mesh_inds, :]
-    rep_inds = np.concatenate([ii*np.ones(num_points, dtype=int)
-                               for ii in range(start.shape[0])])
-    starts = start[rep_inds]
+    if ray_inter is None:
+        ray_inter = get_ray_intersector(mesh)
 
-    vs = _compute_ray_vectors(mesh, mesh_inds, num_points, cone_angle)
+    mesh_inds = np.asarray(mesh_inds, dtype=int)
+    multi_args = [(mesh, ray_inter, mesh_inds[i_start: i_start + chunk_size],
+                   num_points, cone_angle)
+                  for i_start in range(0, len(mesh_inds), chunk_size)]
+    if len(multi_args) == 0:
+        return np.zeros(0)
 
-    ray_inter = ray_pyembree.RayMeshIntersector(mesh)
-    rtrace = ray_inter.intersects_location(starts, vs, multiple_hits=False)
+    if n_threads == 1 or len(multi_args) == 1:
+        rs = [_shape_diameter_chunk_thread(args) for args in multi_args]
+    else:
+        rs = mu.multithread_func(_shape_diameter_chunk_thread, multi_args,
+                                 n_threads=n_threads)
+    return np.concatenate(rs)
 
-    hit_rows = rtrace[1]
-    ds = np.linalg.norm(rtrace[0] - starts[hit_rows], axis=1)
-    angles = np.arccos(
-        np.sum(mesh.face_normals[rtrace[2]] * vs[hit_rows], axis=1))
-    with np.errstate(divide='ignore', invalid='ignore'):
-        weights = 1/angles
-    good_rows = np.isfinite(weights)
 
-    rs = all_angle_weighted_distances(
-        ds[good_rows], angles[good_rows], weights[good_rows], rep_inds[hit_rows[good_rows]], mesh_inds)
-    return rs
+SHAPE_FUNCTIONS = {"single": ray_trace_distance,
+                   "cone": shape_diameter_function}
+
+
+def vertex_radius(vertex_inds, mesh, shape_function="single"):
+    """Radius estimates at mesh vertices, cached per vertex on the mesh
+
+    Only vertices without an estimate in mesh.vertex_radii are ray traced, so repeated calls,
+    e.g. when skeletonizing with different parameters, only pay for new vertices.
+    The cache can be stored with the mesh, see :func:`meshparty.trimesh_io.Mesh.write_vertex_radii`.
+
+    Parameters
+    ----------
+    vertex_inds : np.array
+        a K long set of indices into the mesh.vertices
+    mesh : :obj:`meshparty.trimesh_io.Mesh`
+        mesh to perform ray tracing on, other meshes are traced without caching
+    shape_function : str
+        'single' for :func:`ray_trace_distance` or 'cone' for :func:`shape_diameter_function`
+        with their default parameters (default 'single')
+
+    Returns
+    -------
+    np.array
+        a K long array of radius estimates
+    """
+    assert shape_function in SHAPE_FUNCTIONS, \
+        f"invalid shape_function {shape_function} not in {list(SHAPE_FUNCTIONS)}"
+    compute_radius = SHAPE_FUNCTIONS[shape_function]
+    vertex_inds = np.asarray(vertex_inds, dtype=int)
+    if not isinstance(mesh, trimesh_io.Mesh):
+        return compute_radius(vertex_inds, mesh)
+
+    radii = mesh.vertex_radii.get(shape_function)
+    if radii is None or len(radii) != len(mesh.vertices):
+        radii = np.full(len(mesh.vertices), -1.)
+        mesh.vertex_radii[shape_function] = radii
+
+    missing = np.unique(vertex_inds[radii[vertex_inds] == -1])
+    if len(missing) > 0:
+        radii[missing] = compute_radius(missing, mesh)
+    return radii[vertex_inds]
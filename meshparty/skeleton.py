@@ -1,3 +1,4 @@
+import copy
 import numpy as np
 from meshparty import utils
 from scipy import spatial, sparse
@@ -440,7 +441,7 @@ class Skeleton:
             self._rooted.vertices,
             self._rooted.edges,
             mesh_to_skel_map=self._rooted.mesh_to_skel_map,
-            vertex_properties=self._rooted.vertex_properties,
+            vertex_properties=copy.copy(self._rooted.vertex_properties),
             root=self._rooted.root,
             node_mask=self.node_mask,
             radius=self._rooted.radius,
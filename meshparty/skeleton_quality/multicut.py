@@ -4,10 +4,11 @@ from meshparty.trimesh_io import Mesh
 import pandas as pd
 import numpy as np
 from scipy import sparse
+from meshparty import utils
 
 
 def _build_multicut_graph(nrn):
-    G = nx.from_scipy_sparse_matrix(nrn.mesh.csgraph)
+    G = utils.csgraph_to_nxgraph(nrn.mesh.csgraph)
 
     G.add_node('source')
     G.add_node('target')
@@ -78,6 +79,12 @@ def _faces_to_keep(p1mask, p2mask, nrn):
     return good_faces
 
 
+def _to_scipy_sparse(G):
+    if hasattr(nx, 'to_scipy_sparse_array'):
+        return nx.to_scipy_sparse_array(G)
+    return nx.to_scipy_sparse_matrix(G)
+
+
 def _add_expected_edges(G, new_mesh, p1mask, p2mask, local_network_mask, test_split=True):
     "Adds edges that were not included in the faces graph"
     G.remove_node('source')
@@ -88,7 +95,7 @@ def _add_expected_edges(G, new_mesh, p1mask, p2mask, local_network_mask, test_sp
     p2s = new_mesh_filt.filter_unmasked_boolean(p2mask)
 
     # Make matrix without cross-partition edges
-    Gorig = nx.to_scipy_sparse_matrix(G)
+    Gorig = _to_scipy_sparse(G)
     ii, jj, dd = sparse.find(Gorig)
     keep11 = p1s[ii] & p1s[jj]
     keep22 = p2s[ii] & p2s[jj]
@@ -9,7 +9,7 @@ except:
     KDTree = spatial.cKDTree
 from tqdm import tqdm
 from meshparty.skeleton import Skeleton
-from .ray_tracing import ray_trace_distance, shape_diameter_function
+from .ray_tracing import ray_trace_distance, shape_diameter_function, vertex_radius
 import fastremap
 import logging
 from . import skeleton_utils
@@ -72,6 +72,7 @@ def skeletonize_mesh(
         (default True)
     shape_function: 'single' or 'cone'
         Selects how to compute the radius, either with a single ray or a cone of rays. Default is 'single'.
+        Radii are cached per vertex in mesh.vertex_radii, see :func:`meshparty.ray_tracing.vertex_radius`.
     compute_original_index: bool
         whether to calculate how each of the mesh nodes maps onto the skeleton
         (default True)
@@ -146,17 +147,11 @@ def skeletonize_mesh(
             )
         elif collapse_function == "branch":
 
-            if shape_function == "single":
-                rs = ray_trace_distance(
-                    mesh.filter_unmasked_indices_padded(temp_sk.mesh_index), mesh
-                )
-            elif shape_function == "cone":
-                rs = shape_diameter_function(
-                    mesh.filter_unmasked_indices_padded(temp_sk.mesh_index),
-                    mesh,
-                    num_points=30,
-                    cone_angle=np.pi / 3,
-                )
+            rs = vertex_radius(
+                mesh.filter_unmasked_indices_padded(temp_sk.mesh_index),
+                mesh,
+                shape_function=shape_function,
+            )
 
             soma_verts, soma_r = soma_via_branch_starts(
                 temp_sk,
@@ -217,10 +212,9 @@ def skeletonize_mesh(
 
     if compute_radius is True:
         if rs is None:
-            if shape_function == "single":
-                rs = ray_trace_distance(orig_skel_index[vert_filter], mesh)
-            elif shape_function == "cone":
-                rs = shape_diameter_function(orig_skel_index[vert_filter], mesh)
+            rs = vertex_radius(
+                orig_skel_index[vert_filter], mesh, shape_function=shape_function
+            )
         else:
             rs = rs[vert_filter]
         if collapse_soma is True and soma_pt is not None:
@@ -439,9 +433,7 @@ def skeletonize_components(
     """core skeletonization routine, used by :func:`meshparty.skeletonize.calculate_skeleton_paths_on_mesh`
     to calculate skeleton on all components of mesh, with no post processing"""
     # find all the connected components in the mesh
-    n_components, labels = sparse.csgraph.connected_components(
-        mesh.csgraph, directed=False, return_labels=True
-    )
+    n_components, labels = mesh.n_components, mesh.component_labels
     comp_labels, comp_counts = np.unique(labels, return_counts=True)
 
     if return_map:
@@ -1,6 +1,7 @@
 import collections
 import numpy as np
 import h5py
+import blosc
 from scipy import spatial, sparse
 from sklearn import decomposition
 try:
@@ -12,6 +13,9 @@ import networkx as nx
 import requests
 import time
 import re
+import json
+import queue
+import threading
 from collections import defaultdict
 import warnings
 import logging
@@ -28,9 +32,9 @@ except ImportError:
     from trimesh import io as exchange
 
 from pymeshfix import _meshfix
-from tqdm import trange
+from tqdm import tqdm, trange
 import DracoPy
-from meshparty import utils, trimesh_repair
+from meshparty import utils, trimesh_repair, bvh
 
 try:
     from caveclient import infoservice
@@ -66,7 +70,123 @@ def _get_cv_path_from_info(dataset_name, server_address=None, segmentation_type=
     return cv_path
 
 
-def read_mesh_h5(filename):
+MESH_H5_GZIP_VERSION = 1
+MESH_H5_RAW_VERSION = 2
+MESH_H5_BLOSC_VERSION = 3
+DEFAULT_MESH_H5_VERSION = MESH_H5_GZIP_VERSION
+
+# keeps every blosc block well below blosc's 2GB buffer limit
+BLOSC_CHUNK_BYTES = 2**28
+
+
+def _write_h5_array_gzip(f, name, data):
+    f.create_dataset(name, data=data, compression="gzip")
+
+
+def _write_h5_array_raw(f, name, data):
+    """Stores an array as a contiguous, uncompressed little-endian dataset
+    so that it can be memory-mapped straight from the file"""
+    data = np.ascontiguousarray(data)
+    data = data.astype(data.dtype.newbyteorder('<'), copy=False)
+    f.create_dataset(name, data=data)
+
+
+def _write_h5_array_blosc(f, name, data, cname="lz4"):
+    """Stores an array as blosc compressed blocks of at most BLOSC_CHUNK_BYTES"""
+    data = np.ascontiguousarray(data)
+    data = data.astype(data.dtype.newbyteorder('<'), copy=False)
+    itemsize = max(data.dtype.itemsize, 1)
+    chunk_items = BLOSC_CHUNK_BYTES // itemsize
+    address = data.__array_interface__['data'][0]
+
+    blocks = []
+    for start in range(0, data.size, chunk_items):
+        n_items = min(chunk_items, data.size - start)
+        blocks.append(blosc.compress_ptr(address + start * itemsize, n_items,
+                                         typesize=itemsize, cname=cname,
+                                         shuffle=blosc.SHUFFLE))
+    block_offsets = np.cumsum([0] + [len(b) for b in blocks])
+
+    dset = f.create_dataset(name, data=np.frombuffer(b"".join(blocks),
+                                                     dtype=np.uint8))
+    dset.attrs["dtype"] = data.dtype.str
+    dset.attrs["shape"] = data.shape
+    dset.attrs["block_offsets"] = block_offsets
+
+
+def _read_h5_array_default(f, name, filename, mmap=False):
+    return f[name][()]
+
+
+def _read_h5_array_raw(f, name, filename, mmap=False):
+    dset = f[name]
+    offset = dset.id.get_offset()
+    if not mmap or offset is None or dset.size == 0:
+        return dset[()]
+    return np.memmap(filename, mode="r", dtype=dset.dtype,
+                     offset=offset, shape=dset.shape)
+
+
+def _read_h5_array_blosc(f, name, filename, mmap=False):
+    dset = f[name]
+    blob = dset[()]
+    out = np.empty(tuple(dset.attrs["shape"]),
+                   dtype=np.dtype(dset.attrs["dtype"]))
+    address = out.__array_interface__['data'][0]
+    block_offsets = dset.attrs["block_offsets"]
+    written = 0
+    for start, stop in zip(block_offsets[:-1], block_offsets[1:]):
+        written += blosc.decompress_ptr(blob[start:stop].tobytes(),
+                                        address + written)
+    return out
+
+
+_write_h5_array_function = {MESH_H5_GZIP_VERSION: _write_h5_array_gzip,
+                            MESH_H5_RAW_VERSION: _write_h5_array_raw,
+                            MESH_H5_BLOSC_VERSION: _write_h5_array_blosc}
+_read_h5_array_function = {MESH_H5_GZIP_VERSION: _read_h5_array_default,
+                           MESH_H5_RAW_VERSION: _read_h5_array_raw,
+                           MESH_H5_BLOSC_VERSION: _read_h5_array_blosc}
+
+
+def _as_typed_array(values, dtype, n_cols=3):
+    """Wraps decoder output as a typed Kxn_cols array without intermediate copies.
+    Arrays of the right dtype are reshaped in place, python sequences are
+    read straight into a preallocated array of the target dtype."""
+    if isinstance(values, np.ndarray):
+        arr = values.astype(dtype, copy=False)
+    else:
+        arr = np.fromiter(values, dtype=dtype, count=len(values))
+    return arr.reshape(-1, n_cols)
+
+
+def _decode_draco_buffer(buf):
+    """Decodes a draco buffer into float32 vertices and uint32 faces"""
+    if hasattr(DracoPy, "decode"):
+        mesh_object = DracoPy.decode(buf)
+    else:
+        mesh_object = DracoPy.decode_buffer_to_mesh(buf)
+    vertices = _as_typed_array(mesh_object.points, np.float32)
+    faces = _as_typed_array(mesh_object.faces, np.uint32)
+    return vertices, faces
+
+
+def _encode_draco_buffer(vertices, faces):
+    """Encodes vertices and faces into a draco buffer
+
+    Vertex order is preserved where DracoPy supports it, so link_edges and
+    node_mask written next to the draco buffer keep pointing at the
+    right vertices.
+    """
+    if hasattr(DracoPy, "encode"):
+        return DracoPy.encode(np.asarray(vertices).reshape(-1, 3),
+                              np.asarray(faces).reshape(-1, 3),
+                              preserve_order=True)
+    return DracoPy.encode_mesh_to_buffer(np.asarray(vertices).flatten('C'),
+                                         np.asarray(faces).flatten('C'))
+
+
+def read_mesh_h5(filename, mmap=False, n_threads=None):
     """Reads a mesh's vertices, faces and normals from an hdf5 file
     assert's that this file exists.
     Will load normals, link_edges, and node_mask if they exist.
@@ -75,6 +195,14 @@ def read_mesh_h5(filename):
     ----------
     filename: str
         a path to a h5 file
+    mmap: bool
+        if True and the file was written with version MESH_H5_RAW_VERSION,
+        arrays are returned as read-only np.memmap views into the file
+        instead of being read into memory (default False)
+    n_threads: int or None
+        number of threads blosc uses to decompress files written with
+        version MESH_H5_BLOSC_VERSION, the process wide blosc setting is
+        restored after reading. None leaves the blosc setting as is.
 
     Returns
     -------
@@ -99,42 +227,89 @@ def read_mesh_h5(filename):
     """
     assert os.path.isfile(filename)
 
+    if n_threads is None:
+        return _read_mesh_h5(filename, mmap=mmap)
+
+    previous_n_threads = blosc.set_nthreads(n_threads)
+    try:
+        return _read_mesh_h5(filename, mmap=mmap)
+    finally:
+        blosc.set_nthreads(previous_n_threads)
+
+
+def _read_mesh_h5(filename, mmap=False):
+    """ Reads the arrays of a mesh h5 file, see :func:`read_mesh_h5` """
     with h5py.File(filename, "r") as f:
+        version = f.attrs.get("version", MESH_H5_GZIP_VERSION)
+        if version not in _read_h5_array_function:
+            raise ValueError(f"Unknown mesh file version {version}")
+
+        def _read(name):
+            return _read_h5_array_function[version](f, name, filename,
+                                                    mmap=mmap)
+
         if "draco" in f.keys():
-            mesh_object = DracoPy.decode_buffer_to_mesh(
-                f["draco"][()].tostring())
-            vertices = np.array(mesh_object.points).astype(np.float32)
-            if len(vertices.shape) == 1:
-                N = len(vertices)
-                vertices = vertices.reshape((N//3, 3))
-            faces = np.array(mesh_object.faces).astype(np.uint32)
+            vertices, faces = _decode_draco_buffer(f["draco"][()].tobytes())
         else:
-            vertices = f["vertices"][()]
-            faces = f["faces"][()]
+            vertices = _read("vertices")
+            faces = _read("faces")
 
         if len(faces.shape) == 1:
             faces = faces.reshape(-1, 3)
 
         if "normals" in f.keys():
-            normals = f["normals"][()]
+            normals = _read("normals")
         else:
             normals = None
 
         if "link_edges" in f.keys():
-            link_edges = f["link_edges"][()]
+            link_edges = _read("link_edges")
         else:
             link_edges = None
 
         if "node_mask" in f.keys():
-            node_mask = f["node_mask"][()]
+            node_mask = _read("node_mask")
         else:
             node_mask = None
     return vertices, faces, normals, link_edges, node_mask
 
 
+def _read_mesh_h5_thread(args):
+    """ Helper to read one mesh file in :func:`read_meshes_h5` """
+    filename, mmap = args
+    return read_mesh_h5(filename, mmap=mmap)
+
+
+def read_meshes_h5(filenames, n_threads=None, mmap=False):
+    """Reads many mesh h5 files in parallel threads, see :func:`read_mesh_h5`.
+    Useful to decode a directory of draco or blosc compressed cached meshes.
+
+    Parameters
+    ----------
+    filenames: list of str
+        paths to h5 mesh files
+    n_threads: int or None
+        how many threads to use, None uses one per cpu (default None)
+    mmap: bool
+        passed on to :func:`read_mesh_h5` (default False)
+
+    Returns
+    -------
+    list
+        a list with one (vertices, faces, normals, link_edges, node_mask)
+        tuple per filename, in the order of filenames
+    """
+    multi_args = [(filename, mmap) for filename in filenames]
+    return mu.multithread_func(_read_mesh_h5_thread, multi_args,
+                               n_threads=n_threads,
+                               debug=n_threads == 1)
+
+
 def write_mesh_h5(filename, vertices, faces,
                   normals=None, link_edges=None, node_mask=None,
-                  draco=False, overwrite=False):
+                  draco=False, overwrite=False,
+                  version=DEFAULT_MESH_H5_VERSION,
+                  csgraph=None, component_labels=None, vertex_radii=None):
     """Writes a mesh's vertices, faces (and normals) to an hdf5 file
 
     Parameters
@@ -156,8 +331,25 @@ def write_mesh_h5(filename, vertices, faces,
         None if this doesn't exist (default None)
     overwrite: False
         whether to overwrite the file, will return silently if mesh file exists already
+    version: int
+        storage layout of the arrays in the file.
+        MESH_H5_GZIP_VERSION (1) gzip compressed datasets,
+        MESH_H5_RAW_VERSION (2) uncompressed little-endian datasets that can be memory-mapped,
+        MESH_H5_BLOSC_VERSION (3) blosc/lz4 compressed blocks that decompress multi-threaded
+        (default DEFAULT_MESH_H5_VERSION)
+    csgraph: scipy.sparse matrix
+        a NxN mesh graph to store so it doesn't have to be rebuilt on load,
+        see :func:`read_mesh_h5_graph` (default None)
+    component_labels: np.array
+        a N long array of connected component labels of the mesh graph (default None)
+    vertex_radii: dict
+        N long arrays of per vertex radius estimates keyed by shape function,
+        see :func:`Mesh.vertex_radii` and :func:`read_mesh_h5_vertex_radii` (default None)
 
     """
+    if version not in _write_h5_array_function:
+        raise ValueError(
+            f"Version must be one of {list(_write_h5_array_function)}")
 
     if os.path.isfile(filename):
         if overwrite:
@@ -166,32 +358,146 @@ def write_mesh_h5(filename, vertices, faces,
             return
 
     with h5py.File(filename, "w") as f:
+        f.attrs["version"] = version
+        write_array = _write_h5_array_function[version]
         if draco:
 
-            buf = DracoPy.encode_mesh_to_buffer(vertices.flatten('C'),
-                                                faces.flatten('C'))
+            buf = _encode_draco_buffer(vertices, faces)
             f.create_dataset("draco", data=np.void(buf))
         else:
-            f.create_dataset("vertices", data=vertices, compression="gzip")
-            f.create_dataset("faces", data=faces, compression="gzip")
+            write_array(f, "vertices", vertices)
+            write_array(f, "faces", faces)
 
         if normals is not None:
-            f.create_dataset("normals", data=normals, compression="gzip")
+            write_array(f, "normals", normals)
 
         if link_edges is not None:
-            f.create_dataset("link_edges", data=link_edges, compression="gzip")
+            write_array(f, "link_edges", link_edges)
 
         if node_mask is not None:
-            f.create_dataset("node_mask", data=node_mask, compression="gzip")
+            write_array(f, "node_mask", node_mask)
+
+        if csgraph is not None:
+            csgraph = sparse.csr_matrix(csgraph)
+            write_array(f, "csgraph/indptr", csgraph.indptr)
+            write_array(f, "csgraph/indices", csgraph.indices)
+            write_array(f, "csgraph/weights", csgraph.data)
+            f["csgraph"].attrs["shape"] = csgraph.shape
+
+        if component_labels is not None:
+            write_array(f, "component_labels", component_labels)
+
+        if vertex_radii:
+            for shape_function, radii in vertex_radii.items():
+                write_array(f, f"vertex_radii/{shape_function}", radii)
+
+
+def read_mesh_h5_vertex_radii(filename):
+    """Reads the per vertex radius estimates that :func:`write_mesh_h5`
+    or :func:`write_mesh_h5_vertex_radii` store next to the mesh
+
+    Parameters
+    ----------
+    filename: str
+        a path to a h5 file
+
+    Returns
+    -------
+    dict
+        N long arrays of radius estimates keyed by shape function,
+        empty if none were stored
+    """
+    assert os.path.isfile(filename)
+
+    vertex_radii = {}
+    with h5py.File(filename, "r") as f:
+        version = f.attrs.get("version", MESH_H5_GZIP_VERSION)
+        if "vertex_radii" in f.keys():
+            for shape_function in f["vertex_radii"].keys():
+                vertex_radii[shape_function] = np.array(
+                    _read_h5_array_function[version](
+                        f, f"vertex_radii/{shape_function}", filename,
+                        mmap=False), dtype=np.float64)
+    return vertex_radii
+
+
+def write_mesh_h5_vertex_radii(filename, vertex_radii):
+    """Adds per vertex radius estimates to an existing mesh h5 file,
+    replacing the ones stored for the same shape functions
+
+    Parameters
+    ----------
+    filename: str
+        a path to a h5 file written by :func:`write_mesh_h5`
+    vertex_radii: dict
+        N long arrays of radius estimates keyed by shape function
+    """
+    assert os.path.isfile(filename)
+
+    with h5py.File(filename, "a") as f:
+        version = f.attrs.get("version", MESH_H5_GZIP_VERSION)
+        for shape_function, radii in vertex_radii.items():
+            name = f"vertex_radii/{shape_function}"
+            if name in f:
+                del f[name]
+            _write_h5_array_function[version](f, name, radii)
+
+
+def read_mesh_h5_graph(filename, mmap=False):
+    """Reads the mesh graph and connected component labels that
+    :func:`write_mesh_h5` optionally stores next to the mesh
+
+    Parameters
+    ----------
+    filename: str
+        a path to a h5 file
+    mmap: bool
+        whether to memory-map arrays if the file version allows it (default False)
+
+    Returns
+    -------
+    :obj:`scipy.sparse.csr_matrix`
+        csgraph, the NxN weighted mesh graph, None if it wasn't stored
+    :obj:`np.array`
+        component_labels, a N long array of connected component labels,
+        None if they weren't stored
+    """
+    assert os.path.isfile(filename)
+
+    with h5py.File(filename, "r") as f:
+        version = f.attrs.get("version", MESH_H5_GZIP_VERSION)
+
+        def _read(name):
+            return _read_h5_array_function[version](f, name, filename,
+                                                    mmap=mmap)
+
+        if "csgraph" in f.keys():
+            csgraph = sparse.csr_matrix((_read("csgraph/weights"),
+                                         _read("csgraph/indices"),
+                                         _read("csgraph/indptr")),
+                                        shape=tuple(f["csgraph"].attrs["shape"]),
+                                        copy=False)
+        else:
+            csgraph = None
+
+        if "component_labels" in f.keys():
+            component_labels = _read("component_labels")
+        else:
+            component_labels = None
+    return csgraph, component_labels
 
 
-def read_mesh(filename):
+def read_mesh(filename, mmap=False, n_threads=None):
     """Reads a mesh from obj or h5 file
 
     Parameters
     ----------
     filename: str
         a path to a obj or h5 file to read a mesh
+    mmap: bool
+        passed on to :func:`read_mesh_h5` for h5 files (default False)
+    n_threads: int or None
+        passed on to :func:`read_mesh_h5` for h5 files (default None)
 
     Returns
     -------
@@ -220,174 +526,217 @@ def read_mesh(filename):
         link_edges = None
         node_mask = None
     elif filename.endswith(".h5"):
-        mesh_data = read_mesh_h5(filename)
+        mesh_data = read_mesh_h5(filename, mmap=mmap, n_threads=n_threads)
         vertices, faces, normals, link_edges, node_mask = mesh_data
     else:
         raise Exception("Unknown filetype")
     return vertices, faces, normals, link_edges, node_mask
 
 
-def _download_meshes_thread_graphene(args):
-    """ Helper to Download meshes into target directory from graphene sources.
+DOWNLOAD_MANIFEST_NAME = "download_manifest.jsonl"
+
+
+def _mesh_file_ext(fmt):
+    """the file extension download_meshes uses for a given fmt"""
+    return "h5" if fmt == "hdf5" else fmt
+
+
+def _read_download_manifest(manifest_path):
+    """ Reads the records of a download manifest
+
     Parameters
     ----------
-    args : tuple
-        seg_ids : iterator of ids
-            the seg ids (with filenames = f"{seg_id}.h5") in the target_dir
-        cv_path: str
-            the cloudvolume path passed to cloudvolume.CloudVolume
-        target_dir: str
-            a path to the diretory to save the meshes
-        fmt: str
-            'hdf5', 'obj', 'stl' or any format supported by 'func':`write_to_file`
-        overwrite: bool
-            whether to overwrite the meshes if they already exist.
-            will do no work if those don't exist
-        merge_large_components: bool
-            whether to merge all the large components using 'func':trimesh_io.Mesh.merge_large_components
-            with default parameters (probably should be False)
-        stitch_mesh_chunks: bool
-            whether to stitch mesh chunks across meshes after downloading fragments (probably should be True)
-        map_gs_to_https: bool
-            whether to trigger cloudvolume.CloudVolume use_https option. Probably should be true unless you have
-            a private bucket and have ~/.cloudvolume/secrets setup properly
-        remove_duplicate_vertices: bool
-            whether to bluntly merge duplicate vertices (probably should be False)
-        chunk_size: tuple
-            size of chunks when deduplicating
-        save_draco: bool
-            whether to save meshes as draco compressed
-        progress: bool
-            show progress bars
+    manifest_path: str
+        path to a json lines manifest written by :func:`download_meshes`
 
-     """
-    seg_ids, cv_path, target_dir, fmt, overwrite, \
-        merge_large_components, stitch_mesh_chunks, map_gs_to_https, \
-        remove_duplicate_vertices, progress, chunk_size, save_draco = args
+    Returns
+    -------
+    dict
+        seg_id -> the last record written for that seg_id
+        (empty if the manifest does not exist)
+    """
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, "r") as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line truncated by an interrupted download
+                continue
+            records[int(record["seg_id"])] = record
+    return records
+
+
+def _fetch_cv_meshes(cv, seg_ids, graphene, remove_duplicate_vertices):
+    """ Fetches the vertices and faces of a batch of meshes from cloudvolume
+
+    Graphene sources are fetched one seg_id per request, precomputed
+    sources with a single request for the whole batch.
 
-    cv = cloudvolume.CloudVolume(cv_path, use_https=map_gs_to_https)
+    Returns
+    -------
+    dict
+        seg_id -> (vertices, faces), raises if any seg_id is missing
+    """
+    if graphene:
+        cv_meshes = {seg_id: cv.mesh.get(
+            seg_id, remove_duplicate_vertices=remove_duplicate_vertices)[seg_id]
+            for seg_id in seg_ids}
+    else:
+        cv_meshes = cv.mesh.get(
+            list(seg_ids), remove_duplicate_vertices=remove_duplicate_vertices,
+            fuse=False)
 
+    meshes = {}
     for seg_id in seg_ids:
-        print('downloading {}'.format(seg_id))
-        target_file = os.path.join(target_dir, f"{seg_id}.h5")
-        if not overwrite and os.path.exists(target_file):
-            print('file exists {}'.format(target_file))
-            continue
-        print('file does not exist {}'.format(target_file))
+        cv_mesh = cv_meshes[seg_id]
+        faces = np.array(cv_mesh.faces)
+        if len(faces.shape) == 1:
+            faces = faces.reshape(-1, 3)
+        meshes[seg_id] = (np.array(cv_mesh.vertices), faces)
+    return meshes
+
+
+def _fetch_cv_meshes_with_retries(get_cv, seg_ids, graphene,
+                                  remove_duplicate_vertices,
+                                  n_retries, retry_backoff):
+    """ Fetches a batch of meshes, retrying with exponential backoff
 
+    Returns
+    -------
+    dict or None
+        seg_id -> (vertices, faces), None if every try failed
+    int
+        the number of tries
+    str or None
+        the error of the last failed try
+    """
+    error = None
+    for i_try in range(n_retries + 1):
         try:
-            cv_mesh = cv.mesh.get(
-                seg_id, remove_duplicate_vertices=remove_duplicate_vertices)[seg_id]
-
-            faces = np.array(cv_mesh.faces)
-            if len(faces.shape) == 1:
-                faces = faces.reshape(-1, 3)
-
-            mesh = Mesh(vertices=cv_mesh.vertices,
-                        faces=faces,
-                        process=False)
-
-            if merge_large_components:
-                mesh.merge_large_components()
-
-            if fmt == "hdf5":
-                write_mesh_h5(f"{target_dir}/{seg_id}.h5",
-                              mesh.vertices,
-                              mesh.faces.flatten(),
-                              link_edges=mesh.link_edges,
-                              draco=save_draco,
-                              overwrite=overwrite)
-            else:
-                mesh.write_to_file(f"{target_dir}/{seg_id}.{fmt}")
+            meshes = _fetch_cv_meshes(get_cv(), seg_ids, graphene,
+                                      remove_duplicate_vertices)
         except Exception as e:
-            print(e)
+            error = repr(e)
+            if i_try < n_retries:
+                time.sleep(retry_backoff * 2 ** i_try)
+        else:
+            return meshes, i_try + 1, None
+    return None, n_retries + 1, error
 
 
-def _download_meshes_thread_precomputed(args):
-    """ Helper to Download meshes into target directory
+def _download_meshes_fetch_thread(args):
+    """ Fetch stage of :func:`download_meshes`
+
+    Pulls batches of seg_ids from the work queue until it sees None and
+    pushes (record, vertices, faces) for every seg_id onto the bounded
+    result queue, retrying failed fetches with exponential backoff.
+    A batch that keeps failing is retried one seg_id at a time, so a single
+    bad seg_id does not fail the rest of its batch. The thread always ends
+    by putting None on the result queue, also when it fails.
 
     Parameters
     ----------
     args : tuple
-        seg_ids : iterator of ids
-            the seg ids (with filenames = f"{seg_id}.h5") in the target_dir
+        work_queue: queue.Queue
+            lists of seg_ids to fetch, terminated by None
+        result_queue: queue.Queue
+            bounded queue the fetched meshes are put on
         cv_path: str
             the cloudvolume path passed to cloudvolume.CloudVolume
-        target_dir: str
-            a path to the diretory to save the meshes
-        fmt: str
-            'hdf5', 'obj', 'stl' or any format supported by 'func':`write_to_file`
-        overwrite: bool
-            whether to overwrite the meshes if they already exist.
-            will do no work if those don't exist
-        merge_large_components: bool
-            whether to merge all the large components using 'func':trimesh_io.Mesh.merge_large_components
-            with default parameters (probably should be False)
-        stitch_mesh_chunks: bool
-            whether to stitch mesh chunks across meshes after downloading fragments (probably should be True)
         map_gs_to_https: bool
-            whether to trigger cloudvolume.CloudVolume use_https option. Probably should be true unless you have
-            a private bucket and have ~/.cloudvolume/secrets setup properly
+            whether to trigger cloudvolume.CloudVolume use_https option
         remove_duplicate_vertices: bool
-            whether to bluntly merge duplicate vertices (probably should be False)
-        chunk_size: tuple
-            chuck size for deduplification
-        progress: bool
-            show progress bars
-     """
-    seg_ids, cv_path, target_dir, fmt, overwrite, \
-        merge_large_components, stitch_mesh_chunks, \
-        map_gs_to_https, remove_duplicate_vertices, \
-        progress, chunk_size, save_draco = args
-
-    cv = cloudvolume.CloudVolume(
-        cv_path, use_https=map_gs_to_https,
-        progress=progress,
-    )
-
-    download_segids = [
-        segid for segid in seg_ids
-        if overwrite or not os.path.exists(
-            os.path.join(target_dir, f"{segid}.h5")
-        )
-    ]
-
-    already_have = list(set(seg_ids).difference(set(download_segids)))
-
-    if not overwrite:
-        print("Already Have: " + str(already_have))
-
-    print("Downloading: " + str(download_segids))
-
-    while len(download_segids):
-        download_now = download_segids[:100]
-        download_segids = download_segids[len(download_now):]
+            whether to bluntly merge duplicate vertices
+        n_retries: int
+            how often a failed fetch is retried
+        retry_backoff: float
+            seconds to wait before the first retry, doubled on every retry
+    """
+    work_queue, result_queue, cv_path, map_gs_to_https, \
+        remove_duplicate_vertices, n_retries, retry_backoff = args
 
-        cv_meshes = cv.mesh.get(
-            download_now,
-            remove_duplicate_vertices=remove_duplicate_vertices,
-            fuse=False
-        )
-
-        for segid, cv_mesh in cv_meshes.items():
-            mesh = Mesh(
-                vertices=cv_mesh.vertices,
-                faces=cv_mesh.faces,
-                process=False,
-            )
-
-            if merge_large_components:
-                mesh.merge_large_components()
-
-            if fmt == "hdf5":
-                write_mesh_h5(f"{target_dir}/{segid}.h5",
-                              mesh.vertices,
-                              mesh.faces.flatten(),
-                              link_edges=mesh.link_edges,
-                              draco=save_draco,
-                              overwrite=overwrite)
+    graphene = re.search('^graphene://', cv_path) is not None
+    cvs = []
+
+    def get_cv():
+        if len(cvs) == 0:
+            cvs.append(cloudvolume.CloudVolume(cv_path,
+                                               use_https=map_gs_to_https,
+                                               progress=False))
+        return cvs[0]
+
+    def fetch(seg_ids):
+        time_start = time.time()
+        meshes, attempts, error = _fetch_cv_meshes_with_retries(
+            get_cv, seg_ids, graphene, remove_duplicate_vertices,
+            n_retries, retry_backoff)
+        return meshes, attempts, error, time.time() - time_start
+
+    try:
+        while True:
+            seg_ids = work_queue.get()
+            if seg_ids is None:
+                return
+
+            meshes, attempts, error, fetch_time = fetch(seg_ids)
+            if meshes is not None:
+                results = [(seg_id, meshes[seg_id], attempts, None, fetch_time)
+                           for seg_id in seg_ids]
+            elif len(seg_ids) == 1:
+                results = [(seg_ids[0], (None, None), attempts, error, fetch_time)]
             else:
-                mesh.write_to_file(f"{target_dir}/{segid}.{fmt}")
+                results = []
+                for seg_id in seg_ids:
+                    meshes, attempts, error, fetch_time = fetch([seg_id])
+                    mesh = (None, None) if meshes is None else meshes[seg_id]
+                    results.append((seg_id, mesh, attempts, error, fetch_time))
+
+            for seg_id, (vertices, faces), attempts, error, fetch_time in results:
+                record = {"seg_id": int(seg_id),
+                          "status": "failed" if vertices is None else "fetched",
+                          "attempts": attempts,
+                          "fetch_time": fetch_time}
+                if error is not None:
+                    record["error"] = error
+                result_queue.put((record, vertices, faces))
+    finally:
+        result_queue.put(None)
+
+
+def _download_meshes_write(record, vertices, faces, target_file, fmt,
+                           merge_large_components, save_draco):
+    """ Write stage of :func:`download_meshes`
+
+    The mesh is written next to target_file first and moved into place
+    once complete, so an interrupted download never leaves a partial file
+    that looks like a finished one.
+    """
+    time_start = time.time()
+    mesh = Mesh(vertices=vertices, faces=faces, process=False)
+
+    if merge_large_components:
+        mesh.merge_large_components()
+
+    base, ext = os.path.splitext(target_file)
+    temp_file = f"{base}.partial{ext}"
+    if fmt == "hdf5":
+        write_mesh_h5(temp_file,
+                      mesh.vertices,
+                      mesh.faces.flatten(),
+                      link_edges=mesh.link_edges,
+                      draco=save_draco,
+                      overwrite=True)
+    else:
+        mesh.write_to_file(temp_file)
+    os.replace(temp_file, target_file)
+
+    record["status"] = "done"
+    record["filename"] = target_file
+    record["n_vertices"] = int(len(mesh.vertices))
+    record["write_time"] = time.time() - time_start
 
 
 def download_meshes(seg_ids, target_dir, cv_path, overwrite=True,
@@ -398,9 +747,20 @@ def download_meshes(seg_ids, target_dir, cv_path, overwrite=True,
                     map_gs_to_https=True, fmt="hdf5",
                     save_draco=False,
                     chunk_size=None,
-                    progress=False):
+                    progress=False,
+                    n_retries=3,
+                    retry_backoff=1.0,
+                    resume=False,
+                    queue_size=None,
+                    batch_size=100):
     """ Downloads meshes in target directory (in parallel)
-    will break up the seg_ids into n_threads*3 job blocks or fewer and download them all
+
+    Downloading is pipelined: n_threads fetch threads download meshes
+    from cloudvolume and hand them over a bounded queue to a single
+    stage that builds and writes the mesh files, so network and
+    compression/writing overlap. Every finished or failed seg_id is
+    appended to a json lines manifest (DOWNLOAD_MANIFEST_NAME) in
+    target_dir, which is used to resume an interrupted download.
 
     Parameters
     ----------
@@ -411,12 +771,12 @@ def download_meshes(seg_ids, target_dir, cv_path, overwrite=True,
     cv_path: str
         the cloudvolume path passed to cloudvolume.CloudVolume
     n_threads: int
-        how many parallel processes to use when downloading (default 1)
+        how many parallel threads to use when downloading (default 1)
     overwrite: bool
         whether to overwrite the meshes if they already exist.
         will do no work if those don't exist (default True)
     stitch_mesh_chunks: bool
-        whether to stitch mesh chunks across meshes after downloading fragments (default True)
+        deprecated and ignored, meshes are never stitched across chunks (default True)
     merge_large_components: bool
         whether to merge all the large components using 'func':trimesh_io.Mesh.merge_large_components
         with default parameters (default False)
@@ -426,42 +786,163 @@ def download_meshes(seg_ids, target_dir, cv_path, overwrite=True,
         whether to trigger cloudvolume.CloudVolume use_https option. Probably should be true unless you have
         a private bucket and have ~/.cloudvolume/secrets setup properly (default True)
     chunk_size: np.array
-        chunk size in nm to use in deduplification (default None)
+        deprecated and ignored (default None)
     fmt: str
         'hdf5', 'obj', 'stl' or any format supported by :func:`meshparty.trimesh_io.Mesh.write_to_file` (default 'hdf5')
     progress: bool
+        show a progress bar (default False)
+    n_retries: int
+        how often a failed download is retried before it is recorded as failed (default 3)
+    retry_backoff: float
+        seconds to wait before the first retry, doubled on every further retry (default 1.0)
+    resume: bool
+        if True, seg_ids the manifest records as done are skipped even if overwrite is True (default False)
+    queue_size: int or None
+        maximum number of downloaded meshes waiting to be written
+        (default None uses 2 * n_threads)
+    batch_size: int
+        number of seg_ids fetched per request from precomputed sources,
+        graphene sources are fetched one seg_id per request (default 100)
+
+    Returns
+    -------
+    list of dict
+        one record per seg_id with keys seg_id, status ('done', 'skipped' or 'failed'),
+        attempts, fetch_time, write_time, filename and error (for failures)
     """
+    if stitch_mesh_chunks is not True or chunk_size is not None:
+        warnings.warn(
+            "stitch_mesh_chunks and chunk_size are deprecated and ignored by download_meshes",
+            DeprecationWarning)
 
-    if n_threads > 1:
-        n_jobs = n_threads * 3
-    else:
-        n_jobs = 1
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
 
-    if len(seg_ids) < n_jobs:
-        n_jobs = len(seg_ids)
+    n_threads = max(int(n_threads), 1)
+    if queue_size is None:
+        queue_size = 2 * n_threads
+
+    ext = _mesh_file_ext(fmt)
+    manifest_path = os.path.join(target_dir, DOWNLOAD_MANIFEST_NAME)
+    manifest = _read_download_manifest(manifest_path)
+
+    records = []
+    download_ids = []
+    for seg_id in seg_ids:
+        seg_id = int(seg_id)
+        target_file = os.path.join(target_dir, f"{seg_id}.{ext}")
+        done_before = manifest.get(seg_id, {}).get("status") == "done"
+        if os.path.exists(target_file) and \
+                (not overwrite or (resume and done_before)):
+            records.append({"seg_id": seg_id, "status": "skipped",
+                            "filename": target_file})
+            continue
+        download_ids.append(seg_id)
+
+    n_download = len(download_ids)
+    if verbose:
+        logging.info(f"Downloading {n_download} meshes, "
+                     f"skipping {len(records)}")
+    if n_download == 0:
+        return records
 
-    # Use the cv path to establish if the source is graphene or not.
     if re.search('^graphene://', cv_path) is not None:
-        _download_meshes_thread = _download_meshes_thread_graphene
-    else:
-        _download_meshes_thread = _download_meshes_thread_precomputed
+        batch_size = 1
+    batch_size = max(int(batch_size), 1)
+    work_queue = queue.Queue()
+    for i_start in range(0, n_download, batch_size):
+        work_queue.put(download_ids[i_start: i_start + batch_size])
+    n_threads = min(n_threads, work_queue.qsize())
+    for _ in range(n_threads):
+        work_queue.put(None)
+
+    result_queue = queue.Queue(maxsize=queue_size)
+    fetch_args = (work_queue, result_queue, cv_path, map_gs_to_https,
+                  remove_duplicate_vertices, n_retries, retry_backoff)
+    threads = [threading.Thread(target=_download_meshes_fetch_thread,
+                                args=(fetch_args,), daemon=True)
+               for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+
+    with open(manifest_path, "a") as manifest_fp, \
+            tqdm(total=n_download, disable=not progress) as pbar:
+        n_finished_threads = 0
+        while n_finished_threads < n_threads:
+            item = result_queue.get()
+            if item is None:
+                n_finished_threads += 1
+                continue
+
+            record, vertices, faces = item
+            if vertices is not None:
+                target_file = os.path.join(target_dir,
+                                           f"{record['seg_id']}.{ext}")
+                try:
+                    _download_meshes_write(record, vertices, faces,
+                                           target_file, fmt,
+                                           merge_large_components,
+                                           save_draco)
+                except Exception as e:
+                    record["status"] = "failed"
+                    record["error"] = repr(e)
+
+            if record["status"] == "failed":
+                logging.warning(f"Failed to download {record['seg_id']}: "
+                                f"{record['error']}")
+            elif verbose:
+                logging.info(f"Downloaded {record['seg_id']} in "
+                             f"{record['fetch_time']:.3f}s (fetch) + "
+                             f"{record['write_time']:.3f}s (write)")
+
+            manifest_fp.write(json.dumps(record) + "\n")
+            manifest_fp.flush()
+            records.append(record)
+            pbar.update(1)
+
+    for thread in threads:
+        thread.join()
+
+    return records
+
+
+def _pc_align_batch(vertices, pc_norm=False):
+    """ Projects a batch of point clouds onto their principal components
+
+    Equivalent to sklearn.decomposition.PCA(n_components=3).fit_transform
+    on every point cloud, computed with one batched SVD.
 
-    seg_id_blocks = np.array_split(seg_ids, n_jobs)
+    Parameters
+    ----------
+    vertices: np.array
+        a K x n_points x 3 array of point clouds
+    pc_norm: bool
+        if True: normalize every point cloud to std 1 before PCA (default False)
 
-    multi_args = []
-    for seg_id_block in seg_id_blocks:
-        multi_args.append([seg_id_block, cv_path, target_dir, fmt,
-                           overwrite, merge_large_components, stitch_mesh_chunks,
-                           map_gs_to_https, remove_duplicate_vertices, progress, chunk_size, save_draco])
+    Returns
+    -------
+    np.array
+        K x n_points x 3 array of aligned point clouds
+    """
+    vertices = vertices - vertices.mean(axis=1, keepdims=True)
+    if pc_norm:
+        vertices /= vertices.std(axis=1, keepdims=True)
+
+    _, _, vh = np.linalg.svd(vertices, full_matrices=False)
+    # deterministic signs: the largest loading of each component is positive
+    max_inds = np.argmax(np.abs(vh), axis=2)
+    signs = np.sign(np.take_along_axis(vh, max_inds[..., None], axis=2))
+    vh *= signs
+    return np.matmul(vertices, np.swapaxes(vh, 1, 2))
 
-    if n_jobs == 1:
-        mu.multiprocess_func(_download_meshes_thread,
-                             multi_args, debug=True,
-                             verbose=verbose, n_threads=n_threads)
-    else:
-        mu.multisubprocess_func(_download_meshes_thread,
-                                multi_args, n_threads=n_threads,
-                                package_name="meshparty", n_retries=40)
+
+def _fix_mesh_thread(args):
+    """ Helper to fix a local mesh in a separate process """
+    vertices, faces = args
+    mesh = Mesh(vertices=vertices, faces=faces)
+    if mesh.n_vertices > 0:
+        mesh.fix_mesh(wiggle_vertices=False)
+    return mesh.vertices, mesh.faces
 
 
 class MeshMeta(object):
@@ -487,10 +968,23 @@ class MeshMeta(object):
             whether to change gs paths to https paths, via cloudvolume's use_https option
         voxel_scaling: 3x1 numeric
             Allows a post-facto multiplicative scaling of vertex locations. These values are NOT saved, just used for analysis and visualization.
+        disk_cache_version: int
+            file version used when writing meshes to disk_cache_path, see :func:`write_mesh_h5`
+            (default DEFAULT_MESH_H5_VERSION)
+        mmap: bool
+            whether to memory-map meshes read from disk if their file version allows it,
+            see :func:`read_mesh_h5` (default False)
+        n_threads: int or None
+            number of decompression threads for blosc compressed mesh files (default None)
+        cache_graph: bool
+            whether to store the mesh csgraph and component labels in the disk cache
+            so they are not rebuilt when the mesh is loaded again (default False)
         """
 
     def __init__(self, cache_size=400, cv_path=None, dataset_name=None, server_address=None, segmentation_type='graphene',
-                 disk_cache_path=None, map_gs_to_https=True, voxel_scaling=None):
+                 disk_cache_path=None, map_gs_to_https=True, voxel_scaling=None,
+                 disk_cache_version=DEFAULT_MESH_H5_VERSION, mmap=False, n_threads=None,
+                 cache_graph=False):
 
         self._mesh_cache = {}
         self._cache_size = cache_size
@@ -502,6 +996,10 @@ class MeshMeta(object):
         self._map_gs_to_https = map_gs_to_https
         self._disk_cache_path = disk_cache_path
         self._voxel_scaling = voxel_scaling
+        self._disk_cache_version = disk_cache_version
+        self._mmap = mmap
+        self._n_threads = n_threads
+        self._cache_graph = cache_graph
 
         if self.disk_cache_path is not None:
             if not os.path.exists(self.disk_cache_path):
@@ -522,6 +1020,18 @@ class MeshMeta(object):
         """str: the path where meshes are saved"""
         return self._disk_cache_path
 
+    @property
+    def link_edges_cache_path(self):
+        """str: the path where link edges computed from merge logs are saved"""
+        if self.disk_cache_path is None:
+            return None
+        return os.path.join(self.disk_cache_path, "link_edges")
+
+    @property
+    def disk_cache_version(self):
+        """int: the file version meshes are written to the disk cache with"""
+        return self._disk_cache_version
+
     @property
     def cv(self):
         """ cloudvoume.CloudVolume : the cloudvolume object"""
@@ -553,6 +1063,27 @@ class MeshMeta(object):
         else:
             return "%s/%d.h5" % (self.disk_cache_path, seg_id)
 
+    def add_link_edges(self, mesh, seg_id=None, merge_log=None, **kwargs):
+        """ Adds link edges from a merge log to a mesh, cached on disk
+
+        Link edges are cached in link_edges_cache_path keyed by seg_id,
+        mesh and merge log, so repeated calls for the same root id
+        skip the repair computation.
+
+        Parameters
+        ----------
+        mesh: :obj:`Mesh`
+            the mesh to add link edges to
+        seg_id: int or None
+            the seg_id of the mesh (default None)
+        merge_log: dict or None
+            a merge log, if None it is queried for seg_id (default None)
+        **kwargs
+            passed to :func:`Mesh.add_link_edges`
+        """
+        mesh.add_link_edges(seg_id=seg_id, merge_log=merge_log,
+                            cache_path=self.link_edges_cache_path, **kwargs)
+
     def mesh(self, filename=None, seg_id=None, cache_mesh=True,
              merge_large_components=False,
              stitch_mesh_chunks=True,
@@ -607,7 +1138,8 @@ class MeshMeta(object):
             if filename is not None, and seg_id and cv_path are not both set
             then it doesn't know how to get your mesh
         """
-        if not isinstance(self.cv.mesh, ShardedMultiLevelPrecomputedMeshSource):
+        if self.cv is None or \
+                not isinstance(self.cv.mesh, ShardedMultiLevelPrecomputedMeshSource):
             lod = None
 
         if voxel_scaling == 'default':
@@ -615,10 +1147,15 @@ class MeshMeta(object):
 
         if filename is not None:
             if filename not in self._mesh_cache:
-                mesh_data = read_mesh(filename)
+                mesh_data = read_mesh(filename, mmap=self._mmap,
+                                      n_threads=self._n_threads)
                 vertices, faces, normals, link_edges, node_mask = mesh_data
                 mesh = Mesh(vertices=vertices, faces=faces, normals=normals,
                             link_edges=link_edges, node_mask=node_mask)
+                if filename.endswith(".h5"):
+                    mesh.set_graph_file(filename)
+                    mesh.vertex_radii.update(
+                        read_mesh_h5_vertex_radii(filename))
 
                 if cache_mesh and len(self._mesh_cache) < self.cache_size:
                     self._mesh_cache[filename] = mesh
@@ -627,7 +1164,9 @@ class MeshMeta(object):
 
             if self.disk_cache_path is not None and \
                     overwrite_merge_large_components:
-                mesh.write_to_file(self._filename(seg_id, lod=lod))
+                mesh.write_to_file(self._filename(seg_id, lod=lod),
+                                   version=self.disk_cache_version,
+                                   save_graph=self._cache_graph)
         else:
             if self.disk_cache_path is not None and force_download is False:
                 if os.path.exists(self._filename(seg_id, lod=lod)):
@@ -662,7 +1201,9 @@ class MeshMeta(object):
 
                 if self.disk_cache_path is not None:
                     mesh.write_to_file(self._filename(
-                        seg_id, lod=lod), overwrite=force_download)
+                        seg_id, lod=lod), overwrite=force_download,
+                        version=self.disk_cache_version,
+                        save_graph=self._cache_graph)
             else:
                 mesh = self._mesh_cache[seg_id]
 
@@ -755,6 +1296,10 @@ class Mesh(trimesh.Trimesh):
 
         self._voxel_scaling = None
         self._MeshIndex = None
+        self._graph_file = None
+        self._graph_file_keys = None
+        self._vertex_radii = {}
+        self._stashed_vertex_radii = {}
 
         super(Mesh, self).__init__(*new_args, **kwargs)
         if apply_mask:
@@ -782,8 +1327,10 @@ class Mesh(trimesh.Trimesh):
             def wrapper(self, *args, **kwargs):
                 original_scaling = self.voxel_scaling
                 self.voxel_scaling = None
-                func(self, *args, **kwargs)
-                self.voxel_scaling = original_scaling
+                try:
+                    func(self, *args, **kwargs)
+                finally:
+                    self.voxel_scaling = original_scaling
             return wrapper
 
     @property
@@ -809,6 +1356,7 @@ class Mesh(trimesh.Trimesh):
         new_scale : 3-element vector 
             Sets the new xyz scale relative to the resolution from the mesh source
         """
+        old_scaling = self.voxel_scaling
         if self.voxel_scaling is not None:
             self.vertices = self.vertices * self.inverse_voxel_scaling
 
@@ -818,12 +1366,63 @@ class Mesh(trimesh.Trimesh):
         else:
             self._voxel_scaling = None
 
+        self._rescale_vertex_radii(old_scaling, self._voxel_scaling)
         self._clear_extra_cached_vertex_keys()
 
+    def _rescale_vertex_radii(self, old_scaling, new_scaling):
+        """Carries the vertex radii over a change of the voxel scaling
+
+        Radii are multiplied along with isotropic scale changes. Radii that
+        cannot be rescaled are kept aside by their voxel scaling and restored
+        once the scaling is an isotropic multiple of it again.
+        """
+        def scale(scaling):
+            return np.ones(3) if scaling is None else np.asarray(scaling)
+
+        if len(self._vertex_radii) > 0:
+            key = None if old_scaling is None else tuple(old_scaling)
+            self._stashed_vertex_radii[key] = self._vertex_radii
+        self._vertex_radii = {}
+
+        for key in list(self._stashed_vertex_radii.keys()):
+            ratio = scale(new_scaling) / scale(key)
+            if not np.allclose(ratio, ratio[0]):
+                continue
+            self._vertex_radii = self._stashed_vertex_radii.pop(key)
+            if ratio[0] != 1:
+                for shape_function, radii in self._vertex_radii.items():
+                    # -1 marks radii that were not computed yet
+                    self._vertex_radii[shape_function] = np.where(
+                        radii < 0, radii, radii * ratio[0])
+            break
+
     def _clear_extra_cached_vertex_keys(self, keys=['nxgraph', 'csgraph', 'pykdtree', 'kdtree']):
         for k in keys:
             self._cache.delete(k)
 
+    @property
+    def vertex_radii(self):
+        """dict : per vertex radius estimates keyed by shape function, -1 where not yet computed,
+        see :func:`meshparty.ray_tracing.vertex_radius`. Rescaled along with isotropic changes
+        of the voxel scaling, and set aside for other changes until the scaling is restored."""
+        return self._vertex_radii
+
+    @ScalingManagement.original_scaling
+    def write_vertex_radii(self, filename=None):
+        """ Stores the per vertex radius estimates in a mesh h5 file, see :func:`write_mesh_h5_vertex_radii`
+
+        Parameters
+        ----------
+        filename: str or None
+            a path to a h5 file written from this mesh,
+            None uses the file the mesh was loaded from (default None)
+        """
+        if filename is None:
+            filename = self._graph_file
+        if filename is None:
+            raise ValueError('No filename given and the mesh was not loaded from a h5 file')
+        write_mesh_h5_vertex_radii(filename, self.vertex_radii)
+
     @property
     def link_edges(self):
         """numpy.array : a Kx2 set of extra edges you want to store in the mesh graph,
@@ -859,23 +1458,110 @@ class Mesh(trimesh.Trimesh):
                                    'edges',
                                    'edges_face',
                                    'edges_unique',
-                                   'edges_unique_length'])
+                                   'edges_unique_length',
+                                   'kdtree',
+                                   'pykdtree',
+                                   'ray_bvh',
+                                   '_face_incidence'])
+
+    def append_link_edges(self, new_edges):
+        """ Adds link edges and updates the cached graphs in place
+
+        Unlike setting link_edges, cached graph_edges, csgraph, component_labels
+        and nxgraph are extended by the new edges instead of being rebuilt
+        from the face edges.
+
+        Parameters
+        ----------
+        new_edges: np.array
+            a Kx2 array of vertex indices to link
+        """
+        new_edges = np.asarray(new_edges, dtype=np.int64).reshape(-1, 2)
+        if len(new_edges) == 0:
+            return
+
+        graph_edges = self._cache['graph_edges']
+        unique_graph_edges = self._cache['unique_graph_edges']
+        csgraph = self._cache['csgraph']
+        component_labels = self._cache['component_labels']
+        nxgraph = self._cache['nxgraph']
+
+        self.link_edges = np.vstack([self.link_edges, new_edges])
+
+        new_edges_sym = np.vstack([new_edges, new_edges[:, [1, 0]]])
+        updates = {}
+        if graph_edges is not None:
+            updates['graph_edges'] = np.vstack([graph_edges, new_edges_sym])
+        if unique_graph_edges is not None or csgraph is not None:
+            # only edges that are not in the graph yet get an entry
+            new_unique = utils.unique_edges(new_edges)
+            if unique_graph_edges is not None:
+                new_unique = new_unique[~utils.edges_in(new_unique,
+                                                        unique_graph_edges)]
+                updates['unique_graph_edges'] = np.vstack([unique_graph_edges,
+                                                           new_unique])
+            elif len(new_unique) > 0:
+                new_unique = new_unique[np.asarray(
+                    csgraph[new_unique[:, 0], new_unique[:, 1]]).ravel() == 0]
+            if csgraph is not None:
+                updates['csgraph'] = csgraph + utils.create_csgraph(
+                    self.vertices, new_unique, euclidean_weight=True,
+                    directed=False)
+        if component_labels is not None:
+            updates['component_labels'] = utils.merge_component_labels(
+                component_labels, new_edges)
+        if nxgraph is not None:
+            weights = np.linalg.norm(self.vertices[new_edges[:, 0]] -
+                                     self.vertices[new_edges[:, 1]], axis=1)
+            nxgraph.add_weighted_edges_from(
+                zip(new_edges[:, 0].tolist(), new_edges[:, 1].tolist(),
+                    weights.astype(np.float32).tolist()))
+            updates['nxgraph'] = nxgraph
+        self._cache.update(updates)
 
     @caching.cache_decorator
     def nxgraph(self):
         """:class:`networkx.Graph` : networkx graph of the mesh"""
         return self._create_nxgraph()
 
+    @property
+    def nxgraph_view(self):
+        """:class:`meshparty.utils.CSGraphView` : read-only networkx view of
+        the csgraph that does not build networkx's edge dictionaries"""
+        return utils.CSGraphView(self.csgraph)
+
     @caching.cache_decorator
     def csgraph(self):
         """:mod:`scipy.sparse.csgraph` : graph of the mesh"""
         return self._create_csgraph()
 
+    @caching.cache_decorator
+    def component_labels(self):
+        """np.array : connected component label of each vertex in the mesh graph"""
+        return self._create_component_labels()
+
+    @property
+    def n_components(self):
+        """int : how many connected components the mesh graph has"""
+        if self.n_vertices == 0:
+            return 0
+        return int(np.max(self.component_labels)) + 1
+
     @caching.cache_decorator
     def pykdtree(self):
         """pykdtree.KDTree : KDTree of the mesh vertices"""
         return KDTree(self.vertices)
 
+    @caching.cache_decorator
+    def ray_bvh(self):
+        """meshparty.bvh.BVHRayMeshIntersector : ray intersector over a bounding volume hierarchy of the faces"""
+        return bvh.BVHRayMeshIntersector(self)
+
+    @caching.cache_decorator
+    def _face_incidence(self):
+        """tuple : faces grouped by their first vertex, see :func:`meshparty.utils.shape_incidence`"""
+        return utils.shape_incidence(self.faces, self.n_vertices)
+
     @caching.cache_decorator
     def kdtree(self, balanced_tree=False):
         """scipy.spatial.cKDTree : kdtree of the mesh vertices
@@ -900,13 +1586,18 @@ class Mesh(trimesh.Trimesh):
     @caching.cache_decorator
     def graph_edges(self):
         # mesh.edges has bidirectional edges, so we need to pass bidirectional link_edges.
-        if len(self.link_edges) > 0:
-            link_edges_sym = np.vstack(
-                (self.link_edges, self.link_edges[:, [1, 0]]))
-            link_edges_sym_unique = np.unique(link_edges_sym, axis=1)
-        else:
-            link_edges_sym_unique = self.link_edges
-        return np.vstack([self.edges, link_edges_sym_unique])
+        link_edges_sym = np.vstack(
+            (self.link_edges, self.link_edges[:, [1, 0]]))
+        return np.vstack([self.edges, link_edges_sym])
+
+    @caching.cache_decorator
+    def unique_graph_edges(self):
+        """np.array : Kx2 undirected edges of the mesh graph, face edges and
+        link edges, each listed once with the lower vertex index first"""
+        if len(self.link_edges) == 0:
+            return self.edges_unique
+        return utils.unique_edges(np.vstack([self.edges_unique,
+                                             self.link_edges]))
 
     def fix_mesh(self, wiggle_vertices=False, verbose=False):
         """ Executes rudimentary fixing function from pymeshfix
@@ -961,7 +1652,8 @@ class Mesh(trimesh.Trimesh):
                         svd_solver="auto",
                         return_faces=False,
                         adapt_unit_sphere_norm=False,
-                        pc_norm=False):
+                        pc_norm=False,
+                        random_state=None):
         """ Extracts a local view (points)
 
         Parameters
@@ -998,6 +1690,9 @@ class Mesh(trimesh.Trimesh):
             NOT FUNCTIONAL (default False)
         pc_norm: bool
             if True: normalize point cloud to mean 0 and std 1 before PCA (default False)
+        random_state: int, np.random.Generator or None
+            seed or generator for choosing random centers and subsampling points,
+            None uses the global numpy random state (default None)
 
         Returns
         -------
@@ -1013,11 +1708,16 @@ class Mesh(trimesh.Trimesh):
             return_faces, Optional depending on return_faces. faces on the local views, a K list of mx3 triangle faces. 
 
         """
+        if random_state is None:
+            rng = np.random
+        else:
+            rng = np.random.default_rng(random_state)
+
         if center_node_ids is None and center_coords is None:
-            center_node_ids = np.array([np.random.randint(len(self.vertices))])
+            center_node_ids = np.array([rng.choice(len(self.vertices))])
 
         if center_coords is None:
-            center_node_ids = np.array(center_node_ids, dtype=np.int)
+            center_node_ids = np.array(center_node_ids, dtype=int)
             center_coords = self.vertices[center_node_ids]
 
         if sample_n_points is None:
@@ -1037,28 +1737,30 @@ class Mesh(trimesh.Trimesh):
             sample_n_points = np.min([sample_n_points, len(self.vertices)])
 
         dists, node_ids = self.kdtree.query(center_coords, sample_n_points,
-                                            distance_upper_bound=max_dist)
+                                            distance_upper_bound=max_dist,
+                                            workers=-1)
+        dists = dists.reshape(len(center_coords), -1)
+        node_ids = node_ids.reshape(len(center_coords), -1)
 
         if n_points is not None:
             if sample_n_points > n_points:
                 if fisheye:
-                    probs = 1 / dists
-
-                    new_dists = []
-                    new_node_ids = []
-                    ids = np.arange(0, sample_n_points, dtype=np.int)
-                    for i_sample in range(len(center_coords)):
-                        sample_ids = np.random.choice(ids, n_points,
-                                                      replace=False,
-                                                      p=probs[i_sample])
-                        new_dists.append(dists[i_sample, sample_ids])
-                        new_node_ids.append(node_ids[i_sample, sample_ids])
-
-                    dists = np.array(new_dists, dtype=np.float32)
-                    node_ids = np.array(new_node_ids, dtype=np.int)
+                    # Gumbel-top-k: sampling without replacement with
+                    # probabilities proportional to 1 / dists for all views
+                    with np.errstate(divide='ignore'):
+                        log_probs = -np.log(dists)
+                    gumbel = -np.log(-np.log(
+                        rng.uniform(size=dists.shape)))
+                    sample_ids = np.argpartition(-(log_probs + gumbel),
+                                                 n_points - 1,
+                                                 axis=1)[:, :n_points]
+
+                    dists = np.take_along_axis(
+                        dists, sample_ids, axis=1).astype(np.float32)
+                    node_ids = np.take_along_axis(node_ids, sample_ids, axis=1)
                 else:
-                    ids = np.arange(0, sample_n_points, dtype=np.int)
-                    sample_ids = np.random.choice(ids, n_points, replace=False)
+                    sample_ids = rng.choice(sample_n_points, n_points,
+                                            replace=False)
 
                     dists = dists[:, sample_ids]
                     node_ids = node_ids[:, sample_ids]
@@ -1080,10 +1782,15 @@ class Mesh(trimesh.Trimesh):
             local_vertices = self.vertices[node_ids].copy()
 
         if pc_align:
-            for i_lv in range(len(local_vertices)):
-                local_vertices[i_lv] = self._calc_pc_align(local_vertices[i_lv],
-                                                           svd_solver,
-                                                           pc_norm=pc_norm)
+            if svd_solver in ["auto", "full"] and \
+                    isinstance(local_vertices, np.ndarray):
+                local_vertices = _pc_align_batch(local_vertices,
+                                                 pc_norm=pc_norm)
+            else:
+                for i_lv in range(len(local_vertices)):
+                    local_vertices[i_lv] = self._calc_pc_align(local_vertices[i_lv],
+                                                               svd_solver,
+                                                               pc_norm=pc_norm)
 
         if adapt_unit_sphere_norm:
             local_vertices -= center_coords
@@ -1146,7 +1853,10 @@ class Mesh(trimesh.Trimesh):
         np.array 
             a Kx3 matrix that is a proper faces for a mesh whose vertices = mesh.vertices[node_ids]
         """
-        return utils.filter_shapes(node_ids, self.faces)
+        if len(node_ids) > 0 and np.ndim(node_ids[0]) == 0:
+            node_ids = [node_ids]
+        return utils.filter_shapes_batch(node_ids, self.faces,
+                                         incidence=self._face_incidence)
 
     def _filter_graph_edges(self, node_ids):
         """ method to return reindexed edges that involve only certain vertices
@@ -1167,7 +1877,8 @@ class Mesh(trimesh.Trimesh):
 
     @ScalingManagement.original_scaling
     def add_link_edges(self, seg_id=None, merge_log=None, datastack_name=None, server_address=None,
-                       close_map_distance=300, client=None, verbose=False, base_resolution=None):
+                       close_map_distance=300, client=None, verbose=False, base_resolution=None,
+                       cache_path=None):
         """ add a set of link edges to this mesh from a PyChunkedGraph endpoint
         This will ask the pcg server where merges were done and try to calculate 
         where edges should be added to reflect the merge operations that have been done
@@ -1195,6 +1906,10 @@ class Mesh(trimesh.Trimesh):
             If True, provides more debugging statements, default is False
         base_resolution : array-like or None, optional
             Resolution of the supervoxel segmentation at its lowest mip.
+        cache_path : str or None, optional
+            Directory to cache the computed link edges in, keyed by seg_id, mesh and merge log.
+            If the same mesh and merge log were processed before, the link edges are read
+            from there instead. Defaults to None, no caching.
         """
         if seg_id is None and merge_log is None:
             raise ValueError(
@@ -1205,20 +1920,23 @@ class Mesh(trimesh.Trimesh):
                                                         merge_log=merge_log,
                                                         base_resolution=base_resolution,
                                                         close_map_distance=close_map_distance,
-                                                        verbose=verbose)
+                                                        verbose=verbose,
+                                                        cache_path=cache_path,
+                                                        seg_id=seg_id)
         else:
             # Use the get_link_edges approach
             link_edges = trimesh_repair.get_link_edges(self, seg_id, datastack_name=datastack_name,
                                                        close_map_distance=close_map_distance,
                                                        server_address=server_address,
                                                        verbose=verbose,
-                                                       client=client)
+                                                       client=client,
+                                                       cache_path=cache_path)
 
-        self.link_edges = np.vstack([self.link_edges, link_edges])
+        self.append_link_edges(link_edges)
 
     def get_local_meshes(self, n_points, max_dist=np.inf, center_node_ids=None,
                          center_coords=None, pc_align=False, pc_norm=False,
-                         fix_meshes=False):
+                         fix_meshes=False, return_packed=False, n_threads=1):
         """ Extracts a local mesh
 
         Parameters
@@ -1230,23 +1948,52 @@ class Mesh(trimesh.Trimesh):
         pc_align: bool
         pc_norm: bool
         fix_meshes: bool
+        return_packed: bool
+            if True, return packed arrays instead of Mesh objects (default False)
+        n_threads: int
+            number of processes used to fix meshes (default 1)
+
+        Returns
+        -------
+        list of :obj:`Mesh`
+            the local meshes. If return_packed, instead a tuple of
+            vertices (Nx3), vertex_offsets (K+1), faces (Mx3) and face_offsets (K+1),
+            where the faces of mesh i are faces[face_offsets[i]:face_offsets[i+1]]
+            indexing into vertices[vertex_offsets[i]:vertex_offsets[i+1]]
         """
         local_view_tuple = self.get_local_views(n_points=n_points,
                                                 max_dist=max_dist,
                                                 center_node_ids=center_node_ids,
                                                 center_coords=center_coords,
-                                                return_faces=True,
+                                                return_node_ids=True,
                                                 pc_align=pc_align,
                                                 pc_norm=pc_norm)
-        vertices, _, faces = local_view_tuple
+        vertices, _, node_ids = local_view_tuple
+
+        if return_packed:
+            assert not fix_meshes
+            faces, face_offsets = utils.filter_shapes_batch(
+                node_ids, self.faces, incidence=self._face_incidence,
+                return_offsets=True)
+            vertex_offsets = np.zeros(len(vertices) + 1, dtype=np.int64)
+            vertex_offsets[1:] = np.cumsum([len(v) for v in vertices])
+            if len(vertices) > 0:
+                vertices = np.concatenate(vertices)
+            else:
+                vertices = np.zeros((0, 3), dtype=self.vertices.dtype)
+            return vertices, vertex_offsets, faces, face_offsets
 
-        meshes = [Mesh(vertices=v, faces=f) for v, f in
-                  zip(vertices, faces)]
+        faces = self._filter_faces(node_ids)
 
         if fix_meshes:
-            for mesh in meshes:
-                if mesh.n_vertices > 0:
-                    mesh.fix_mesh(wiggle_vertices=False)
+            multi_args = [(v, f) for v, f in zip(vertices, faces)]
+            fixed = mu.multiprocess_func(_fix_mesh_thread, multi_args,
+                                         debug=n_threads == 1,
+                                         n_threads=n_threads)
+            vertices, faces = zip(*fixed) if len(fixed) > 0 else ([], [])
+
+        meshes = [Mesh(vertices=v, faces=f) for v, f in
+                  zip(vertices, faces)]
 
         return meshes
 
@@ -1269,6 +2016,9 @@ class Mesh(trimesh.Trimesh):
     def _calc_pc_align(self, vertices, svd_solver, pc_norm=False):
         """ Calculates PC alignment """
 
+        if svd_solver in ["auto", "full"]:
+            return _pc_align_batch(vertices[None], pc_norm=pc_norm)[0]
+
         vertices = vertices.copy()
         if pc_norm:
             vertices -= vertices.mean(axis=0)
@@ -1281,7 +2031,7 @@ class Mesh(trimesh.Trimesh):
         return pca.fit_transform(vertices)
 
     def merge_large_components(self, size_threshold=100, max_dist=1000,
-                               dist_step=100):
+                               dist_step=100, verbose=False):
         """ Finds edges between disconnected components
         will add the edges to the existing set of link_edges
         or start a set of link_edges if there are None
@@ -1298,48 +2048,39 @@ class Mesh(trimesh.Trimesh):
         dist_step: int
             will merge by marching in steps to look for things to merge
             this is the distance of each step (default 100 in units of mesh.vertices)
+        verbose: bool
+            whether to log the merge statistics (default False)
 
+        Returns
+        -------
+        dict
+            merge statistics: n_large_components, n_component_pairs,
+            n_new_edges and time
         """
         time_start = time.time()
 
-        ccs = sparse.csgraph.connected_components(self.csgraph)
-        ccs_u, cc_sizes = np.unique(ccs[1], return_counts=True)
+        labels = self.component_labels
+        ccs_u, cc_sizes = np.unique(labels, return_counts=True)
         large_cc_ids = ccs_u[cc_sizes > size_threshold]
 
-        print(len(large_cc_ids))
-
-        kdtrees = []
-        vertex_ids = []
-        for cc_id in large_cc_ids:
-            m = ccs[1] == cc_id
-            vertex_ids.append(np.where(m)[0])
-            v = self.vertices[m]
-            kdtrees.append(spatial.cKDTree(v))
-
-        add_edges = []
-        for i_tree in range(len(large_cc_ids) - 1):
-            for j_tree in range(i_tree + 1, len(large_cc_ids)):
-                print("%d - %d      " % (i_tree, j_tree), end="\r")
-
-                if np.any(kdtrees[i_tree].query_ball_tree(kdtrees[j_tree], max_dist)):
-                    for this_dist in range(dist_step, max_dist + dist_step, dist_step):
+        large_labels = np.where(np.isin(labels, large_cc_ids), labels, -1)
+        add_edges = trimesh_repair.find_component_links(
+            self.vertices, large_labels, max_dist, dist_step)
 
-                        pairs = kdtrees[i_tree].query_ball_tree(kdtrees[j_tree],
-                                                                this_dist)
+        self.append_link_edges(add_edges)
 
-                        if np.any(pairs):
-                            for i_p, p in enumerate(pairs):
-                                if len(p) > 0:
-                                    add_edges.extend([[vertex_ids[i_tree][i_p],
-                                                       vertex_ids[j_tree][v]]
-                                                      for v in p])
-                            break
-
-        print(f"Adding {len(add_edges)} new edges.")
-
-        self.link_edges = np.vstack([self.link_edges, add_edges])
-
-        print("TIME MERGING: %.3fs" % (time.time() - time_start))
+        stats = {
+            "n_large_components": len(large_cc_ids),
+            "n_component_pairs": len(np.unique(labels[add_edges], axis=0)),
+            "n_new_edges": len(add_edges),
+            "time": time.time() - time_start,
+        }
+        if verbose:
+            logging.info("merged {n_large_components} large components: "
+                         "adding {n_new_edges} edges between "
+                         "{n_component_pairs} component pairs "
+                         "in {time:.3f}s".format(**stats))
+        return stats
 
     def _create_nxgraph(self):
         """ Computes networkx graph for this mesh
@@ -1348,14 +2089,55 @@ class Mesh(trimesh.Trimesh):
         -------
         :class:`networkx.Graph`
         """
-        return utils.create_nxgraph(self.vertices, self.graph_edges, euclidean_weight=True,
+        return utils.create_nxgraph(self.vertices, self.unique_graph_edges, euclidean_weight=True,
                                     directed=False)
 
     def _create_csgraph(self):
         """ Computes scipy.sparse.csgraph with weights equal to euclidean distance
         with directed=False"""
-        return utils.create_csgraph(self.vertices, self.graph_edges, euclidean_weight=True,
-                                    directed=True)
+        if self._graph_file_valid(include_vertices=True):
+            csgraph = read_mesh_h5_graph(self._graph_file)[0]
+            if csgraph is not None:
+                return csgraph
+        return utils.create_csgraph(self.vertices, self.unique_graph_edges, euclidean_weight=True,
+                                    directed=False)
+
+    def _create_component_labels(self):
+        """ Computes the connected component label of every vertex """
+        if self._graph_file_valid(include_vertices=False):
+            component_labels = read_mesh_h5_graph(self._graph_file)[1]
+            if component_labels is not None:
+                return component_labels
+        return sparse.csgraph.connected_components(self.csgraph, directed=False)[1]
+
+    def _graph_file_signature(self, include_vertices=True):
+        keys = ['faces', 'link_edges']
+        if include_vertices:
+            keys.append('vertices')
+        return tuple(hash(self._data[k]) for k in keys) + (self.n_vertices, )
+
+    def _graph_file_valid(self, include_vertices=True):
+        if self._graph_file is None or not os.path.isfile(self._graph_file):
+            return False
+        signature = self._graph_file_signature(include_vertices=include_vertices)
+        return signature == self._graph_file_keys[include_vertices]
+
+    def set_graph_file(self, filename):
+        """ Use the csgraph and component labels stored in a mesh h5 file
+        (see :func:`write_mesh_h5`) instead of recomputing them.
+        They are read lazily the first time they are needed, and are only used while the
+        mesh faces, link_edges (and vertices, for the csgraph) are unchanged.
+
+        Parameters
+        ----------
+        filename: str
+            a path to a h5 file written from this mesh
+        """
+        self._graph_file = filename
+        self._graph_file_keys = {
+            True: self._graph_file_signature(include_vertices=True),
+            False: self._graph_file_signature(include_vertices=False)}
+        self._clear_extra_cached_vertex_keys(keys=['csgraph', 'component_labels'])
 
     @property
     def node_mask(self):
@@ -1426,6 +2208,42 @@ class Mesh(trimesh.Trimesh):
         new_mesh._apply_new_mask_in_place(new_mask, link_edge_unmask)
         return new_mesh
 
+    # cached objects that are changed in place and so not shared by shallow_copy
+    _unshared_cache_keys = ['nxgraph']
+
+    def shallow_copy(self):
+        '''
+        Makes a new Mesh with its own copies of the vertex, face, link edge and
+        mask arrays of this one, which shares its cached properties (kdtree,
+        csgraph, etc) so they are not rebuilt. The nxgraph is not shared,
+        since :func:`append_link_edges` extends it in place.
+
+        Returns
+        -------
+        trimesh_io.Mesh
+            the copied mesh
+        '''
+        self._cache.verify()
+        new_mesh = Mesh(np.copy(self.vertices),
+                        np.copy(self.faces),
+                        node_mask=np.copy(self.node_mask),
+                        unmasked_size=self.unmasked_size,
+                        link_edges=np.copy(self.link_edges))
+        # the vertices are already scaled, so the scaling is not reapplied
+        new_mesh._voxel_scaling = self._voxel_scaling
+        new_mesh._graph_file = self._graph_file
+        new_mesh._graph_file_keys = self._graph_file_keys
+        new_mesh._vertex_radii = {k: v.copy() for k, v in self._vertex_radii.items()}
+        new_mesh._stashed_vertex_radii = {
+            scaling: {k: v.copy() for k, v in radii.items()}
+            for scaling, radii in self._stashed_vertex_radii.items()}
+
+        new_mesh._cache.id_set()
+        new_mesh._cache.cache.update(
+            {k: v for k, v in self._cache.cache.items()
+             if k not in self._unshared_cache_keys})
+        return new_mesh
+
     def _apply_new_mask_in_place(self, mask, link_edge_unmask):
         """ Internal function for applying masks.. use apply_mask
         Use builtin Trimesh tools for masking
@@ -1533,7 +2351,9 @@ class Mesh(trimesh.Trimesh):
         return utils.filter_unmasked_indices_padded(mask, unmasked_shape)
 
     @ScalingManagement.original_scaling
-    def write_to_file(self, filename, overwrite=True, draco=False):
+    def write_to_file(self, filename, overwrite=True, draco=False,
+                      version=DEFAULT_MESH_H5_VERSION, save_graph=False,
+                      save_vertex_radii=True):
         """ Exports the mesh to any format supported by trimesh
 
         Parameters
@@ -1543,8 +2363,21 @@ class Mesh(trimesh.Trimesh):
             '.h5' for hdf5
             '.obj' for wavefront
             all others supported by :func:`trimesh.exchange.export.export_mesh`
+        version: int
+            h5 file version, see :func:`write_mesh_h5` (default DEFAULT_MESH_H5_VERSION)
+        save_graph: bool
+            whether to also store csgraph and component_labels in h5 files,
+            see :func:`set_graph_file` (default False)
+        save_vertex_radii: bool
+            whether to also store the computed vertex_radii in h5 files (default True)
         """
         if os.path.splitext(filename)[1] == '.h5':
+            csgraph, component_labels = None, None
+            if save_graph:
+                component_labels = self.component_labels
+                # draco quantizes vertices, so edge weights would not match on load
+                if not draco:
+                    csgraph = self.csgraph
             write_mesh_h5(filename,
                           self.vertices,
                           self.faces,
@@ -1552,7 +2385,11 @@ class Mesh(trimesh.Trimesh):
                           link_edges=self.link_edges,
                           node_mask=self.node_mask,
                           draco=draco,
-                          overwrite=overwrite)
+                          overwrite=overwrite,
+                          version=version,
+                          csgraph=csgraph,
+                          component_labels=component_labels,
+                          vertex_radii=self.vertex_radii if save_vertex_radii else None)
         else:
             exchange.export.export_mesh(self, filename)
 
@@ -2,9 +2,13 @@
 from scipy import spatial, sparse
 from meshparty import utils
 import time
+import os
+import hashlib
+import h5py
 import numpy as np
 from meshparty import trimesh_io
 import logging
+from multiwrapper import multiprocessing_utils as mu
 try:
     from caveclient import CAVEclient
 except ImportError:
@@ -102,9 +106,88 @@ def find_close_edges_sym(vertices, labels, label_a, label_b):
     return new_edges_a[is_both, :]
 
 
-def find_all_close_edges(vertices, labels, ccs):
+def _closest_foreign_pairs(vertices, labels):
+    """ Find the closest pair of vertices from every label to any other label
+
+    Builds one kdtree per label. Every label is compared to the other labels
+    in the order of the distance between their bounding boxes, until the
+    next bounding box is further away than the closest pair found so far.
+
+    Parameters
+    ----------
+    vertices: np.array
+        a Nx3 array of xyz vertex position
+    labels: np.array
+        a N array of labels starting at 0, with at least two labels
+
+    Returns
+    -------
+    np.array
+        a Kx2 array of vertex indices, one closest pair per label
+    """
+    order = np.argsort(labels, kind='stable')
+    label_inds = np.split(order, np.where(np.diff(labels[order]))[0] + 1)
+    n_labels = len(label_inds)
+    trees = [spatial.cKDTree(vertices[inds], balanced_tree=False)
+             for inds in label_inds]
+    box_lo = np.array([vertices[inds].min(axis=0) for inds in label_inds])
+    box_hi = np.array([vertices[inds].max(axis=0) for inds in label_inds])
+
+    pair_cache = {}
+
+    def closest_pair(label_a, label_b, max_d):
+        # closest pair of two labels if it is closer than max_d
+        key = (min(label_a, label_b), max(label_a, label_b))
+        if key in pair_cache and pair_cache[key][-1] >= max_d:
+            return pair_cache[key][:3]
+        # the smaller label is queried against the tree of the larger one
+        small, large = sorted(key, key=lambda l: len(label_inds[l]))
+        small_inds = label_inds[small]
+        is_near = np.all((vertices[small_inds] >= box_lo[large] - max_d) &
+                         (vertices[small_inds] <= box_hi[large] + max_d),
+                         axis=1)
+        small_inds = small_inds[is_near]
+        ds, nbrs = trees[large].query(vertices[small_inds],
+                                      distance_upper_bound=max_d)
+        if len(ds) == 0 or not np.isfinite(ds.min()):
+            pair_cache[key] = (np.inf, -1, -1, max_d)
+        else:
+            closest = np.argmin(ds)
+            pair_cache[key] = (ds[closest], small_inds[closest],
+                               label_inds[large][nbrs[closest]], np.inf)
+        return pair_cache[key][:3]
+
+    pairs = np.zeros((n_labels, 2), dtype=np.int64)
+    for label in range(n_labels):
+        box_ds = np.linalg.norm(
+            np.maximum(np.maximum(box_lo - box_hi[label],
+                                  box_lo[label] - box_hi), 0), axis=1)
+        box_ds[label] = np.inf
+        best_d = np.inf
+        for other in np.argsort(box_ds)[:-1]:
+            if box_ds[other] >= best_d:
+                break
+            d, u, v = closest_pair(label, other, best_d)
+            if d < best_d:
+                best_d = d
+                pairs[label] = [u, v]
+    return pairs
+
+
+def find_all_close_edges(vertices, labels, ccs, k=16):
     """ Find all the mutually closest edges between all components of the mesh
 
+    Uses one kdtree query of the k nearest neighbors of all vertices.
+    For every vertex, the nearest vertex of each other component among its
+    neighbors is a candidate, and candidates that are mutually closest are
+    returned. This approximates the mutually closest pairs across all
+    pairs of components: pairs of components that are not within the k
+    nearest neighbors of each other are not compared.
+    The closest pairs along a minimum spanning tree of the components are
+    always included, and groups of components that stay unlinked are joined
+    in Boruvka rounds by the closest pair to any other group, so the result
+    links every component.
+
     Parameters
     ----------
     vertices: np.array
@@ -113,24 +196,179 @@ def find_all_close_edges(vertices, labels, ccs):
         a labelling of the vertices that reflect components of the mesh
     ccs: int
         the number of connected components in the mesh
+    k: int
+        number of nearest neighbors searched for mutually closest vertices (default 16)
 
     Returns
     -------
     np.array
         a Kx2 array of vertex indices that are mutually closest to each other
-        across all combinations of components
+        across all combinations of components, the first column being in the
+        component with the lower label
     """
-    all_edges = []
-    for i in range(ccs):
-        for j in range(i, ccs):
-            all_edges.append(find_close_edges_sym(vertices, labels, i, j))
-    return np.vstack(all_edges)
+    labels = np.asarray(labels, dtype=np.int64)
+    n = len(vertices)
+    if ccs < 2 or n < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    tree = spatial.cKDTree(vertices, balanced_tree=False)
+
+    # nearest vertex of every other component within the k nearest neighbors
+    k = min(k, n)
+    ds, nbrs = tree.query(vertices, k=k, workers=-1)
+    us = np.repeat(np.arange(n), k)
+    vs, ds = nbrs.ravel(), ds.ravel()
+    is_foreign = labels[us] != labels[vs]
+    us, vs, ds = us[is_foreign], vs[is_foreign], ds[is_foreign]
+    # neighbors are sorted by distance, so the first per label is the closest
+    _, first = np.unique(us * ccs + labels[vs], return_index=True)
+    us, vs, ds = us[first], vs[first], ds[first]
+    is_mutual = np.isin(us * n + vs, vs * n + us)
+    edges = [np.stack([us[is_mutual], vs[is_mutual]], axis=1)]
+
+    # minimum spanning tree over the components, weighted by their closest pair
+    cc_a = np.minimum(labels[us], labels[vs])
+    cc_b = np.maximum(labels[us], labels[vs])
+    order = np.lexsort((ds, cc_b, cc_a))
+    pair_ids, first = np.unique(cc_a[order] * ccs + cc_b[order],
+                                return_index=True)
+    closest = order[first]
+    # zero distances would be dropped from the sparse graph
+    cc_graph = sparse.csr_matrix(
+        (ds[closest] + np.finfo(np.float64).eps,
+         (cc_a[closest], cc_b[closest])), shape=(ccs, ccs))
+    mst = sparse.csgraph.minimum_spanning_tree(cc_graph).tocoo()
+    tree_pairs = closest[np.searchsorted(pair_ids, mst.row * ccs + mst.col)]
+    edges.append(np.stack([us[tree_pairs], vs[tree_pairs]], axis=1))
+
+    # groups of components without a neighbor in the other groups are
+    # linked exactly to their closest vertex outside, all groups at once
+    group_labels = utils.merge_component_labels(labels, edges[-1])
+    while group_labels.max() > 0:
+        new_edges = _closest_foreign_pairs(vertices, group_labels)
+        edges.append(new_edges)
+        group_labels = utils.merge_component_labels(group_labels, new_edges)
+
+    edges = np.vstack(edges)
+    flip = labels[edges[:, 0]] > labels[edges[:, 1]]
+    edges[flip] = edges[flip, ::-1]
+    return np.unique(edges, axis=0)
+
+
+def find_component_links(vertices, labels, max_dist, dist_step):
+    """ Find the closest vertex pairs between all pairs of labelled components
+
+    Builds one kdtree per component. Every component is queried once for
+    the nearest of its vertices to the vertices of the higher labelled
+    components with a bounding box within max_dist, which gives the closest
+    distance of every component pair without building vertex pairs within
+    a component. For every pair of components that come closer than
+    max_dist, the distance is marched up in steps of dist_step and all
+    vertex pairs within the first step that contains any pair are returned.
 
+    Parameters
+    ----------
+    vertices: np.array
+        a Nx3 array of vertex positions
+    labels: np.array
+        a N array of component labels, negative labels are ignored
+    max_dist: float
+        components further apart than this are not linked
+    dist_step: float
+        the step size of the distance march
 
-def find_edges_to_link(mesh, vert_ind_a, vert_ind_b, distance_upper_bound=2500, verbose=False):
-    '''Given a mesh and two points on that mesh
-    find a way to add edges to the  mesh graph so that those indices
-    are on the same connected component
+    Returns
+    -------
+    np.array
+        a Kx2 array of vertex indices, where the first column is in the
+        component with the lower label
+    """
+    labels = np.asarray(labels)
+    vertex_ids = np.where(labels >= 0)[0]
+    if len(vertex_ids) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # the last step can overshoot max_dist, pairs within it are linked too
+    n_steps = max(int(np.ceil(max_dist / dist_step)), 1)
+    radius = n_steps * dist_step
+
+    vertex_ids = vertex_ids[np.argsort(labels[vertex_ids], kind='stable')]
+    _, cc_starts, cc_sizes = np.unique(labels[vertex_ids], return_index=True,
+                                       return_counts=True)
+    n_ccs = len(cc_starts)
+    cc_ids = np.split(vertex_ids, cc_starts[1:])
+    cc_index = np.full(len(vertices), -1)
+    cc_index[vertex_ids] = np.repeat(np.arange(n_ccs), cc_sizes)
+
+    trees = [spatial.cKDTree(vertices[ids]) for ids in cc_ids]
+    box_lo = np.array([vertices[ids].min(axis=0) for ids in cc_ids])
+    box_hi = np.array([vertices[ids].max(axis=0) for ids in cc_ids])
+
+    # nearest vertex of every component to the vertices of nearby components
+    near_pairs = [np.zeros((0, 2), dtype=np.int64)]
+    for cc in range(n_ccs - 1):
+        box_ds = np.linalg.norm(np.maximum(np.maximum(
+            box_lo[cc + 1:] - box_hi[cc], box_lo[cc] - box_hi[cc + 1:]), 0),
+            axis=1)
+        others = cc + 1 + np.flatnonzero(box_ds <= radius)
+        if len(others) == 0:
+            continue
+        other_ids = np.concatenate([cc_ids[other] for other in others])
+        ds, nbrs = trees[cc].query(vertices[other_ids],
+                                   distance_upper_bound=radius)
+        is_near = np.isfinite(ds)
+        near_pairs.append(np.stack([cc_ids[cc][nbrs[is_near]],
+                                    other_ids[is_near]], axis=1))
+    near_pairs = np.vstack(near_pairs)
+    ds = np.linalg.norm(vertices[near_pairs[:, 0]] -
+                        vertices[near_pairs[:, 1]], axis=1)
+
+    # closest distance and first step per component pair
+    cc_pair_ids, cc_pair_inds = np.unique(
+        cc_index[near_pairs[:, 0]] * n_ccs + cc_index[near_pairs[:, 1]],
+        return_inverse=True)
+    min_ds = np.full(len(cc_pair_ids), np.inf)
+    np.minimum.at(min_ds, cc_pair_inds.ravel(), ds)
+    is_link = min_ds <= max_dist
+    cc_pair_ids, min_ds = cc_pair_ids[is_link], min_ds[is_link]
+    min_steps = np.maximum(np.ceil(min_ds / dist_step), 1)
+
+    # only the pairs within the first step are built, with some slack for
+    # the rounding of the kdtree distances
+    links = [np.zeros((0, 2), dtype=np.int64)]
+    for cc_pair_id, min_step in zip(cc_pair_ids, min_steps):
+        cc_a, cc_b = divmod(cc_pair_id, n_ccs)
+        pairs = trees[cc_a].sparse_distance_matrix(
+            trees[cc_b], min_step * dist_step * (1 + 1e-9),
+            output_type='ndarray')
+        pairs = np.stack([cc_ids[cc_a][pairs['i']],
+                          cc_ids[cc_b][pairs['j']]], axis=1)
+        pair_ds = np.linalg.norm(vertices[pairs[:, 0]] -
+                                 vertices[pairs[:, 1]], axis=1)
+        steps = np.maximum(np.ceil(pair_ds / dist_step), 1)
+        links.append(pairs[steps == min_step])
+    return np.vstack(links)
+
+
+def _merge_neighborhoods(mesh, merge_inds):
+    """ Indices of the mesh vertices near each merge edge
+
+    For every merge edge these are the vertices within twice the euclidean
+    length of the edge from its center, found with one batched kdtree query.
+    """
+    merge_inds = np.asarray(merge_inds, dtype=np.int64).reshape(-1, 2)
+    verts_a = mesh.vertices[merge_inds[:, 0]]
+    verts_b = mesh.vertices[merge_inds[:, 1]]
+    d = np.linalg.norm(verts_a - verts_b, axis=1)
+    c = (verts_a + verts_b) / 2
+    return mesh.kdtree.query_ball_point(c, d * 2, workers=-1)
+
+
+def _find_edges_to_link_local(mesh, vert_ind_a, vert_ind_b, inds, verbose=False):
+    """ Finds the edges linking two mesh vertices within a neighborhood
+
+    Works on the neighborhood's submatrix of the mesh csgraph instead of
+    a masked mesh.
 
     Parameters
     ----------
@@ -140,55 +378,39 @@ def find_edges_to_link(mesh, vert_ind_a, vert_ind_b, distance_upper_bound=2500,
         one index into mesh.vertices, the first point
     vert_ind_b: int
         a second index into mesh.vertices, the second point
-    distance_upper_bound: float
-        a maximum distance to (default 2500 in units of mesh.vertices)
+    inds: np.array
+        indices into mesh.vertices of the neighborhood to search
     verbose: bool
         whether to print debug info
 
     Returns
     -------
     np.array
-        a Kx2 array of mesh indices that represent edges to add to the mesh to link the two points
-        in a way that creates the shortest path between the points across mututally closest vertices
-        from connected components.. not adding edges if they are larger than distance_upper_bound
-        TODO: distance_upper_bound not presently implemented
-    '''
+        a Kx2 array of mesh indices, see :func:`find_edges_to_link`
+    """
     timings = {}
     start_time = time.time()
 
-    # find the distance between the merge points and their center
-    d = np.linalg.norm(
-        mesh.vertices[vert_ind_a, :] - mesh.vertices[vert_ind_b, :])
-    c = np.mean(mesh.vertices[[vert_ind_a, vert_ind_b], :], axis=0)
-    # cut down the mesh to only include mesh vertices near the center of this
-    # merge edge and within 2x the euclidean length of the edge
-    inds = mesh.kdtree.query_ball_point(c, d*2)
-    # convert this to a mask
-    mask = np.zeros(len(mesh.vertices), dtype=np.bool)
-    mask[inds] = True
-
-    timings['create_mask'] = time.time()-start_time
-    start_time = time.time()
-    # create a masked version of the mesh
-    mask_mesh = mesh.apply_mask(mask)
+    inds = np.union1d(inds, [vert_ind_a, vert_ind_b]).astype(np.int64)
+    local_graph = mesh.csgraph[inds][:, inds]
+    local_vertices = mesh.vertices[inds]
 
-    timings['apply_mask'] = time.time()-start_time
+    timings['local_graph'] = time.time()-start_time
     start_time = time.time()
     ccs, labels = sparse.csgraph.connected_components(
-        mask_mesh.csgraph, return_labels=True)
+        local_graph, return_labels=True)
 
-    # map the original indices into this masked space
-    mask_inds = mask_mesh.filter_unmasked_indices(
-        np.array([vert_ind_a, vert_ind_b]))
+    # map the original indices into the local space
+    local_inds = np.searchsorted(inds, [vert_ind_a, vert_ind_b])
 
-    timings['masked_ccs'] = time.time()-start_time
+    timings['local_ccs'] = time.time()-start_time
     start_time = time.time()
 
     # find all the multually closest edges between the linked components
-    new_edges = find_close_edges_sym(mask_mesh.vertices,
+    new_edges = find_close_edges_sym(local_vertices,
                                      labels,
-                                     labels[mask_inds[0]],
-                                     labels[mask_inds[1]])
+                                     labels[local_inds[0]],
+                                     labels[local_inds[1]])
     timings['find_close_edges_sym'] = time.time()-start_time
     start_time = time.time()
 
@@ -197,42 +419,117 @@ def find_edges_to_link(mesh, vert_ind_a, vert_ind_b, distance_upper_bound=2500,
     if len(new_edges) == 0:
         if verbose:
             print('finding all close edges')
-        new_edges = find_all_close_edges(mask_mesh.vertices, labels, ccs)
+        new_edges = find_all_close_edges(local_vertices, labels, ccs)
         if verbose:
             print(f'new_edges shape {new_edges.shape}')
     # if there are still not edges we have a problem
     if len(new_edges) == 0:
         raise Exception('no close edges found')
 
-    # create a new mesh that has these added edges
-    # new_mesh = make_new_mesh_with_added_edges(mask_mesh, new_edges)
-    total_edges = np.vstack([mask_mesh.graph_edges, new_edges])
-    graph = utils.create_csgraph(mask_mesh.vertices, total_edges)
-    timings['make_new_mesh'] = time.time()-start_time
+    # add these edges to the local graph
+    graph = local_graph + utils.create_csgraph(local_vertices, new_edges)
+    timings['add_edges'] = time.time()-start_time
     start_time = time.time()
 
-    # find the shortest path to one of the linking spots in this new mesh
+    # find the shortest path to one of the linking spots in this graph
     d_ais_to_all, pred = sparse.csgraph.dijkstra(graph,
-                                                 indices=mask_inds[0],
+                                                 indices=local_inds[0],
                                                  unweighted=False,
                                                  directed=False,
                                                  return_predecessors=True)
-    timings['find_close_edges_sym'] = time.time()-start_time
+    timings['dijkstra'] = time.time()-start_time
     start_time = time.time()
     # make sure we found a good path
-    if np.isinf(d_ais_to_all[mask_inds[1]]):
+    if np.isinf(d_ais_to_all[local_inds[1]]):
         raise Exception(
             f"cannot find link between {vert_ind_a} and {vert_ind_b}")
 
     # turn this path back into a original mesh index edge list
-    path = utils.get_path(mask_inds[0], mask_inds[1], pred)
+    path = utils.get_path(local_inds[0], local_inds[1], pred)
     path_as_edges = utils.paths_to_edges([path])
     good_edges = np_shared_rows(path_as_edges, new_edges)
     good_edges = np.sort(path_as_edges[good_edges], axis=1)
     timings['remap answers'] = time.time()-start_time
     if verbose:
         print(timings)
-    return mask_mesh.map_indices_to_unmasked(good_edges)
+    return inds[good_edges]
+
+
+def find_edges_to_link(mesh, vert_ind_a, vert_ind_b, distance_upper_bound=2500, verbose=False):
+    '''Given a mesh and two points on that mesh
+    find a way to add edges to the  mesh graph so that those indices
+    are on the same connected component
+
+    Parameters
+    ----------
+    mesh: trimesh_io.Mesh
+        a mesh to find edges on
+    vert_ind_a: int
+        one index into mesh.vertices, the first point
+    vert_ind_b: int
+        a second index into mesh.vertices, the second point
+    distance_upper_bound: float
+        a maximum distance to (default 2500 in units of mesh.vertices)
+    verbose: bool
+        whether to print debug info
+
+    Returns
+    -------
+    np.array
+        a Kx2 array of mesh indices that represent edges to add to the mesh to link the two points
+        in a way that creates the shortest path between the points across mututally closest vertices
+        from connected components.. not adding edges if they are larger than distance_upper_bound
+        TODO: distance_upper_bound not presently implemented
+    '''
+    # cut down the mesh to only include mesh vertices near the center of this
+    # merge edge and within 2x the euclidean length of the edge
+    inds = _merge_neighborhoods(mesh, [[vert_ind_a, vert_ind_b]])[0]
+    return _find_edges_to_link_local(mesh, vert_ind_a, vert_ind_b, inds,
+                                     verbose=verbose)
+
+
+def _find_edges_to_link_thread(args):
+    """ Helper to find the link edges of one merge in a thread """
+    mesh, vert_ind_a, vert_ind_b, inds = args
+    return _find_edges_to_link_local(mesh, vert_ind_a, vert_ind_b, inds)
+
+
+def find_edges_to_link_batch(mesh, merge_inds, n_threads=1):
+    '''Finds the link edges for many merge edges at once
+
+    All merges share the mesh kdtree, queried once for all neighborhoods,
+    and the mesh csgraph, whose neighborhood submatrices replace masked meshes.
+    Merges are independent of each other and processed in parallel threads.
+
+    Parameters
+    ----------
+    mesh: trimesh_io.Mesh
+        a mesh to find edges on
+    merge_inds: np.array
+        a Mx2 array of indices into mesh.vertices to link
+    n_threads: int
+        number of threads (default 1)
+
+    Returns
+    -------
+    np.array
+        a Kx2 array of mesh indices, the combined result of :func:`find_edges_to_link`
+        for every merge edge
+    '''
+    merge_inds = np.asarray(merge_inds, dtype=np.int64).reshape(-1, 2)
+    if len(merge_inds) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    # build the shared structures before the threads need them
+    mesh.kdtree, mesh.csgraph
+    neighborhoods = _merge_neighborhoods(mesh, merge_inds)
+
+    multi_args = [(mesh, a, b, inds) for (a, b), inds
+                  in zip(merge_inds, neighborhoods)]
+    link_edges = mu.multithread_func(_find_edges_to_link_thread, multi_args,
+                                     debug=n_threads == 1,
+                                     n_threads=n_threads)
+    return np.concatenate(link_edges).reshape(-1, 2)
 
 
 def merge_points_to_merge_indices(mesh, merge_event_points, close_map_distance=300):
@@ -259,8 +556,7 @@ def merge_points_to_merge_indices(mesh, merge_event_points, close_map_distance=3
     Nmerge = merge_event_points.shape[0]
 
     # find the connected components of the mesh
-    ccs, labels = sparse.csgraph.connected_components(
-        mesh.csgraph, return_labels=True)
+    labels = mesh.component_labels
     uniq_labels, label_counts = np.unique(labels, return_counts=True)
     large_cc_mask = np.isin(labels, uniq_labels[label_counts > 100])
 
@@ -366,11 +662,116 @@ def merge_log_to_points(merge_log, base_resolution):
     return merge_event_points * base_resolution
 
 
-def merge_log_edges(mesh, merge_log, base_resolution, close_map_distance=300, verbose=False):
+def _hash_arrays(*arrays):
+    """ A sha1 hex digest over the dtype, shape and content of arrays """
+    h = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(("%s%s" % (array.dtype.str, array.shape)).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+def link_edges_cache_filename(cache_path, mesh, merge_event_points,
+                              close_map_distance=300, seg_id=None):
+    """ The file link edges of a mesh and merge log are cached in
+
+    The name is keyed by the seg_id, a hash of the mesh vertices, faces
+    and link edges and a hash of the merge event points and
+    close_map_distance, so any change to the mesh or the merge log
+    points to a different file.
+
+    Parameters
+    ----------
+    cache_path : str
+        directory of the link edge cache
+    mesh : trimesh_io.Mesh
+        the mesh the link edges are computed for
+    merge_event_points : np.array
+        a Mx2x3 array of merge points, see :func:`merge_log_to_points`
+    close_map_distance: int or float
+        the maximum distance to map (default 300 in units of mesh.vertices)
+    seg_id : int or None
+        the seg_id of the mesh (default None)
+
+    Returns
+    -------
+    str
+        path of the cache file
+    """
+    mesh_hash = _hash_arrays(mesh.vertices, mesh.faces, mesh.link_edges)
+    merge_hash = _hash_arrays(np.asarray(merge_event_points, dtype=np.float64),
+                              np.float64(close_map_distance))
+    prefix = "" if seg_id is None else "%d_" % int(seg_id)
+    return os.path.join(cache_path, "%s%s_%s_link_edges.h5" %
+                        (prefix, mesh_hash[:16], merge_hash[:16]))
+
+
+def read_link_edges_cache(filename):
+    """ Reads link edges written by :func:`write_link_edges_cache`
+
+    Returns
+    -------
+    np.array or None
+        a Kx2 array of link edges, None if the file does not exist
+    """
+    if not os.path.exists(filename):
+        return None
+    with h5py.File(filename, "r") as f:
+        return f["link_edges"][()].reshape(-1, 2)
+
+
+def write_link_edges_cache(filename, link_edges):
+    """ Writes link edges to the cache, replacing the file atomically """
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    tmp_filename = filename + ".partial"
+    with h5py.File(tmp_filename, "w") as f:
+        f.create_dataset("link_edges",
+                         data=np.asarray(link_edges, dtype=np.int64).reshape(-1, 2))
+    os.replace(tmp_filename, filename)
+
+
+def merge_log_edges(mesh, merge_log, base_resolution, close_map_distance=300, verbose=False,
+                    n_threads=1, cache_path=None, seg_id=None):
     """ Process a merge log into mesh link edges
+
+    Parameters
+    ----------
+    mesh : trimesh_io.Mesh
+        the mesh to add edges to
+    merge_log : dict or list
+        merge log as it comes out of the chunkedgraph client
+    base_resolution : array-like
+        resolution of the supervoxel segmentation at its lowest mip
+    close_map_distance: int or float
+        the maximum distance to map (default 300 in units of mesh.vertices)
+    verbose: bool
+        whether to print debug statements
+    n_threads: int
+        number of threads used to repair merges (default 1)
+    cache_path: str or None
+        directory to cache the link edges in, keyed by seg_id, mesh and
+        merge log, see :func:`link_edges_cache_filename` (default None, no caching)
+    seg_id: int or None
+        the seg_id of the mesh, used for the cache file name (default None)
+
+    Returns
+    -------
+    np.array
+        link_edges, a Kx2 array of mesh.vertices indices
     """
     merge_event_points = merge_log_to_points(merge_log, base_resolution)
 
+    if cache_path is not None:
+        cache_filename = link_edges_cache_filename(
+            cache_path, mesh, merge_event_points,
+            close_map_distance=close_map_distance, seg_id=seg_id)
+        link_edges = read_link_edges_cache(cache_filename)
+        if link_edges is not None:
+            if verbose:
+                print("link edges read from %s" % cache_filename)
+            return link_edges
+
     # map these merge edge coordinates to indices on the mesh
     if len(merge_event_points) > 0:
         merge_edge_inds = merge_points_to_merge_indices(mesh,
@@ -381,26 +782,19 @@ def merge_log_edges(mesh, merge_log, base_resolution, close_map_distance=300, ve
 
     if verbose:
         print(len(merge_edge_inds), len(merge_event_points))
-    # iterate over these merge indices and find the minimal edge
-    # that links these two connected componets
-    total_link_edges = []
-
-    for merge_ind in merge_edge_inds:
-        link_edges = find_edges_to_link(mesh, merge_ind[0], merge_ind[1])
-        total_link_edges.append(link_edges)
-
-    # reshape the combined result into a M x 2 matrix
-    if len(total_link_edges) > 0:
-        link_edges = np.concatenate(total_link_edges)
-    else:
-        link_edges = np.array([])
-    link_edges = link_edges.reshape((len(link_edges), 2))
+    # find the minimal edges that link the connected components
+    # of every merge edge
+    link_edges = find_edges_to_link_batch(mesh, merge_edge_inds,
+                                          n_threads=n_threads)
 
+    if cache_path is not None:
+        write_link_edges_cache(cache_filename, link_edges)
     return link_edges
 
 
 def get_link_edges(mesh, seg_id, datastack_name=None, close_map_distance=300,
-                   server_address=None, verbose=False, client=None):
+                   server_address=None, verbose=False, client=None,
+                   cache_path=None):
     """function to get a set of edges that should be added to a mesh
 
     Parameters
@@ -418,6 +812,9 @@ def get_link_edges(mesh, seg_id, datastack_name=None, close_map_distance=300,
     verbose: bool
         whether to print debug statements
     client : caveclient.ChunkedGraphClient
+    cache_path : str or None
+        directory to cache the link edges in, so they are only computed once
+        for the same mesh and merge log (default None, no caching)
 
     Returns
     -------
@@ -439,4 +836,5 @@ def get_link_edges(mesh, seg_id, datastack_name=None, close_map_distance=300,
 
     return merge_log_edges(mesh, merge_log, client.base_resolution,
                            close_map_distance=close_map_distance,
-                           verbose=verbose)
+                           verbose=verbose, cache_path=cache_path,
+                           seg_id=seg_id)
@@ -1,3 +1,4 @@
+from collections.abc import Mapping
 import numpy as np
 from scipy import sparse
 import networkx as nx
@@ -191,11 +192,40 @@ def reduce_vertices(vertices, vertex_shape, v_filter=None, e_filter=None, return
         return vertices_n, vertex_shape_n
 
 
+def unique_edges(edges):
+    '''
+    Returns the undirected edges of a Kx2 edge list once each,
+    with the lower index first.
+    '''
+    edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+    if len(edges) == 0:
+        return edges
+    n = edges.max() + 1
+    keys = np.unique(edges[:, 0] * n + edges[:, 1])
+    return np.stack([keys // n, keys % n], axis=1)
+
+
+def edges_in(edges, other_edges):
+    '''
+    Boolean of which rows of the undirected edge list edges are in other_edges.
+    '''
+    edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+    other_edges = np.sort(np.asarray(other_edges, dtype=np.int64).reshape(-1, 2), axis=1)
+    if len(edges) == 0 or len(other_edges) == 0:
+        return np.zeros(len(edges), dtype=bool)
+    n = max(edges.max(), other_edges.max()) + 1
+    return np.isin(edges[:, 0] * n + edges[:, 1],
+                   other_edges[:, 0] * n + other_edges[:, 1])
+
+
 def create_csgraph(vertices, edges, euclidean_weight=True, directed=False):
     '''
     Builds a csr graph from vertices and edges, with optional control
     over weights as boolean or based on Euclidean distance.
     '''
+    edges = np.asarray(edges)
+    if len(vertices) < np.iinfo(np.int32).max:
+        edges = edges.astype(np.int32, copy=False)
     if euclidean_weight:
         xs = vertices[edges[:, 0]]
         ys = vertices[edges[:, 1]]
@@ -218,30 +248,161 @@ def create_csgraph(vertices, edges, euclidean_weight=True, directed=False):
     return csgraph
 
 
+def merge_component_labels(labels, edges):
+    '''
+    Updates connected component labels for added edges, working on the
+    graph of components rather than of vertices.
+    Labels stay numbered in the order of their first vertex.
+    '''
+    edges = np.asarray(edges).reshape(-1, 2)
+    n_labels = int(labels.max()) + 1 if len(labels) > 0 else 0
+    label_graph = sparse.csr_matrix(
+        (np.ones(len(edges), dtype=bool),
+         (labels[edges[:, 0]], labels[edges[:, 1]])),
+        shape=(n_labels, n_labels))
+    label_map = sparse.csgraph.connected_components(label_graph,
+                                                    directed=False)[1]
+    return label_map[labels]
+
+
 def create_nxgraph(vertices, edges, euclidean_weight=True, directed=False):
+    '''
+    Builds a networkx graph from vertices and edges, with optional control
+    over weights as boolean or based on Euclidean distance.
+    Edges are added in bulk rather than one attribute at a time.
+    '''
+    edges = np.asarray(edges)
     if euclidean_weight:
         xs = vertices[edges[:, 0]]
         ys = vertices[edges[:, 1]]
-        weights = np.linalg.norm(xs-ys, axis=1)
-        use_dtype = np.float32
+        weights = np.linalg.norm(xs-ys, axis=1).astype(np.float32)
     else:
-        weights = np.ones((len(edges),)).astype(bool)
-        use_dtype = bool
+        weights = np.ones((len(edges),), dtype=bool)
 
-    if directed:
-        edges = edges.T
-    else:
-        edges = np.concatenate([edges.T, edges.T[[1, 0]]], axis=1)
-        weights = np.concatenate([weights, weights]).astype(dtype=use_dtype)
+    weighted_graph = nx.DiGraph() if directed else nx.Graph()
+    weighted_graph.add_weighted_edges_from(
+        zip(edges[:, 0].tolist(), edges[:, 1].tolist(), weights.tolist()))
 
-    weighted_graph = nx.Graph()
-    weighted_graph.add_edges_from(edges)
+    return weighted_graph
 
-    for i_edge, edge in enumerate(edges):
-        weighted_graph[edge[0]][edge[1]]['weight'] = weights[i_edge]
-        weighted_graph[edge[1]][edge[0]]['weight'] = weights[i_edge]
 
-    return weighted_graph
+def csgraph_to_nxgraph(csgraph, directed=False):
+    '''
+    Builds a networkx graph with 'weight' edge attributes from the
+    arrays of a scipy.sparse graph in bulk. All csgraph rows become nodes,
+    including isolated ones.
+    '''
+    csgraph = sparse.csr_matrix(csgraph)
+    if not directed:
+        csgraph = sparse.triu(csgraph.maximum(csgraph.T), format='csr')
+    rows = np.repeat(np.arange(csgraph.shape[0]), np.diff(csgraph.indptr))
+
+    graph = nx.DiGraph() if directed else nx.Graph()
+    graph.add_nodes_from(range(csgraph.shape[0]))
+    graph.add_weighted_edges_from(
+        zip(rows.tolist(), csgraph.indices.tolist(), csgraph.data.tolist()))
+    return graph
+
+
+class _CSGraphNeighbors(Mapping):
+    """ Read-only neighbor -> edge attribute mapping of one csgraph row """
+
+    def __init__(self, csgraph, node):
+        start, stop = csgraph.indptr[node], csgraph.indptr[node + 1]
+        self._indices = csgraph.indices[start:stop]
+        self._data = csgraph.data[start:stop]
+
+    def __getitem__(self, neighbor):
+        hits = np.flatnonzero(self._indices == neighbor)
+        if len(hits) == 0:
+            raise KeyError(neighbor)
+        return {'weight': self._data[hits[0]].item()}
+
+    def __iter__(self):
+        return iter(self._indices.tolist())
+
+    def __len__(self):
+        return len(self._indices)
+
+
+class _CSGraphAdjacency(Mapping):
+    """ Read-only node -> neighbors mapping computed from csgraph rows on access """
+
+    def __init__(self, csgraph):
+        self._csgraph = csgraph
+
+    def __getitem__(self, node):
+        if node not in self:
+            raise KeyError(node)
+        return _CSGraphNeighbors(self._csgraph, node)
+
+    def __contains__(self, node):
+        return isinstance(node, (int, np.integer)) and \
+            0 <= node < self._csgraph.shape[0]
+
+    def __iter__(self):
+        return iter(range(self._csgraph.shape[0]))
+
+    def __len__(self):
+        return self._csgraph.shape[0]
+
+
+class _CSGraphNodes(Mapping):
+    """ Read-only node -> (empty) attribute mapping for csgraph nodes """
+
+    def __init__(self, n_nodes):
+        self._n_nodes = n_nodes
+
+    def __getitem__(self, node):
+        if node not in self:
+            raise KeyError(node)
+        return {}
+
+    def __contains__(self, node):
+        return isinstance(node, (int, np.integer)) and \
+            0 <= node < self._n_nodes
+
+    def __iter__(self):
+        return iter(range(self._n_nodes))
+
+    def __len__(self):
+        return self._n_nodes
+
+
+class CSGraphView(nx.Graph):
+    """ A frozen, undirected networkx graph backed by a scipy.sparse csgraph
+
+    Neighbors and edge weights are read from the csr arrays when they are
+    accessed, so read-only networkx algorithms can run on a mesh graph
+    without building networkx's dict of dicts. Use :func:`csgraph_to_nxgraph`
+    when the graph needs to be modified.
+
+    Parameters
+    ----------
+    csgraph: scipy.sparse matrix
+        a symmetric NxN graph, edge weights are stored as 'weight'
+    """
+
+    def __init__(self, csgraph):
+        super().__init__()
+        self._csgraph = sparse.csr_matrix(csgraph)
+        self._node = _CSGraphNodes(self._csgraph.shape[0])
+        self._adj = _CSGraphAdjacency(self._csgraph)
+        nx.freeze(self)
+
+    @property
+    def csgraph(self):
+        """scipy.sparse.csr_matrix : the graph backing this view"""
+        return self._csgraph
+
+    def number_of_edges(self, u=None, v=None):
+        if u is None:
+            return (self._csgraph.nnz + self._csgraph.diagonal().astype(bool).sum()) // 2
+        return super().number_of_edges(u, v)
+
+    def to_networkx(self):
+        """ Materializes this view as a mutable :class:`networkx.Graph` """
+        return csgraph_to_nxgraph(self._csgraph)
 
 
 def get_path(root, target, pred):
@@ -270,41 +431,114 @@ def paths_to_edges(path_list):
     return np.vstack(arrays)
 
 
-def filter_shapes(node_ids, shapes):
-    """ node_ids has to be sorted! """
-    if not isinstance(node_ids[0], list) and \
-            not isinstance(node_ids[0], np.ndarray):
-        node_ids = [node_ids]
-    # If shapes is 1d, make into an Nx1 2d-array.
-    if len(shapes.shape) == 1:
+def shape_incidence(shapes, n_nodes=None):
+    """ Groups shapes by their first node, as a csr style incidence
+
+    Parameters
+    ----------
+    shapes: np.array
+        a MxK array of node indices (faces, edges, ...)
+    n_nodes: int or None
+        number of nodes, default None uses the largest node in shapes
+
+    Returns
+    -------
+    np.array
+        indptr, a n_nodes + 1 long array, the shapes starting with node i are
+        order[indptr[i]:indptr[i+1]]
+    np.array
+        order, a M long array of shape indices sorted by first node
+    """
+    shapes = np.asarray(shapes)
+    if shapes.ndim == 1:
         shapes = shapes[:, np.newaxis]
-    ndim = shapes.shape[1]
-    if isinstance(node_ids, np.ndarray):
-        all_node_ids = node_ids.flatten()
-    else:
-        all_node_ids = np.concatenate(node_ids)
+    first = shapes[:, 0].astype(np.int64)
+    if n_nodes is None:
+        n_nodes = first.max() + 1 if len(first) > 0 else 0
+    order = np.argsort(first, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(first, minlength=n_nodes))
+    return indptr, order
 
-    filter_ = np.in1d(shapes[:, 0], all_node_ids)
-    pre_filtered_shapes = shapes[filter_].copy()
-    for k in range(1, ndim):
-        filter_ = np.in1d(pre_filtered_shapes[:, k], all_node_ids)
-        pre_filtered_shapes = pre_filtered_shapes[filter_]
 
-    filtered_shapes = []
+def filter_shapes_batch(node_ids, shapes, incidence=None, return_offsets=False):
+    """ Filters and reindexes shapes for many sets of nodes in one pass
 
-    for ns in node_ids:
-        f = pre_filtered_shapes[np.in1d(pre_filtered_shapes[:, 0], ns)]
-        for k in range(1, ndim):
-            f = f[np.in1d(f[:, k], ns)]
+    Parameters
+    ----------
+    node_ids: list of np.array
+        K sorted arrays of node indices
+    shapes: np.array
+        a MxD (or M) array of node indices
+    incidence: tuple or None
+        the result of :func:`shape_incidence` for shapes, pass it to reuse it
+        across calls (default None computes it)
+    return_offsets: bool
+        if True, return one packed array and offsets instead of a list (default False)
 
-        f = np.unique(np.concatenate([f.flatten(), ns]),
-                      return_inverse=True)[1][:-len(ns)].reshape(-1, ndim)
+    Returns
+    -------
+    list of np.array
+        for every node set the shapes whose nodes are all in it, reindexed
+        into positions within the node set, in their original order.
+        If return_offsets, a packed NxD array and a K+1 long offset array instead.
+    """
+    shapes = np.asarray(shapes)
+    if shapes.ndim == 1:
+        shapes = shapes[:, np.newaxis]
+    shapes = shapes.astype(np.int64, copy=False)
+    ndim = shapes.shape[1]
 
-        filtered_shapes.append(f)
+    node_ids = [np.asarray(ns, dtype=np.int64).ravel() for ns in node_ids]
+    max_node = max([ns.max() for ns in node_ids if len(ns) > 0], default=-1)
 
+    if incidence is None:
+        n_nodes = max(shapes.max() + 1 if len(shapes) > 0 else 0, max_node + 1)
+        incidence = shape_incidence(shapes, n_nodes)
+    indptr, order = incidence
+    n_nodes = len(indptr) - 1
+
+    # scratch map from node index to position within the current node set
+    local_index = np.full(max(n_nodes, max_node + 1), -1, dtype=np.int64)
+    filtered_shapes = []
+    for ns in node_ids:
+        local_index[ns] = np.arange(len(ns))
+
+        # candidates are the shapes starting with one of the nodes
+        starting = ns[ns < n_nodes]
+        starts = indptr[starting]
+        counts = indptr[starting + 1] - starts
+        cand_inds = np.repeat(starts - np.cumsum(counts) + counts, counts) + \
+            np.arange(counts.sum())
+        cand_shapes = np.sort(order[cand_inds])
+
+        local_shapes = local_index[shapes[cand_shapes]]
+        filtered_shapes.append(local_shapes[np.all(local_shapes >= 0, axis=1)])
+
+        local_index[ns] = -1
+
+    if return_offsets:
+        offsets = np.zeros(len(filtered_shapes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(f) for f in filtered_shapes])
+        if len(filtered_shapes) > 0:
+            packed = np.concatenate(filtered_shapes)
+        else:
+            packed = np.zeros((0, ndim), dtype=np.int64)
+        return packed, offsets
     return filtered_shapes
 
 
+def filter_shapes(node_ids, shapes):
+    """ node_ids has to be sorted! """
+    if isinstance(node_ids, np.ndarray) and node_ids.ndim == 1:
+        node_ids = [node_ids]
+    elif len(node_ids) > 0 and \
+            not isinstance(node_ids[0], list) and \
+            not isinstance(node_ids[0], np.ndarray):
+        node_ids = [node_ids]
+    return filter_shapes_batch(node_ids, shapes)
+
+
 def nanfilter_shapes(node_ids, shapes):
     '''
     Wraps filter_shapes to handle shapes with nans.
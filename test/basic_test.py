@@ -1,7 +1,8 @@
-from meshparty import trimesh_io, skeletonize, mesh_filters, skeleton
+from meshparty import trimesh_io, trimesh_repair, skeletonize, mesh_filters, skeleton, utils
 import numpy as np
 import pytest
 import cloudvolume
+import trimesh
 import json
 import os
 import struct
@@ -215,6 +216,40 @@ def test_download_meshes(cv_path, basic_mesh_id, full_cell_mesh_id, tmpdir):
                                         n_threads=2)
 
 
+def test_download_meshes_resume(cv_path, basic_mesh, basic_mesh_id, tmpdir):
+    missing_id = 999
+    records = trimesh_io.download_meshes([basic_mesh_id, missing_id],
+                                         str(tmpdir),
+                                         cv_path=cv_path,
+                                         n_threads=2,
+                                         n_retries=1,
+                                         retry_backoff=0)
+    records = {r['seg_id']: r for r in records}
+    assert records[basic_mesh_id]['status'] == 'done'
+    assert records[basic_mesh_id]['fetch_time'] >= 0
+    assert records[missing_id]['status'] == 'failed'
+    assert records[missing_id]['attempts'] == 2
+
+    vertices, faces = trimesh_io.read_mesh_h5(
+        records[basic_mesh_id]['filename'])[:2]
+    assert np.array_equal(vertices, basic_mesh.vertices)
+    assert np.array_equal(faces, basic_mesh.faces)
+
+    manifest = trimesh_io._read_download_manifest(
+        str(tmpdir.join(trimesh_io.DOWNLOAD_MANIFEST_NAME)))
+    assert manifest[basic_mesh_id]['status'] == 'done'
+    assert manifest[missing_id]['status'] == 'failed'
+
+    records = trimesh_io.download_meshes([basic_mesh_id, missing_id],
+                                         str(tmpdir),
+                                         cv_path=cv_path,
+                                         resume=True,
+                                         n_retries=0)
+    records = {r['seg_id']: r for r in records}
+    assert records[basic_mesh_id]['status'] == 'skipped'
+    assert records[missing_id]['status'] == 'failed'
+
+
 def test_write_mesh(basic_mesh, tmpdir):
 
     filepath = str(tmpdir.join('test.h5'))
@@ -290,6 +325,139 @@ def test_link_edges(full_cell_mesh, full_cell_merge_log, full_cell_soma_pt):
     assert lcc_after.sum() == 2188351
 
 
+def build_sphere_row_mesh(n_spheres=4):
+    # a row of spheres and a merge log that merges them along the row
+    spheres = [trimesh.creation.icosphere(subdivisions=2, radius=10)
+               for _ in range(n_spheres)]
+    n_sphere = len(spheres[0].vertices)
+    vertices = np.vstack([s.vertices + [25 * i, 0, 0]
+                          for i, s in enumerate(spheres)])
+    faces = np.vstack([s.faces + i * n_sphere for i, s in enumerate(spheres)])
+    mesh = trimesh_io.Mesh(vertices, faces, process=False)
+    merge_points = np.array([[[25 * i + 10, 0, 0], [25 * i + 15, 0, 0]]
+                             for i in range(n_spheres - 1)], dtype=float)
+    return mesh, {'merge_edge_coords': merge_points}
+
+
+def test_merge_log_edges_batch():
+    mesh, merge_log = build_sphere_row_mesh(4)
+    assert mesh.n_components == 4
+
+    link_edges = trimesh_repair.merge_log_edges(mesh, merge_log, [1, 1, 1])
+    threaded_link_edges = trimesh_repair.merge_log_edges(
+        mesh, merge_log, [1, 1, 1], n_threads=3)
+    assert np.array_equal(link_edges, threaded_link_edges)
+
+    single_link_edges = trimesh_repair.find_edges_to_link(
+        mesh, link_edges[0, 0], link_edges[0, 1])
+    assert np.array_equal(single_link_edges, link_edges[:1])
+
+    mesh.add_link_edges(merge_log=merge_log, base_resolution=[1, 1, 1])
+    assert mesh.n_components == 1
+
+
+def test_find_all_close_edges():
+    # a cluster of touching fragments and a few far away ones
+    rng = np.random.default_rng(0)
+    centers = np.vstack([rng.uniform(0, 5, size=(10, 3)),
+                         [[100, 0, 0], [0, 200, 0], [0, 0, 300]]])
+    vertices = np.vstack([c + rng.normal(size=(20, 3)) for c in centers])
+    labels = np.repeat(np.arange(len(centers)), 20)
+
+    edges = trimesh_repair.find_all_close_edges(vertices, labels, len(centers))
+    assert np.all(labels[edges[:, 0]] < labels[edges[:, 1]])
+    assert len(np.unique(edges, axis=0)) == len(edges)
+
+    merged_labels = utils.merge_component_labels(labels, edges)
+    assert np.all(merged_labels == 0)
+
+    # dense fragments without neighbors of other fragments among their
+    # nearest neighbors are joined along a minimum spanning tree
+    centers = rng.uniform(0, 1000, size=(50, 3))
+    vertices = np.vstack([c + rng.normal(size=(40, 3)) for c in centers])
+    labels = np.repeat(np.arange(len(centers)), 40)
+
+    edges = trimesh_repair.find_all_close_edges(vertices, labels, len(centers))
+    assert len(edges) == len(centers) - 1
+    merged_labels = utils.merge_component_labels(labels, edges)
+    assert np.all(merged_labels == 0)
+
+
+def test_find_component_links(monkeypatch):
+    # a row of touching spheres, whose vertices are all close to their own sphere
+    sphere = trimesh.creation.icosphere(subdivisions=4, radius=1)
+    vertices = np.vstack([sphere.vertices + [2.01 * i, 0, 0] for i in range(3)])
+    labels = np.repeat([0, 1, 2], len(sphere.vertices))
+
+    n_trees = []
+    n_pairs = []
+
+    class CountingKDTree(trimesh_repair.spatial.cKDTree):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            n_trees.append(len(self.data))
+
+        def query_pairs(self, *args, **kwargs):
+            pairs = super().query_pairs(*args, **kwargs)
+            n_pairs.append(len(pairs))
+            return pairs
+
+        def sparse_distance_matrix(self, *args, **kwargs):
+            pairs = super().sparse_distance_matrix(*args, **kwargs)
+            n_pairs.append(len(pairs))
+            return pairs
+
+    monkeypatch.setattr(trimesh_repair.spatial, 'cKDTree', CountingKDTree)
+    links = trimesh_repair.find_component_links(vertices, labels, 0.5, 0.05)
+
+    ds = np.linalg.norm(vertices[links[:, 0]] - vertices[links[:, 1]], axis=1)
+    assert np.array_equal(np.unique(labels[links], axis=0), [[0, 1], [1, 2]])
+    assert np.all(ds <= 0.05)
+    # one tree per component and only the pairs of the first distance step
+    assert len(n_trees) == 3
+    assert sum(n_pairs) == len(links)
+
+
+class StubChunkedGraphClient(object):
+    base_resolution = [1, 1, 1]
+
+    def __init__(self, merge_log):
+        self.merge_log = merge_log
+        self.n_calls = 0
+
+    def get_merge_log(self, seg_id):
+        self.n_calls += 1
+        return self.merge_log
+
+
+def test_link_edges_cache(tmpdir, monkeypatch):
+    mesh, merge_log = build_sphere_row_mesh(4)
+    client = StubChunkedGraphClient(merge_log)
+    mm = trimesh_io.MeshMeta(disk_cache_path=str(tmpdir))
+
+    link_edges = trimesh_repair.get_link_edges(
+        mesh, 5, client=client, cache_path=mm.link_edges_cache_path)
+    assert len(os.listdir(mm.link_edges_cache_path)) == 1
+
+    # a cache hit skips the repair computation
+    def fail(*args, **kwargs):
+        raise AssertionError('link edges were recomputed')
+    monkeypatch.setattr(trimesh_repair, 'find_edges_to_link_batch', fail)
+    mm.add_link_edges(mesh, seg_id=5, client=client)
+    assert client.n_calls == 2
+    assert np.array_equal(mesh.link_edges, link_edges)
+    assert mesh.n_components == 1
+    monkeypatch.undo()
+
+    # a changed merge log is computed again
+    merge_log = {'merge_edge_coords': merge_log['merge_edge_coords'][:1]}
+    other_mesh = build_sphere_row_mesh(4)[0]
+    other_mesh.add_link_edges(merge_log=merge_log, base_resolution=[1, 1, 1],
+                              cache_path=mm.link_edges_cache_path)
+    assert other_mesh.n_components == 3
+    assert len(os.listdir(mm.link_edges_cache_path)) == 2
+
+
 def test_local_mesh(full_cell_mesh):
     vertex = 30000
     local_mesh = full_cell_mesh.get_local_mesh(
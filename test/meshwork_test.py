@@ -52,3 +52,184 @@ def test_meshwork_skeleton(basic_meshwork):
     new_mesh = meshwork.Meshwork(nrn.mesh)
     new_mesh.skeletonize_mesh()
     assert np.isclose(new_mesh.path_length(), 106050.47)
+
+
+@pytest.fixture()
+def capsule_meshwork():
+    import trimesh
+    from meshparty import trimesh_io
+    capsule = trimesh.creation.capsule(height=20000, radius=500, count=[32, 32])
+    nrn = meshwork.Meshwork(trimesh_io.Mesh(capsule.vertices, capsule.faces))
+    nrn.skeletonize_mesh(invalidation_distance=1000, compute_radius=False,
+                         collapse_soma=False)
+    yield nrn
+
+
+def test_meshwork_skeleton_to_mesh(capsule_meshwork):
+    nrn = capsule_meshwork
+    for mask in [None, nrn.mesh.vertices[:, 2] > 0]:
+        if mask is not None:
+            nrn.apply_mask(mask)
+        skinds = nrn.SkeletonIndex(np.arange(0, nrn.skeleton.n_vertices, 2))
+        mesh_to_skel = nrn.skeleton.mesh_to_skel_map[nrn.mesh.node_mask]
+        is_assoc = np.isin(mesh_to_skel, skinds)
+
+        assert np.array_equal(skinds.to_mesh_index, np.flatnonzero(is_assoc))
+        assert np.array_equal(skinds.to_mesh_mask, is_assoc)
+        assert np.array_equal(
+            skinds.to_mesh_mask_base,
+            np.isin(nrn.skeleton.mesh_to_skel_map_base,
+                    nrn.skeleton.map_indices_to_unmasked(skinds)))
+        for skind, region, point in zip(skinds, skinds.to_mesh_region,
+                                        skinds.to_mesh_region_point):
+            assert np.array_equal(region, np.flatnonzero(mesh_to_skel == skind))
+            assert point == region[0]
+
+        minds = nrn.MeshIndex(np.arange(0, nrn.mesh.n_vertices, 7))
+        assert np.array_equal(minds.to_skel_index_padded, mesh_to_skel[minds])
+
+
+def test_meshwork_copy(capsule_meshwork):
+    nrn = capsule_meshwork.copy()
+    pts = nrn.mesh.vertices[::10] / nrn.anno.voxel_resolution
+    nrn.add_annotations('pts', pd.DataFrame({'pt': pts.tolist(), 'value': np.arange(len(pts))}),
+                        point_column='pt')
+    nrn.mesh.csgraph
+
+    nrn_copy = nrn.copy()
+    assert 'csgraph' in nrn_copy.mesh._cache.cache
+    assert nrn_copy.anno.pts.MeshIndex is nrn_copy.MeshIndex
+
+    # in place changes of either meshwork do not reach the other
+    vertex = nrn.mesh.vertices[0].copy()
+    nrn_copy.mesh.vertices[0] = 0
+    nrn.mesh.node_mask[0] = True
+    assert np.array_equal(nrn.mesh.vertices[0], vertex)
+    values = nrn_copy.anno.pts._data['value']
+    values.iloc[0] = -1
+    nrn_copy.anno.pts._data.loc[1, 'value'] = -1
+    assert np.array_equal(nrn.anno.pts.df['value'], np.arange(len(pts)))
+
+    z = nrn_copy.mesh.vertices[:, 2]
+    nrn_copy.apply_mask(z > np.median(z))
+    nrn_copy.skeleton.vertex_properties['test'] = 1
+    assert len(nrn_copy.anno.pts) < len(nrn.anno.pts) == len(pts)
+    assert nrn_copy.skeleton.n_vertices < nrn.skeleton.n_vertices
+    assert 'test' not in nrn.skeleton.vertex_properties
+    assert np.array_equal(nrn.anno.pts.skel_index, nrn.copy().anno.pts.skel_index)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_meshwork_reset_mask(capsule_meshwork, compress):
+    nrn = capsule_meshwork
+    mesh = nrn.mesh
+    mesh.csgraph
+    z = mesh.vertices[:, 2]
+
+    nrn.apply_mask(z > 0, compress=compress)
+    masked_mesh = nrn.mesh
+    with nrn.mask_context(None):
+        assert nrn.mesh.n_vertices == len(z)
+        assert (nrn.mesh is mesh) != compress
+    assert nrn.mesh is masked_mesh
+    assert nrn.skeleton.n_vertices < nrn.skeleton.unmasked_size
+
+    nrn.reset_mask()
+    assert (nrn.mesh is mesh) != compress
+    assert np.array_equal(nrn.mesh.vertices, mesh.vertices)
+    assert nrn.skeleton.n_vertices == nrn.skeleton.unmasked_size
+    if not compress:
+        assert 'csgraph' in nrn.mesh._cache.cache
+
+
+def test_meshwork_index_types(capsule_meshwork):
+    nrn = capsule_meshwork
+    minds = nrn.MeshIndex(np.arange(0, nrn.mesh.n_vertices, 3))
+    assert isinstance(minds, nrn.MeshIndex)
+    assert isinstance(minds[2:5], nrn.MeshIndex)
+    assert isinstance(minds.to_skel_index, nrn.SkeletonIndex)
+    assert not isinstance(minds.to_array, nrn.MeshIndex)
+    assert type(minds == 0) is np.ndarray
+
+    nrn.apply_mask(nrn.mesh.vertices[:, 2] > 0)
+    assert not isinstance(minds, nrn.MeshIndex)
+    assert np.array_equal(minds[2:5].to_mesh_index_base, minds.to_array[2:5])
+
+    minds = nrn.MeshIndex(np.arange(0, nrn.mesh.n_vertices, 3))
+    base = nrn.mesh.map_indices_to_unmasked(minds.to_array)
+    assert np.array_equal(minds.to_mesh_index_base, base)
+    assert np.array_equal(minds[2:5].to_mesh_index_base, base[2:5])
+    assert np.array_equal(nrn.MeshIndex(minds.to_mesh_mask), minds)
+
+    skinds = nrn.SkeletonIndex([0, -1, 2])
+    assert np.array_equal(skinds.to_skel_index, [0, 2])
+    assert np.array_equal(skinds.to_skel_index_base,
+                          nrn.skeleton.map_indices_to_unmasked(np.array([0, 2])))
+    assert np.array_equal(np.flatnonzero(skinds.to_skel_mask), [0, 2])
+
+
+@pytest.mark.parametrize('aggfunc,func', [('mean', np.mean), ('sum', np.sum), ('max', np.max),
+                                          ('min', np.min), ('median', np.median)])
+def test_mesh_property_to_skeleton(capsule_meshwork, aggfunc, func):
+    nrn = capsule_meshwork
+    nrn.apply_mask(nrn.mesh.vertices[:, 2] > 0)
+    props = np.random.default_rng(0).normal(size=(nrn.mesh.n_vertices, 3))
+    mesh_to_skel = nrn.skeleton.mesh_to_skel_map[nrn.mesh.node_mask]
+
+    sk_props = nrn.mesh_property_to_skeleton(props, aggfunc=aggfunc)
+    expected = np.array([func(props[mesh_to_skel == skind], axis=0)
+                         for skind in range(nrn.skeleton.n_vertices)])
+    assert np.allclose(sk_props, expected)
+    assert np.allclose(nrn.mesh_property_to_skeleton(props[:, 1], aggfunc=aggfunc), expected[:, 1])
+    assert np.allclose(nrn.mesh_property_to_skeleton(props[:, 1], aggfunc=func), expected[:, 1])
+    assert np.array_equal(nrn.mesh_property_to_skeleton(props, aggfunc='count'),
+                          np.bincount(mesh_to_skel))
+
+
+def test_aggregate_csr_rows_empty_rows():
+    from meshparty.meshwork.utils import aggregate_csr_rows
+    indptr = np.array([0, 2, 2, 3])
+    values = np.array([1., 2., 4.])
+    assert np.array_equal(aggregate_csr_rows(indptr, values, 'sum'), [3, 0, 4])
+    assert np.array_equal(aggregate_csr_rows(indptr, values, 'count'), [2, 0, 1])
+    for aggfunc in ['mean', 'max', 'min', 'median', np.mean]:
+        assert np.isnan(aggregate_csr_rows(indptr, values, aggfunc)[1])
+
+
+def test_tree_distance_index():
+    from meshparty.meshwork.utils import TreeDistanceIndex
+    parents = np.array([-1, 0, 0, 1, -1, 4])
+    tree_index = TreeDistanceIndex(parents, np.array([0, 1., 2, 3, 0, 5]))
+    ds = tree_index.distances([3, 2, 5, -1], [2, 3, 4])
+    assert np.array_equal(ds[:3], [[6, 0, np.inf], [0, 6, np.inf], [np.inf, np.inf, 5]])
+    assert np.all(np.isnan(ds[3]))
+
+
+def test_meshwork_distances(capsule_meshwork):
+    from scipy import sparse
+    nrn = capsule_meshwork
+    nrn.apply_mask(nrn.mesh.vertices[:, 2] > 0)
+    rng = np.random.default_rng(0)
+    source = nrn.MeshIndex(rng.integers(0, nrn.mesh.n_vertices, 20))
+    target = nrn.MeshIndex(rng.integers(0, nrn.mesh.n_vertices, 30))
+
+    sk_ds = sparse.csgraph.dijkstra(nrn.skeleton.csgraph, directed=False)
+    expected = sk_ds[np.ix_(source.to_skel_index_padded, target.to_skel_index_padded)]
+    assert np.allclose(nrn.distance_between(source, target), expected)
+    values = np.unique(expected)
+    max_distance = (values[len(values) // 2] + values[len(values) // 2 + 1]) / 2
+    bounded = nrn.distance_between(source, target, max_distance=max_distance)
+    assert np.array_equal(np.isinf(bounded), expected > max_distance)
+
+    mesh_ds = sparse.csgraph.dijkstra(nrn.mesh.csgraph, directed=False, indices=source)
+    assert np.allclose(nrn.distance_between(source, target, along_path=False), mesh_ds[:, target])
+
+    d = max_distance
+    mesh_to_skel = nrn.skeleton.mesh_to_skel_map[nrn.mesh.node_mask]
+    skinds = np.unique(source.to_skel_index)
+    assert np.array_equal(nrn.within_distance(source, d),
+                          np.flatnonzero(np.any(sk_ds[skinds] < d, axis=0)[mesh_to_skel]))
+    for skind, minds in zip(skinds, nrn.within_distance(source, d, collapse=False)):
+        assert np.array_equal(minds, np.flatnonzero((sk_ds[skind] < d)[mesh_to_skel]))
+    for skind, close in zip(skinds, nrn.within_distance(source, d, collapse=False, return_as_skel=True)):
+        assert np.array_equal(close, np.flatnonzero(sk_ds[skind] < d))
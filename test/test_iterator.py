@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import trimesh
+
+from meshparty import iterator, trimesh_io
+
+
+@pytest.fixture(scope='module')
+def sphere_mesh():
+    sphere = trimesh.creation.icosphere(subdivisions=3, radius=100)
+    yield trimesh_io.Mesh(sphere.vertices, sphere.faces, process=False)
+
+
+def _collect(it):
+    views, centers = [], []
+    for batch_views, batch_centers in it:
+        views.append(batch_views)
+        centers.append(batch_centers)
+    return views, np.concatenate(centers)
+
+
+@pytest.mark.parametrize("order", iterator.ORDERS)
+def test_local_view_iterator_coverage(sphere_mesh, order):
+    it = iterator.LocalViewIterator(sphere_mesh, n_points=30, batch_size=8,
+                                    order=order, seed=0)
+    views, centers = _collect(it)
+    assert it.n_active == 0
+    assert it.coverage == 1
+    assert all(v.shape[1:] == (30, 3) for v in views)
+    assert all(len(v) <= 8 for v in views)
+    assert len(np.unique(centers)) == len(centers)
+    if order == "sequential":
+        assert np.all(np.diff(centers.astype(int)) > 0)
+
+
+@pytest.mark.parametrize("prefetch", [0, 3])
+def test_local_view_iterator_seed(sphere_mesh, prefetch):
+    kwargs = dict(n_points=20, sample_n_points=40, fisheye=True,
+                  batch_size=16, seed=42)
+    views_a, centers_a = _collect(
+        iterator.LocalViewIterator(sphere_mesh, **kwargs))
+    it = iterator.LocalViewIterator(sphere_mesh, prefetch=prefetch, **kwargs)
+    views_b, centers_b = _collect(it)
+    it.close()
+    assert np.array_equal(centers_a, centers_b)
+    for view_a, view_b in zip(views_a, views_b):
+        assert np.array_equal(view_a, view_b)
@@ -0,0 +1,154 @@
+from meshparty import trimesh_io, ray_tracing
+from trimesh.ray import ray_triangle
+import numpy as np
+import trimesh
+import pytest
+
+
+@pytest.fixture(scope='module')
+def capsule_mesh():
+    capsule = trimesh.creation.capsule(height=20, radius=3, count=[16, 16])
+    yield trimesh_io.Mesh(capsule.vertices, capsule.faces)
+
+
+def test_shape_diameter_function_chunks(capsule_mesh):
+    ray_inter = ray_triangle.RayMeshIntersector(capsule_mesh)
+    mesh_inds = np.arange(0, len(capsule_mesh.vertices), 2)
+
+    rs = ray_tracing.shape_diameter_function(
+        mesh_inds, capsule_mesh, ray_inter=ray_inter)
+    chunked_rs = ray_tracing.shape_diameter_function(
+        mesh_inds, capsule_mesh, ray_inter=ray_inter, chunk_size=7)
+    assert rs.shape == (len(mesh_inds),)
+    assert np.allclose(rs, chunked_rs, equal_nan=True)
+
+    # the shape diameter of a capsule is about its diameter
+    assert np.abs(np.nanmedian(rs) - 6) < 2
+
+
+def test_all_angle_weighted_distances():
+    rng = np.random.default_rng(0)
+    n_groups = 50
+    groups = rng.integers(0, n_groups - 5, size=1000)
+    ds = rng.uniform(0, 10, size=1000)
+    angles = rng.uniform(0, np.pi, size=1000)
+    weights = 1 / angles
+
+    rs = ray_tracing.all_angle_weighted_distances(
+        ds, angles, weights, groups, np.arange(n_groups))
+    assert np.all(np.isnan(rs[n_groups - 5:]))
+    for group in range(n_groups):
+        is_group = groups == group
+        r = ray_tracing.angle_weighted_distance(
+            ds[is_group], angles[is_group], weights[is_group])
+        assert np.isclose(rs[group], r, equal_nan=True)
+
+    rs = ray_tracing.all_angle_weighted_distances(
+        np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0, dtype=int), [1, 2])
+    assert rs.shape == (2,) and np.all(np.isnan(rs))
+
+
+def test_bvh_ray_intersector(capsule_mesh):
+    rng = np.random.default_rng(0)
+    origins = rng.normal(scale=2, size=(500, 3))
+    directions = rng.normal(size=(500, 3))
+    # rays parallel to an axis
+    directions[:20, 1:] = 0
+
+    ray_inter = ray_tracing.get_ray_intersector(capsule_mesh, engine='bvh')
+    assert ray_inter is ray_tracing.get_ray_intersector(capsule_mesh, engine='bvh')
+    locs, rays, faces = ray_inter.intersects_location(origins, directions)
+
+    tri_inter = ray_tracing.get_ray_intersector(capsule_mesh, engine='triangle')
+    tri_locs, tri_rays, tri_faces = tri_inter.intersects_location(
+        origins, directions, multiple_hits=False)
+    order = np.argsort(tri_rays)
+    assert np.array_equal(rays, tri_rays[order])
+    assert np.array_equal(faces, tri_faces[order])
+    assert np.allclose(locs, tri_locs[order])
+
+    rs = ray_tracing.shape_diameter_function(
+        np.arange(10), capsule_mesh, ray_inter=ray_inter, n_threads=2, chunk_size=3)
+    assert np.allclose(rs, ray_tracing.shape_diameter_function(
+        np.arange(10), capsule_mesh, ray_inter=tri_inter), equal_nan=True)
+
+
+def test_ray_trace_distance(capsule_mesh):
+    mesh_inds = np.arange(len(capsule_mesh.vertices))
+    rs, stats = ray_tracing.ray_trace_distance(
+        mesh_inds, capsule_mesh, random_state=0, return_stats=True)
+    assert np.all(rs > 0)
+    assert len(stats) == 1 and stats[0]['hit_rate'] == 1
+
+    # rays escape through the holes and are retried
+    holed_mesh = trimesh_io.Mesh(capsule_mesh.vertices,
+                                 capsule_mesh.faces[np.arange(len(capsule_mesh.faces)) % 5 != 0])
+    for n_cone_rays in [0, 8]:
+        rs, stats = ray_tracing.ray_trace_distance(
+            mesh_inds, holed_mesh, max_iter=3, n_cone_rays=n_cone_rays,
+            random_state=0, return_stats=True)
+        for stat, next_stat in zip(stats[:-1], stats[1:]):
+            assert next_stat['n_vertices'] == stat['n_vertices'] - stat['n_hits']
+        assert np.sum(rs > 0) == sum(stat['n_hits'] for stat in stats)
+    assert stats[0]['iteration'] == -1
+    assert stats[0]['n_rays'] == 8 * len(mesh_inds)
+
+
+def test_vertex_radius_cache(capsule_mesh, tmpdir, monkeypatch):
+    mesh = trimesh_io.Mesh(capsule_mesh.vertices, capsule_mesh.faces)
+    rs = ray_tracing.vertex_radius([0, 1, 2, 1], mesh)
+    assert rs[1] == rs[3]
+    assert np.sum(mesh.vertex_radii['single'] != -1) == 3
+
+    # only vertices without a radius are ray traced
+    traced = []
+
+    def trace(vertex_inds, mesh):
+        traced.append(vertex_inds)
+        return np.ones(len(vertex_inds))
+    monkeypatch.setitem(ray_tracing.SHAPE_FUNCTIONS, 'single', trace)
+    rs_more = ray_tracing.vertex_radius([2, 3, 1], mesh)
+    assert len(traced) == 1 and np.array_equal(traced[0], [3])
+    assert np.array_equal(rs_more, [rs[2], 1, rs[1]])
+
+    filename = str(tmpdir.join('mesh.h5'))
+    mesh.write_to_file(filename)
+    mm = trimesh_io.MeshMeta()
+    loaded_mesh = mm.mesh(filename=filename)
+    assert np.array_equal(loaded_mesh.vertex_radii['single'],
+                          mesh.vertex_radii['single'])
+
+    ray_tracing.vertex_radius([4], loaded_mesh)
+    loaded_mesh.write_vertex_radii()
+    assert trimesh_io.read_mesh_h5_vertex_radii(filename)['single'][4] == 1
+
+    # radii follow isotropic scalings and are set aside for anisotropic ones
+    radii = loaded_mesh.vertex_radii['single'].copy()
+    loaded_mesh.voxel_scaling = [2, 2, 2]
+    assert np.array_equal(loaded_mesh.vertex_radii['single'],
+                          np.where(radii < 0, radii, 2 * radii))
+    loaded_mesh.voxel_scaling = [1, 2, 3]
+    assert len(loaded_mesh.vertex_radii) == 0
+    loaded_mesh.voxel_scaling = None
+    assert np.array_equal(loaded_mesh.vertex_radii['single'], radii)
+
+
+def test_vertex_radius_scaled_mesh(capsule_mesh, tmpdir):
+    mesh = trimesh_io.Mesh(capsule_mesh.vertices, capsule_mesh.faces,
+                           voxel_scaling=[2, 2, 2])
+    rs = ray_tracing.vertex_radius(np.arange(20), mesh)
+
+    # writing and linking temporarily removes the scaling
+    mesh.add_link_edges(merge_log={'merge_edge_coords': []},
+                        base_resolution=[1, 1, 1])
+    assert np.array_equal(mesh.vertex_radii['single'][:20], rs)
+
+    filename = str(tmpdir.join('mesh.h5'))
+    mesh.write_to_file(filename)
+    stored_radii = trimesh_io.read_mesh_h5_vertex_radii(filename)['single']
+    assert np.allclose(stored_radii[:20], rs / 2)
+
+    mm = trimesh_io.MeshMeta()
+    loaded_mesh = mm.mesh(filename=filename, voxel_scaling=[2, 2, 2])
+    assert np.allclose(loaded_mesh.vertex_radii['single'][:20], rs)
+    assert np.all(loaded_mesh.vertex_radii['single'][20:] == -1)
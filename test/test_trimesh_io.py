@@ -1,10 +1,13 @@
 import itertools
 import tempfile
 
+import networkx as nx
 import numpy
 import pytest
+import trimesh
+from sklearn import decomposition
 
-from meshparty import trimesh_io
+from meshparty import trimesh_io, utils
 
 from basic_test import build_basic_cube_mesh
 
@@ -101,3 +104,219 @@ def test_fix_mesh(basic_cube_mesh_fscope, basic_cube_mesh, wiggle):
         assert numpy.array_equal(
             basic_cube_mesh.vertices,
             basic_cube_mesh_fscope.vertices)
+
+
+@pytest.mark.parametrize("version,mmap", [
+    (trimesh_io.MESH_H5_GZIP_VERSION, False),
+    (trimesh_io.MESH_H5_RAW_VERSION, False),
+    (trimesh_io.MESH_H5_RAW_VERSION, True),
+    (trimesh_io.MESH_H5_BLOSC_VERSION, False)])
+def test_mesh_h5_versions(basic_mesh, tmpdir, version, mmap):
+    fname = str(tmpdir.join(f'mesh_v{version}.h5'))
+    basic_mesh.write_to_file(fname, version=version)
+
+    mvtx, mfaces, mnormals, mlink_edges, node_mask = trimesh_io.read_mesh(
+        fname, mmap=mmap)
+    if mmap:
+        assert isinstance(mvtx, numpy.memmap)
+    assert numpy.array_equal(mvtx, basic_mesh.vertices)
+    assert numpy.array_equal(mfaces, basic_mesh.faces)
+    assert numpy.array_equal(mnormals, basic_mesh.face_normals)
+    assert numpy.array_equal(node_mask, basic_mesh.node_mask)
+    assert mlink_edges.shape == (0, 2)
+
+    mesh = trimesh_io.Mesh(mvtx, mfaces, node_mask=node_mask)
+    assert numpy.array_equal(mesh.vertices, basic_mesh.vertices)
+
+
+def test_mesh_h5_saved_graph(basic_mesh, tmpdir, mocker):
+    fname = str(tmpdir.join('mesh_graph.h5'))
+    basic_mesh.write_to_file(fname, save_graph=True,
+                             version=trimesh_io.MESH_H5_RAW_VERSION)
+
+    csgraph, component_labels = trimesh_io.read_mesh_h5_graph(fname)
+    assert (csgraph != basic_mesh.csgraph).nnz == 0
+    assert numpy.array_equal(component_labels, basic_mesh.component_labels)
+
+    mm = trimesh_io.MeshMeta(cache_size=0)
+    mesh = mm.mesh(filename=fname)
+    mocked_f = mocker.patch("meshparty.utils.create_csgraph")
+    assert (mesh.csgraph != basic_mesh.csgraph).nnz == 0
+    assert mesh.n_components == 1
+    mocked_f.assert_not_called()
+
+    # changing the graph falls back to recomputing it
+    mesh.link_edges = [[0, 4]]
+    mesh.csgraph
+    mocked_f.assert_called_once()
+
+
+def test_read_meshes_h5_draco(basic_mesh, tmpdir):
+    fnames = []
+    for ii, draco in enumerate([True, False]):
+        fname = str(tmpdir.join(f'mesh_{ii}.h5'))
+        basic_mesh.write_to_file(fname, draco=draco)
+        fnames.append(fname)
+
+    mesh_datas = trimesh_io.read_meshes_h5(fnames, n_threads=2)
+    assert len(mesh_datas) == 2
+    for vertices, faces, _, _, _ in mesh_datas:
+        assert vertices.shape == basic_mesh.vertices.shape
+        assert faces.shape == basic_mesh.faces.shape
+    draco_vertices, draco_faces = mesh_datas[0][:2]
+    assert draco_vertices.dtype == numpy.float32
+    assert draco_faces.dtype == numpy.uint32
+    assert numpy.allclose(draco_vertices[draco_faces],
+                          basic_mesh.vertices[basic_mesh.faces], atol=1e-3)
+
+
+def test_read_mesh_h5_blosc_threads(basic_mesh, tmpdir):
+    fname = str(tmpdir.join('mesh.h5'))
+    basic_mesh.write_to_file(fname, version=trimesh_io.MESH_H5_BLOSC_VERSION)
+
+    # the process wide blosc setting is restored after reading
+    blosc = trimesh_io.blosc
+    previous_n_threads = blosc.set_nthreads(3)
+    vertices = trimesh_io.read_mesh_h5(fname, n_threads=2)[0]
+    assert numpy.array_equal(vertices, basic_mesh.vertices)
+    assert blosc.set_nthreads(previous_n_threads) == 3
+
+
+def test_merge_large_components():
+    spheres = [trimesh.creation.icosphere(subdivisions=2, radius=10)
+               for _ in range(3)]
+    offsets = [[0, 0, 0], [25.5, 0, 0], [200, 0, 0]]
+    vertices = numpy.vstack([s.vertices + o for s, o in zip(spheres, offsets)])
+    n_sphere = len(spheres[0].vertices)
+    faces = numpy.vstack([s.faces + i * n_sphere
+                          for i, s in enumerate(spheres)])
+    mesh = trimesh_io.Mesh(vertices, faces, process=False)
+    assert mesh.n_components == 3
+
+    stats = mesh.merge_large_components(size_threshold=10, max_dist=10,
+                                        dist_step=2)
+    assert stats['n_large_components'] == 3
+    assert stats['n_component_pairs'] == 1
+    assert mesh.n_components == 2
+
+    # brute force the links between the two close spheres
+    ds = numpy.linalg.norm(vertices[:n_sphere, None] -
+                           vertices[None, n_sphere:2 * n_sphere], axis=2)
+    step = numpy.ceil(ds.min() / 2) * 2
+    a, b = numpy.where(ds <= step)
+    expected = set(zip(a, b + n_sphere))
+    assert set(map(tuple, mesh.link_edges)) == expected
+    assert stats['n_new_edges'] == len(expected)
+
+
+def test_nxgraph_view(basic_cube_mesh):
+    m = basic_cube_mesh
+    G = m.nxgraph
+    view = m.nxgraph_view
+    assert view.number_of_nodes() == G.number_of_nodes()
+    assert view.number_of_edges() == G.number_of_edges()
+    for u, v, w in G.edges(data='weight'):
+        assert numpy.isclose(view[u][v]['weight'], w)
+    assert nx.shortest_path_length(view, 0, 6, weight='weight') == \
+        pytest.approx(nx.shortest_path_length(G, 0, 6, weight='weight'))
+    with pytest.raises(nx.NetworkXError):
+        view.add_edge(0, 6)
+
+    G2 = utils.csgraph_to_nxgraph(m.csgraph)
+    assert set(map(frozenset, G2.edges)) == set(map(frozenset, G.edges))
+
+
+@pytest.mark.parametrize("fisheye", [True, False])
+def test_get_local_views(fisheye):
+    sphere = trimesh.creation.icosphere(subdivisions=3, radius=100)
+    mesh = trimesh_io.Mesh(sphere.vertices, sphere.faces, process=False)
+
+    center_node_ids = numpy.arange(0, mesh.n_vertices, 50)
+    local_vertices, _, node_ids = mesh.get_local_views(
+        n_points=20, sample_n_points=40, fisheye=fisheye,
+        center_node_ids=center_node_ids, return_node_ids=True)
+    assert local_vertices.shape == (len(center_node_ids), 20, 3)
+    for ns in node_ids:
+        assert len(numpy.unique(ns)) == 20
+
+    aligned = mesh.get_local_views(
+        n_points=20, center_node_ids=center_node_ids, pc_align=True)[0]
+    views = mesh.get_local_views(
+        n_points=20, center_node_ids=center_node_ids)[0]
+    for view, view_aligned in zip(views, aligned):
+        expected = decomposition.PCA(n_components=3).fit_transform(view)
+        assert numpy.allclose(numpy.abs(view_aligned), numpy.abs(expected),
+                              atol=1e-6)
+
+
+def test_get_local_meshes_packed():
+    sphere = trimesh.creation.icosphere(subdivisions=3, radius=100)
+    mesh = trimesh_io.Mesh(sphere.vertices, sphere.faces, process=False)
+    center_node_ids = [0, 10, 100]
+
+    meshes = mesh.get_local_meshes(50, center_node_ids=center_node_ids)
+    vertices, vertex_offsets, faces, face_offsets = mesh.get_local_meshes(
+        50, center_node_ids=center_node_ids, return_packed=True)
+    assert len(meshes) == len(vertex_offsets) - 1 == len(face_offsets) - 1
+    for i, local_mesh in enumerate(meshes):
+        local_vertices = vertices[vertex_offsets[i]:vertex_offsets[i + 1]]
+        local_faces = faces[face_offsets[i]:face_offsets[i + 1]]
+        assert numpy.array_equal(local_mesh.vertices, local_vertices)
+        assert numpy.array_equal(local_mesh.faces, local_faces)
+        assert len(local_faces) > 0
+
+        # every face of the full mesh within the view is kept
+        node_ids = mesh.kdtree.query(local_vertices)[1]
+        in_view = numpy.all(numpy.isin(mesh.faces, node_ids), axis=1)
+        assert in_view.sum() == len(local_faces)
+        assert numpy.array_equal(node_ids[local_faces], mesh.faces[in_view])
+
+
+def test_append_link_edges(mocker):
+    spheres = [trimesh.creation.icosphere(subdivisions=1) for _ in range(3)]
+    n_sphere = len(spheres[0].vertices)
+    vertices = numpy.vstack([s.vertices + [3 * i, 0, 0]
+                             for i, s in enumerate(spheres)])
+    faces = numpy.vstack([s.faces + i * n_sphere
+                          for i, s in enumerate(spheres)])
+    mesh = trimesh_io.Mesh(vertices, faces, process=False)
+    mesh.nxgraph, mesh.graph_edges
+    assert mesh.n_components == 3
+    kdtree = mesh.kdtree
+    mesh_copy = mesh.shallow_copy()
+
+    new_edges = [[0, 2 * n_sphere + 1], [0, 1]]
+    mocked_f = mocker.patch("meshparty.utils.create_nxgraph")
+    mesh.append_link_edges(new_edges)
+    mocked_f.assert_not_called()
+    assert mesh.kdtree is kdtree
+    mocker.stopall()
+
+    # the graphs of a shallow copy are not extended along
+    assert mesh_copy.kdtree is kdtree
+    assert mesh_copy.n_components == 3
+    assert not mesh_copy.nxgraph.has_edge(0, 2 * n_sphere + 1)
+
+    rebuilt = trimesh_io.Mesh(vertices, faces, process=False,
+                              link_edges=new_edges)
+    assert numpy.array_equal(mesh.link_edges, rebuilt.link_edges)
+    assert numpy.array_equal(mesh.graph_edges, rebuilt.graph_edges)
+    assert abs(mesh.csgraph - rebuilt.csgraph).max() < 1e-6
+    assert numpy.array_equal(mesh.component_labels, rebuilt.component_labels)
+    assert mesh.n_components == 2
+    assert mesh.nxgraph.has_edge(0, 2 * n_sphere + 1)
+
+
+def test_csgraph_unique_edges(basic_mesh):
+    mesh = trimesh_io.Mesh(basic_mesh.vertices, basic_mesh.faces,
+                           link_edges=[[0, 4], [4, 0], [0, 1]])
+    csgraph = mesh.csgraph
+    assert csgraph.dtype == numpy.float32
+    assert csgraph.indices.dtype == numpy.int32
+    assert (csgraph != csgraph.T).nnz == 0
+    assert csgraph.nnz == 2 * len(mesh.unique_graph_edges)
+
+    # face edges shared by faces and repeated link edges count once
+    u, v = mesh.unique_graph_edges.T
+    lengths = numpy.linalg.norm(mesh.vertices[u] - mesh.vertices[v], axis=1)
+    assert numpy.allclose(numpy.asarray(csgraph[u, v]).ravel(), lengths)